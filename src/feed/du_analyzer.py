@@ -1,24 +1,34 @@
 #!/usr/bin/env python3
 
 import argparse
-import sys
+import concurrent.futures
+import csv
 import datetime
+import json
+import os
+import pathlib
+import sys
 
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 import numpy as np
 
 # only needed when running this binary
-from time_series_serializer import TimeSeriesSerializer
+from time_series_storage import get_time_series_serializer
 from du_response_parser import SaleRecord
+import rolling_analytics
 import sys
 # hack for import
 sys.path.append("../strategy/")
-from fx_rate import FxRate
+from fx_rate import FxRate, get_fx_source
 
 """
 Provides analytics (price history, volume, vol) based on given transactions.
 Built-in binary takes stored time series. Import in feed (gets) for live data processing.
+
+In batch mode the binary analyzes every pair of a style list (the merged csv,
+or any csv with a style_id and optionally a size column) across a process
+pool, writing one stats table and optionally one plot png per pair.
 """
 
 class ItemAnalyzer:
@@ -33,10 +43,10 @@ class ItemAnalyzer:
             result.append(SaleRecord("", t["price"], t["time"]))
         return result
 
-    def plot_historical_transactions(self, transactions, plot_title=None, save_png=None):
+    def plot_historical_transactions(self, transactions, plot_title=None, save_png=None, show=True):
         """
         Given ordered transactions (earliest to latest), plot transaction prices on a monthly scale.
-        Optionally title and save the plot.
+        Optionally title and save the plot, and don't show (but close) it.
         """
         x = np.array([datetime.datetime.strptime(t.time, "%Y-%m-%dT%H:%M:%S.%fZ") for t in transactions])
         y = np.array([(t.price / 100) for t in transactions])
@@ -72,11 +82,18 @@ class ItemAnalyzer:
                 plt.savefig(save_png)
                 print("historical transaction figure saved to {}".format(save_png))
 
-            plt.show()            
+            if show:
+                plt.show()
+            else:
+                plt.close(fig)
         else:
             print("no historical transactions found for {} {}".format(args.style_id, args.plot_size))
     
-    def get_historical_transactions_stats(self, transactions, furthest_back=None):
+    def get_historical_transactions_stats(self, transactions, furthest_back=None, fx_rate=None):
+        """
+        @param fx_rate  FxRate (optional) if given, USD stats are added with each
+            transaction converted at the CNY / USD rate of its own date
+        """
         dates = [datetime.datetime.strptime(t.time, "%Y-%m-%dT%H:%M:%S.%fZ") for t in transactions]
         prices = [(t.price / 100) for t in transactions]
 
@@ -100,7 +117,7 @@ class ItemAnalyzer:
         stdev = np.std(prices_np)
         avg = np.average(prices_np)
 
-        return {
+        stats = {
             "num_sales": len(prices),
             "elapsed_days": elapsed_days,
             "sales_per_day": sales_per_day,
@@ -115,6 +132,189 @@ class ItemAnalyzer:
             "avg": avg,
             "stdev": stdev,
         }
+        if fx_rate:
+            prices_usd = [
+                fx_rate.get_historical_fx(p, "CNY", "USD", d)
+                for p, d in zip(prices, dates)
+            ]
+            stats["high_usd"] = max(prices_usd)
+            stats["low_usd"] = min(prices_usd)
+            stats["first_usd"] = prices_usd[0]
+            stats["last_usd"] = prices_usd[-1]
+            stats["avg_usd"] = np.average(np.array(prices_usd))
+        return stats
+
+    @staticmethod
+    def get_rolling_transactions_stats(
+        transactions_list,
+        now=None,
+        windows_days=rolling_analytics.DEFAULT_WINDOWS_DAYS,
+        ewma_halflife_days=rolling_analytics.DEFAULT_EWMA_HALFLIFE_DAYS,
+    ):
+        """
+        Rolling volume, volatility, EWMA price, drawdown and time since last sale
+        of many pairs in one batch, see rolling_analytics.
+
+        @param transactions_list  list of stored du transactions (latest first),
+            one per pair
+        @return list of {stat name: float}, one per pair
+        """
+        return rolling_analytics.get_stats(
+            transactions_list,
+            now,
+            windows_days=windows_days,
+            ewma_halflife_days=ewma_halflife_days,
+        )
+
+
+_batch_worker = None
+
+
+class BatchWorker:
+    def __init__(self, storage, data_folder, fx_rate, modes, plot_folder, windows_days, ewma_halflife_days):
+        self.serializer = get_time_series_serializer(storage, data_folder)
+        self.analyzer = ItemAnalyzer()
+        self.fx_rate = fx_rate
+        self.modes = modes
+        self.plot_folder = plot_folder
+        self.windows_days = windows_days
+        self.ewma_halflife_days = ewma_halflife_days
+        if "plot" in modes:
+            # render only, no display in batch
+            plt.switch_backend("Agg")
+        return
+
+    def analyze_style(self, style_id, sizes=None):
+        """
+        @param sizes  list of sizes to analyze, all stored ones if None
+        @return list of stats rows, one per pair
+        """
+        try:
+            size_prices = self.serializer.get(style_id)
+        except FileNotFoundError:
+            print("no time series found for {}".format(style_id))
+            return []
+        sizes = [s for s in (sizes if sizes else sorted(size_prices)) if s in size_prices]
+        du_transactions_list = [
+            size_prices[size].get("du", {}).get("transactions", []) for size in sizes
+        ]
+        rolling_stats = []
+        if "stats" in self.modes:
+            rolling_stats = self.analyzer.get_rolling_transactions_stats(
+                du_transactions_list,
+                windows_days=self.windows_days,
+                ewma_halflife_days=self.ewma_halflife_days,
+            )
+
+        rows = []
+        for i, size in enumerate(sizes):
+            row = {"style_id": style_id, "size": size, "num_sales": 0}
+            if len(du_transactions_list[i]) > 0:
+                transactions = ItemAnalyzer.to_ordered_sale_record(du_transactions_list[i])
+                if "stats" in self.modes:
+                    stats = self.analyzer.get_historical_transactions_stats(
+                        transactions, fx_rate=self.fx_rate
+                    )
+                    stats["first_date"] = stats["first_date"].isoformat()
+                    stats["last_date"] = stats["last_date"].isoformat()
+                    row.update(stats)
+                    row.update(rolling_stats[i])
+                if "plot" in self.modes:
+                    self.analyzer.plot_historical_transactions(
+                        transactions,
+                        plot_title="{} {}".format(style_id, size),
+                        save_png=os.path.join(
+                            self.plot_folder, "{}_{}.png".format(style_id, size)
+                        ),
+                        show=False,
+                    )
+            rows.append(row)
+        return rows
+
+
+def _init_batch_worker(*args):
+    global _batch_worker
+    _batch_worker = BatchWorker(*args)
+
+
+def _analyze_styles(style_sizes):
+    rows = []
+    for style_id, sizes in style_sizes:
+        rows += _batch_worker.analyze_style(style_id, sizes)
+    return rows
+
+
+def load_batch(batch_file):
+    """
+    @param batch_file  csv with a style_id column and optionally a size column
+    @return [(style_id, [size, ...] or None for all sizes)] in file order
+    """
+    style_sizes = {}
+    with open(batch_file, "r") as infile:
+        for row in csv.DictReader(infile):
+            style_id = row["style_id"]
+            size = row.get("size")
+            if not size:
+                style_sizes[style_id] = None
+            elif style_sizes.get(style_id, []) is not None:
+                style_sizes.setdefault(style_id, []).append(size)
+    return list(style_sizes.items())
+
+
+def write_table(rows, out_file):
+    """
+    Write stats rows as a json list if out_file ends with .json, csv otherwise.
+    """
+    pathlib.Path(os.path.dirname(out_file) or ".").mkdir(parents=True, exist_ok=True)
+    with open(out_file, "w") as outfile:
+        if out_file.endswith(".json"):
+            # nan (e.g. volatility of too few sales) isn't valid json
+            rows = [
+                {k: None if isinstance(v, float) and np.isnan(v) else v for k, v in row.items()}
+                for row in rows
+            ]
+            outfile.write(json.dumps(rows, indent=2))
+        else:
+            fieldnames = list(dict.fromkeys(k for row in rows for k in row))
+            writer = csv.DictWriter(outfile, fieldnames=fieldnames, lineterminator="\n")
+            writer.writeheader()
+            writer.writerows(rows)
+    print("{} rows written to {}".format(len(rows), out_file))
+    return
+
+
+def analyze_batch(style_sizes, modes, args, workers=1, chunk_size=16):
+    fx_rate = None
+    if "stats" in modes:
+        fx_rate = FxRate(get_fx_source(args.fx_source))
+        # fetched once here, workers get a copy with a fresh rate
+        fx_rate.get_spot_fx(1, "CNY", "USD")
+    if "plot" in modes:
+        pathlib.Path(args.plot_folder).mkdir(parents=True, exist_ok=True)
+    initargs = (
+        args.storage,
+        args.data_folder,
+        fx_rate,
+        modes,
+        args.plot_folder,
+        [int(w) for w in args.windows_days.split(",")],
+        args.ewma_halflife_days,
+    )
+
+    rows = []
+    if workers > 1:
+        chunks = [
+            style_sizes[i : i + chunk_size] for i in range(0, len(style_sizes), chunk_size)
+        ]
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_batch_worker, initargs=initargs
+        ) as executor:
+            for chunk_rows in executor.map(_analyze_styles, chunks):
+                rows += chunk_rows
+    else:
+        _init_batch_worker(*initargs)
+        rows = _analyze_styles(style_sizes)
+    return rows
 
 
 def parse_args():
@@ -124,6 +324,8 @@ def parse_args():
 
         example usage:
             ./du_analyzer.py --style_id BQ6623-800 --size 9.5 --mode plot
+            ./du_analyzer.py --batch ../../resources/merged.20191225.csv --mode stats,plot \\
+                --workers 4 --out ../data/du_stats.csv --plot_folder ../data/plots
     """
     )
     parser.add_argument(
@@ -138,19 +340,74 @@ def parse_args():
         "--size",
         help="the size to analyze",
     )
+    parser.add_argument(
+        "--storage",
+        default="json",
+        help="[json|log|sqlite] how time series readings are stored",
+    )
+    parser.add_argument(
+        "--fx_source",
+        default="http",
+        help="[http|file:{path}] where spot fx rates come from when the cached ones expired",
+    )
+    parser.add_argument(
+        "--windows_days",
+        default=",".join(str(w) for w in rolling_analytics.DEFAULT_WINDOWS_DAYS),
+        help="comma separated rolling windows in days for stats mode",
+    )
+    parser.add_argument(
+        "--ewma_halflife_days",
+        default=rolling_analytics.DEFAULT_EWMA_HALFLIFE_DAYS,
+        type=float,
+        help="half life in days of the EWMA price weights in stats mode",
+    )
+    parser.add_argument(
+        "--batch",
+        help="csv with a style_id and optionally a size column (e.g. the merged csv) to analyze every pair of, instead of --style_id / --size",
+    )
+    parser.add_argument(
+        "--workers",
+        default=1,
+        type=int,
+        help="number of processes analyzing a batch",
+    )
+    parser.add_argument(
+        "--out",
+        default="du_stats.csv",
+        help="batch stats table to write, json if it ends with .json, csv otherwise",
+    )
+    parser.add_argument(
+        "--plot_folder",
+        default="plots",
+        help="where batch plot mode saves one png per pair",
+    )
+    parser.add_argument(
+        "--data_folder",
+        default=None,
+        help="folder of stored time series, defaults to ../data",
+    )
     args = parser.parse_args()
+    if not args.mode:
+        parser.print_help(sys.stderr)
+        raise RuntimeError("args.mode is required in analysis")
+    if args.batch:
+        return args
     if not args.style_id:
         parser.print_help(sys.stderr)
         raise RuntimeError("args.style_id is required in analysis")
     if not args.size:
         parser.print_help(sys.stderr)
         raise RuntimeError("args.size is required in analysis")
-    if not args.mode:
-        parser.print_help(sys.stderr)
-        raise RuntimeError("args.mode is required in analysis")
     return args
 
 
+def get_usd(stats, name, fx_rate):
+    # at the transactions' own dates when the stats have them
+    if name + "_usd" in stats:
+        return stats[name + "_usd"]
+    return fx_rate.get_spot_fx(stats[name], "CNY", "USD")
+
+
 def serialize_stats(stats, fx_rate):
     serialized = """
         First Date:       {}
@@ -168,20 +425,37 @@ def serialize_stats(stats, fx_rate):
         stats["last_date"].isoformat(),
         stats["num_sales"],
         stats["sales_per_day"],
-        stats["high"], fx_rate.get_spot_fx(stats["high"], "CNY", "USD"),
-        stats["low"], fx_rate.get_spot_fx(stats["low"], "CNY", "USD"),
-        stats["first"], fx_rate.get_spot_fx(stats["first"], "CNY", "USD"),
-        stats["last"], fx_rate.get_spot_fx(stats["last"], "CNY", "USD"),
-        stats["avg"], fx_rate.get_spot_fx(stats["avg"], "CNY", "USD"),
+        stats["high"], get_usd(stats, "high", fx_rate),
+        stats["low"], get_usd(stats, "low", fx_rate),
+        stats["first"], get_usd(stats, "first", fx_rate),
+        stats["last"], get_usd(stats, "last", fx_rate),
+        stats["avg"], get_usd(stats, "avg", fx_rate),
         stats["stdev"])
     return serialized
 
 
+def serialize_rolling_stats(stats):
+    serialized = ""
+    for name, value in stats.items():
+        serialized += "        {:<26}{:.4f}\n".format(name + ":", value)
+    return serialized
+
+
 if __name__ == "__main__":
     args = parse_args()
     analyzer = ItemAnalyzer()
 
-    serializer = TimeSeriesSerializer()
+    if args.batch:
+        modes = args.mode.split(',')
+        for mode in modes:
+            if mode not in ["plot", "stats"]:
+                raise RuntimeError("unrecognized mode {}".format(mode))
+        rows = analyze_batch(load_batch(args.batch), modes, args, args.workers)
+        if "stats" in modes:
+            write_table(rows, args.out)
+        exit(0)
+
+    serializer = get_time_series_serializer(args.storage, args.data_folder)
     data = serializer.get(args.style_id, args.size)
     du_transactions = data[args.size]["du"]["transactions"]
     if len(du_transactions) == 0:
@@ -195,8 +469,14 @@ if __name__ == "__main__":
         if mode == "plot":
             analyzer.plot_historical_transactions(transactions)
         elif mode == "stats":
-            stats = analyzer.get_historical_transactions_stats(transactions)
-            fx_rate = FxRate()
+            fx_rate = FxRate(get_fx_source(args.fx_source))
+            stats = analyzer.get_historical_transactions_stats(transactions, fx_rate=fx_rate)
             print(serialize_stats(stats, fx_rate))
+            rolling_stats = analyzer.get_rolling_transactions_stats(
+                [du_transactions],
+                windows_days=[int(w) for w in args.windows_days.split(",")],
+                ewma_halflife_days=args.ewma_halflife_days,
+            )[0]
+            print(serialize_rolling_stats(rolling_stats))
         else:
             raise RuntimeError("unrecognized mode {}".format(mode))
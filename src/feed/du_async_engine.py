@@ -0,0 +1,60 @@
+import asyncio
+import concurrent.futures
+import functools
+
+"""
+Concurrent engine for du feed update mode.
+
+Network work of each product (product detail and recentSoldList pages) runs on a
+pool of worker threads while the event loop schedules products and bounds the
+number in flight. Results are handed back to the event loop thread one at a
+time, so serializers are never written to concurrently.
+"""
+
+
+class AsyncUpdateEngine:
+    def __init__(self, max_in_flight=8):
+        """
+        @param max_in_flight  int the most number of products being fetched at
+            the same time
+        """
+        self.max_in_flight = int(max_in_flight)
+        return
+
+    def run(self, jobs, fetch, on_result, on_error):
+        """
+        Fetch all jobs concurrently.
+
+        @param jobs       list of job keys (e.g. du product_id)
+        @param fetch      callable(job) doing blocking network work, its return
+            value is passed to on_result. Runs on a worker thread
+        @param on_result  callable(job, result) run on the event loop thread
+        @param on_error   callable(job, exception) run on the event loop thread
+            when fetch raises. Exceptions not handled here abort the run
+        """
+        asyncio.run(self._run(jobs, fetch, on_result, on_error))
+        return
+
+    async def _run(self, jobs, fetch, on_result, on_error):
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+        executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.max_in_flight
+        )
+
+        async def run_one(job):
+            async with semaphore:
+                try:
+                    result = await loop.run_in_executor(
+                        executor, functools.partial(fetch, job)
+                    )
+                except Exception as e:
+                    on_error(job, e)
+                    return
+                on_result(job, result)
+
+        try:
+            await asyncio.gather(*[run_one(job) for job in jobs])
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        return
@@ -1,9 +1,10 @@
 #!/usr/bin/env python3
 
 import os
+import copy
 import json
-import requests
 import datetime
+import multiprocessing
 
 import pprint
 import csv
@@ -13,28 +14,59 @@ import pprint
 from du_url_builder import DuRequestBuilder
 from du_response_parser import DuParser, SaleRecord, DuItem
 from last_updated import LastUpdatedSerializer
-from time_series_serializer import TimeSeriesSerializer
+from time_series_storage import get_time_series_serializer
 from static_info_serializer import StaticInfoSerializer
 from sizer import Sizer, SizerError
 from du_analyzer import ItemAnalyzer
+from du_async_engine import AsyncUpdateEngine
+from du_transport import DuTransport
+from rate_limiter import HostRateLimiter
+from transaction_watermark import TransactionWatermarkSerializer
+from update_scheduler import UpdateScheduler, load_profit_ratios
+from run_metrics import RunMetrics, DISABLED
+from work_queue import WorkQueue, get_owner
+from query_checkpoint import QueryCheckpoint
+from update_shards import (
+    get_leftover_shards,
+    get_shard,
+    get_shard_path,
+    merge_last_updated,
+    merge_watermarks,
+    split_last_updated,
+    split_watermarks,
+)
 
 class DuFeed:
-    def __init__(self):
+    def __init__(self, transport=None, base_url=None, metrics=None):
+        """
+        @param base_url  str (optional) Du API base url, see DuRequestBuilder
+        @param metrics  RunMetrics (optional) timing sign / fetch / parse stages,
+            pass the same one to the transport for its request metrics
+        """
+        self.metrics = metrics if metrics else DISABLED
         self.sizer = Sizer()
         self.parser = DuParser(self.sizer)
-        self.builder = DuRequestBuilder()
+        self.builder = DuRequestBuilder(base_url=base_url, metrics=self.metrics)
+        self.transport = (
+            transport
+            if transport
+            else DuTransport(DuRequestBuilder.du_headers, metrics=self.metrics)
+        )
 
-    def _send_du_request(self, url):
-        if __debug__:
-            print("request {}".format(url))
-        return requests.get(url=url, headers=DuRequestBuilder.du_headers)
+    def _send_du_request(self, url, stage="fetch"):
+        with self.metrics.stage(stage):
+            return self.transport.get(url)
 
-    def search_pages(self, keyword, pages=0, result_items=None):
+    def search_pages(self, keyword, pages=0, result_items=None, checkpoint=None):
+        """
+        @param checkpoint  QueryCheckpoint (optional) skip the pages it has
+            completed, record detailed items and completed pages in it
+        """
         print("querying keyword {}".format(keyword))
         max_page = pages
         if max_page == 0:
             request_url = self.builder.get_search_by_keywords_url(keyword, 0, 1, 0)
-            search_response = self._send_du_request(request_url)
+            search_response = self._send_du_request(request_url, "fetch_search")
             total_num = json.loads(search_response.text)["data"]["total"]
             max_page = total_num / 20 + 1
 
@@ -48,10 +80,14 @@ class DuFeed:
         if not result_items:
             result_items = {}
         for i in range(max_page):
+            if checkpoint and checkpoint.is_page_completed(keyword, i):
+                print("page {} of keyword {} is already queried".format(i, keyword))
+                continue
             try:
                 request_url = self.builder.get_search_by_keywords_url(keyword, i, 1, 0)
-                search_response = self._send_du_request(request_url)
-                items = self.parser.parse_search_results(search_response.text)
+                search_response = self._send_du_request(request_url, "fetch_search")
+                with self.metrics.stage("parse"):
+                    items = self.parser.parse_search_results(search_response.text)
                 for j in items:
                     if j.product_id in result_items:
                         print(
@@ -62,6 +98,10 @@ class DuFeed:
                         continue
                     self._populate_item_details(j, j.product_id)
                     result_items[j.product_id] = j
+                    if checkpoint:
+                        checkpoint.add_item(j)
+                if checkpoint:
+                    checkpoint.complete_page(keyword, i)
             except json.decoder.JSONDecodeError as e:
                 handle_search_error(search_response, e)
             except RuntimeError as e:
@@ -78,16 +118,17 @@ class DuFeed:
 
     def _populate_item_details(self, in_item, product_id):
         request_url = self.builder.get_product_detail_url(product_id)
-        product_detail_response = self._send_du_request(request_url)
+        product_detail_response = self._send_du_request(request_url, "fetch_detail")
         print("querying details for {} {}".format(product_id, in_item))
-        (
-            style_id,
-            size_prices,
-            release_date,
-            gender,
-        ) = self.parser.parse_product_detail_response(
-            product_detail_response.text, self.sizer
-        )
+        with self.metrics.stage("parse"):
+            (
+                style_id,
+                size_prices,
+                release_date,
+                gender,
+            ) = self.parser.parse_product_detail_response(
+                product_detail_response.text, self.sizer
+            )
         print("inferred gender: {}".format(gender))
         in_item.populate_details(style_id, size_prices, release_date, gender)
         return
@@ -97,19 +138,25 @@ class DuFeed:
             # TODO: we don't actually use loaded static_info's gender in update, do we?
             # ^this is arguably better?
             request_url = self.builder.get_product_detail_url(product_id)
-            product_detail_response = self._send_du_request(request_url)
-            _, size_prices, _, gender = self.parser.parse_product_detail_response(
-                product_detail_response.text, self.sizer
+            product_detail_response = self._send_du_request(
+                request_url, "fetch_detail"
             )
+            with self.metrics.stage("parse"):
+                _, size_prices, _, gender = self.parser.parse_product_detail_response(
+                    product_detail_response.text, self.sizer
+                )
             return size_prices, gender
         except RuntimeError as e:
             print("get_detail runtime error {}".format(e))
+            self.metrics.count("error_detail_RuntimeError")
             return None
         except json.decoder.JSONDecodeError as e:
             print("get_detail unexpected response {}".format(e))
+            self.metrics.count("error_detail_JSONDecodeError")
             return None
         except KeyError as e:
             print("get_detail key error {}".format(e))
+            self.metrics.count("error_detail_KeyError")
             return None
 
     def get_details_from_product_id_raw(self, product_id):
@@ -125,30 +172,63 @@ class DuFeed:
         for t in transactions:
             if t.size not in result:
                 result[t.size] = []
-            else:
-                result[t.size].append({"price": t.price, "time": t.time, "id": t.id})
+            result[t.size].append({"price": t.price, "time": t.time, "id": t.id})
         return result
 
     def get_historical_transactions(
-        self, product_id, in_code, max_page=0, up_to_time=None, up_to_id=None
+        self,
+        product_id,
+        in_code,
+        max_page=0,
+        up_to_time=None,
+        up_to_id=None,
+        fetch_info=None,
     ):
+        """
+        Page through recent sales, latest first, until max_page, up_to_time or
+        up_to_id is reached.
+
+        @param up_to_id    str (optional) id of a sale we already have. Paging
+            stops on the page containing it, and it and older sales are not
+            returned
+        @param fetch_info  dict (optional) filled with "pages" fetched,
+            "newest_id" and "cursor" (the lastId after the first page), and
+            "reached_up_to_id"
+        """
+
         def get_one_page(page, product_id, in_code):
             recentsales_list_url = self.builder.get_recentsales_list_url(
                 page, product_id
             )
-            recentsales_list_response = requests.get(
-                url=recentsales_list_url, headers=DuRequestBuilder.du_headers
-            )
-            return self.parser.parse_recent_sales(
-                recentsales_list_response.text, in_code
+            recentsales_list_response = self._send_du_request(
+                recentsales_list_url, "fetch_transactions"
             )
+            with self.metrics.stage("parse"):
+                return self.parser.parse_recent_sales(
+                    recentsales_list_response.text, in_code
+                )
 
+        if fetch_info is None:
+            fetch_info = {}
+        fetch_info.update(
+            {"pages": 0, "newest_id": None, "cursor": None, "reached_up_to_id": False}
+        )
         all_sales = []
         page_idx = 0
         while max_page >= 0:
             page_idx, sales = get_one_page(page_idx, product_id, in_code)
+            fetch_info["pages"] += 1
+            if fetch_info["pages"] == 1:
+                fetch_info["cursor"] = page_idx
+                if len(sales) > 0:
+                    fetch_info["newest_id"] = sales[0].id
             if len(sales) == 0:
                 return all_sales
+            if up_to_id:
+                for idx, sale in enumerate(sales):
+                    if sale.id == up_to_id:
+                        fetch_info["reached_up_to_id"] = True
+                        return all_sales + sales[:idx]
             all_sales += sales
             if (
                 up_to_time
@@ -156,23 +236,26 @@ class DuFeed:
                 < up_to_time
             ):
                 return all_sales
-            if up_to_id:
-                for sale in all_sales[::-1]:
-                    if sale.id == up_to_id:
-                        return all_sales
             max_page -= 1
         return all_sales
 
 
-def parse_args():
+def parse_args(argv=None):
     parser = argparse.ArgumentParser(
         """
         entry point for du feed.
 
         example usage:
           ./du_feed.py --mode update --start_from du.mapping.20191206-211125.csv --min_interval_seconds 3600 --transaction_history_date 20190801 --transaction_history_maxpage 20
+          ./du_feed.py --mode update --start_from merged.20191225.csv --engine async --max_in_flight 16 --rate_limit 20
+          ./du_feed.py --mode update --start_from merged.20191225.csv --min_interval_seconds 3600 --schedule --limit 500
+          ./du_feed.py --mode update --start_from merged.20191225.csv --base_url http://127.0.0.1:8000/api/v1/h5
+          ./du_feed.py --mode update --start_from merged.20191225.csv --metrics_out metrics.json --metrics_prom du_feed.prom
+          ./du_feed.py --mode update --start_from merged.20191225.csv --workers 4 --engine async --rate_limit 20
+          ./du_feed.py --mode update --queue queue.db --engine async --rate_limit 20
           ./du_feed.py --mode query --kw aj --pages 2 --start_from du.mapping.20191206-145908.csv
           ./du_feed.py --mode query --kw aj --pages 30
+          ./du_feed.py --mode query --kw aj --pages 30 --resume
           ./du_feed.py --mode getraw --style_id 575441-028 --start_from merged.20191225.csv
           ./du_feed.py --mode gets --style_id BQ6623-800 --start_from du.historical.csv --transaction_history_date 20190801 --transaction_history_maxpage 20 --plot_size 9.5
     """
@@ -194,6 +277,19 @@ def parse_args():
         "in update mode, the file from which to load the product_id, style_id mapping",
     )
     parser.add_argument("--pages", help="in query mode, the number of pages to query")
+    parser.add_argument(
+        "--checkpoint",
+        default="du_query.checkpoint.json",
+        help="in query mode, the file the crawl is checkpointed to after each page, "
+        "removed once the mapping file is written. A crawl without --resume won't start "
+        "while it exists",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="in query mode, resume an interrupted crawl from its checkpoint, "
+        "skipping queried pages and items already detailed",
+    )
     parser.add_argument(
         "--last_updated",
         help="in update mode, the file containing the last_updated time of each item",
@@ -224,16 +320,148 @@ def parse_args():
         help="in update mode, the furthest back in pages this tries to look for historical transactions\n"
         "this performs an 'and' on all conditions",
     )
+    parser.add_argument(
+        "--engine",
+        default="sync",
+        help="in update mode, [sync|async]. async fetches multiple products concurrently",
+    )
+    parser.add_argument(
+        "--max_in_flight",
+        default=8,
+        type=int,
+        help="in update mode with async engine, the most number of products fetched at the same time",
+    )
+    parser.add_argument(
+        "--rate_limit",
+        type=float,
+        help="the most number of requests per second sent to one host",
+    )
+    parser.add_argument(
+        "--schedule",
+        action="store_true",
+        help="in update mode, update the most valuable stale items first instead of following start_from's order",
+    )
+    parser.add_argument(
+        "--profit_file",
+        default="../strategy/profit_ratios.json",
+        help="in update mode with --schedule, the profit ratios written by strategy.py --profit_out",
+    )
+    parser.add_argument(
+        "--journal_last_updated",
+        action="store_true",
+        help="in update mode, append each update to a journal shared with stockx_feed.js instead of rewriting last_updated",
+    )
+    parser.add_argument(
+        "--watermarks",
+        default="transaction_watermarks.json",
+        help="in update mode, the file containing the newest stored transaction of each product",
+    )
+    parser.add_argument(
+        "--ignore_watermarks",
+        action="store_true",
+        help="in update mode, page through transactions as if nothing was stored before",
+    )
+    parser.add_argument(
+        "--storage",
+        default="json",
+        help="in update mode, [json|log|sqlite] how time series readings are stored",
+    )
+    parser.add_argument(
+        "--pool_size",
+        default=10,
+        type=int,
+        help="number of persistent connections kept to Du",
+    )
+    parser.add_argument(
+        "--timeout",
+        default=30,
+        type=float,
+        help="seconds to wait for a Du response before retrying",
+    )
+    parser.add_argument(
+        "--max_retries",
+        default=3,
+        type=int,
+        help="retries of a Du request after connection errors, timeouts or 5xx responses",
+    )
+    parser.add_argument(
+        "--base_url",
+        help="Du API base url, e.g. of du_stub_server.py, defaults to app.poizon.com",
+    )
+    parser.add_argument(
+        "--metrics_out",
+        help="in query and update mode, write per stage timings and request metrics of the run to this JSON file",
+    )
+    parser.add_argument(
+        "--metrics_prom",
+        help="in query and update mode, also write them in Prometheus text format to this file",
+    )
+    parser.add_argument(
+        "--workers",
+        default=1,
+        type=int,
+        help="in update mode, the number of processes updating a shard of start_from's styles each, "
+        "rate_limit and limit are split between them",
+    )
+    parser.add_argument(
+        "--queue",
+        help="in update mode, lease jobs from this work queue file (see work_queue.py) instead of iterating start_from",
+    )
+    parser.add_argument(
+        "--queue_batch",
+        default=8,
+        type=int,
+        help="in update mode with --queue, the number of jobs leased at a time",
+    )
+    parser.add_argument(
+        "--lease_seconds",
+        default=900,
+        type=float,
+        help="in update mode with --queue, how long a leased job is hidden from other consumers",
+    )
+    parser.add_argument(
+        "--data_folder",
+        help="in update mode, the folder time series readings are written to, defaults to ../data",
+    )
     parser.add_argument(
         "--plot_size",
         help="in gets mode, plot the historical prices of the given size"
     )
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     return args
 
 
+def get_transport(args, pool_size=None, metrics=None):
+    rate_limiter = HostRateLimiter(args.rate_limit) if args.rate_limit else None
+    return DuTransport(
+        DuRequestBuilder.du_headers,
+        pool_size=pool_size if pool_size else args.pool_size,
+        read_timeout=args.timeout,
+        max_retries=args.max_retries,
+        rate_limiter=rate_limiter,
+        metrics=metrics,
+    )
+
+
+def get_metrics(args):
+    """
+    @return RunMetrics, recording only if a metrics output was asked for
+    """
+    return RunMetrics(enabled=bool(args.metrics_out or args.metrics_prom))
+
+
+def finish_metrics(args, metrics):
+    metrics.print_summary()
+    if args.metrics_out:
+        metrics.write_json(args.metrics_out)
+    if args.metrics_prom:
+        metrics.write_prometheus(args.metrics_prom)
+    return
+
+
 def query_mode(args):
-    feed = DuFeed()
+    metrics = get_metrics(args)
+    feed = DuFeed(get_transport(args, metrics=metrics), args.base_url, metrics)
     serializer = StaticInfoSerializer()
 
     keywords = []
@@ -248,16 +476,127 @@ def query_mode(args):
         )
     else:
         result_items = {}
+    checkpoint = QueryCheckpoint(args.checkpoint, resume=args.resume)
+    result_items.update(checkpoint.items)
 
-    for keyword in keywords:
-        result_items = feed.search_pages(
-            keyword.strip(), pages=int(args.pages), result_items=result_items
+    try:
+        for keyword in keywords:
+            result_items = feed.search_pages(
+                keyword.strip(),
+                pages=int(args.pages),
+                result_items=result_items,
+                checkpoint=checkpoint,
+            )
+    except KeyboardInterrupt:
+        print(
+            "Caught KeyboardInterrupt. {} is up to date, rerun with --resume".format(
+                args.checkpoint
+            )
         )
+        exit(1)
     serializer.dump_static_info_to_csv(result_items)
+    checkpoint.remove()
+    feed.transport.print_stats()
+    finish_metrics(args, metrics)
+
+
+def get_transaction_history_args(args):
+    max_page = (
+        int(args.transaction_history_maxpage) if args.transaction_history_maxpage else 0
+    )
+    up_to_time = (
+        datetime.datetime.strptime(args.transaction_history_date, "%Y%m%d")
+        if args.transaction_history_date
+        else None
+    )
+    return max_page, up_to_time
+
+
+def fetch_product_update(feed, product_id, max_page, up_to_time, up_to_id=None):
+    """
+    Network half of updating one product: current size prices, historical
+    transactions (newer than up_to_id if given) split by size, and the
+    fetch_info of get_historical_transactions. Safe to call from worker threads.
+    """
+    result = feed.get_size_prices_from_product_id(product_id)
+    if not result:
+        raise RuntimeError("failed to get size prices for {}".format(product_id))
+    size_prices, gender = result
+    fetch_info = {}
+    transactions = feed.get_historical_transactions(
+        product_id,
+        gender,
+        max_page=max_page,
+        up_to_time=up_to_time,
+        up_to_id=up_to_id,
+        fetch_info=fetch_info,
+    )
+    return size_prices, feed.split_size_transactions(transactions), fetch_info
+
+
+def save_product_update(
+    style_id,
+    size_prices,
+    size_transactions,
+    last_updated_serializer,
+    time_series_serializer,
+):
+    update_time = last_updated_serializer.update_last_updated(style_id, "du")
+    time_series_serializer.update(
+        "du", update_time, style_id, size_prices, size_transactions
+    )
+    return
+
+
+def handle_update_error(e):
+    if isinstance(e, SizerError):
+        print(e.msg, e.in_code, e.out_code, e.in_size)
+    elif isinstance(e, (KeyError, RuntimeError, json.decoder.JSONDecodeError)):
+        print("get_tick failed {}".format(e))
+    else:
+        raise e
+
+
+def get_update_jobs(static_info, last_updated_serializer, limit):
+    jobs = []
+    for product_id in static_info:
+        style_id = static_info[product_id].style_id
+        if last_updated_serializer.should_update(style_id, "du"):
+            if limit and len(jobs) >= int(limit):
+                break
+            jobs.append(product_id)
+        else:
+            print("should skip {}".format(product_id))
+    return jobs
 
 
-def update_mode(args):
-    feed = DuFeed()
+def get_scheduled_update_jobs(static_info, last_updated_serializer, scheduler, limit):
+    """
+    Same as get_update_jobs, ordered by UpdateScheduler score instead of file order.
+
+    @return (jobs, planned) where planned is the list returned by UpdateScheduler.plan
+    """
+    product_ids = {static_info[p].style_id: p for p in static_info}
+    planned = scheduler.plan(
+        product_ids.keys(),
+        ["du"],
+        last_updated_serializer.last_updated,
+        last_updated_serializer.min_update_time,
+        int(limit) if limit else None,
+    )
+    return [product_ids[style_id] for _, style_id, _ in planned], planned
+
+
+def update_mode(args, shard=None):
+    """
+    @param shard  (shard, shards) (optional) only update the styles of this
+        shard, see update_shards
+    """
+    pool_size = args.pool_size
+    if args.engine == "async":
+        pool_size = max(pool_size, args.max_in_flight)
+    metrics = get_metrics(args)
+    feed = DuFeed(get_transport(args, pool_size, metrics), args.base_url, metrics)
     serializer = StaticInfoSerializer()
 
     last_updated_file = "last_updated.log"
@@ -265,71 +604,286 @@ def update_mode(args):
         last_updated_file = args.last_updated
 
     last_updated_serializer = LastUpdatedSerializer(
-        last_updated_file, args.min_interval_seconds
+        last_updated_file,
+        args.min_interval_seconds,
+        journaled=args.journal_last_updated,
     )
-    time_series_serializer = TimeSeriesSerializer()
+    time_series_serializer = get_time_series_serializer(args.storage, args.data_folder)
+    watermark_serializer = TransactionWatermarkSerializer(args.watermarks)
 
-    static_info, _ = serializer.load_static_info_from_csv(
-        args.start_from, return_key="du_product_id"
-    )
-    count = 0
-    try:
-        for product_id in static_info:
-            style_id = static_info[product_id].style_id
-            if last_updated_serializer.should_update(style_id, "du"):
-                count += 1
-                if args.limit and count > int(args.limit):
-                    break
-                print(
-                    "working with {} style_id {} brand {}".format(
-                        product_id, style_id, static_info[product_id].title
-                    )
-                )
+    if args.start_from:
+        static_info, _ = serializer.load_static_info_from_csv(
+            args.start_from, return_key="du_product_id"
+        )
+    else:
+        # in queue mode jobs carry their style_id
+        static_info = {}
+    style_ids = {product_id: v.style_id for product_id, v in static_info.items()}
+    if shard:
+        static_info = {
+            product_id: v
+            for product_id, v in static_info.items()
+            if get_shard(v.style_id, shard[1]) == shard[0]
+        }
+        print(
+            "shard {} of {}: {} products".format(shard[0], shard[1], len(static_info))
+        )
+    max_page, up_to_time = get_transaction_history_args(args)
+    queue = WorkQueue(args.queue) if args.queue else None
+    # {product_id: Job} leased and not yet completed or failed
+    leased = {}
+    owner = get_owner()
+    if queue:
+        # leased batch by batch in run_queue
+        jobs = []
+    elif args.schedule:
+        scheduler = UpdateScheduler(
+            time_series_serializer, load_profit_ratios(args.profit_file)
+        )
+        jobs, planned = get_scheduled_update_jobs(
+            static_info, last_updated_serializer, scheduler, args.limit
+        )
+        scheduler.print_coverage(planned)
+    else:
+        jobs = get_update_jobs(static_info, last_updated_serializer, args.limit)
+    updated = set()
+
+    def log_job(product_id):
+        print(
+            "working with {} style_id {} brand {}".format(
+                product_id,
+                style_ids[product_id],
+                static_info[product_id].title if product_id in static_info else "",
+            )
+        )
+
+    page_stats = {"fetched": 0, "skipped": 0, "reached_watermark": 0, "products": 0}
+
+    def fetch(product_id):
+        up_to_id = (
+            None
+            if args.ignore_watermarks
+            else watermark_serializer.get_newest_id(product_id)
+        )
+        return fetch_product_update(feed, product_id, max_page, up_to_time, up_to_id)
+
+    def on_result(product_id, result):
+        size_prices, size_transactions, fetch_info = result
+        with metrics.stage("serialize"):
+            save_product_update(
+                style_ids[product_id],
+                size_prices,
+                size_transactions,
+                last_updated_serializer,
+                time_series_serializer,
+            )
+        with metrics.stage("last_updated_save"):
+            last_updated_serializer.save_last_updated()
+        updated.add((style_ids[product_id], "du"))
+        if product_id in leased:
+            queue.complete(leased.pop(product_id), owner)
+
+        # transactions are stored, the watermark can move forward
+        watermark_serializer.update_watermark(
+            product_id, fetch_info["newest_id"], fetch_info["cursor"]
+        )
+        page_stats["products"] += 1
+        page_stats["fetched"] += fetch_info["pages"]
+        if fetch_info["reached_up_to_id"]:
+            page_stats["reached_watermark"] += 1
+            page_stats["skipped"] += max_page + 1 - fetch_info["pages"]
+        if page_stats["products"] % 50 == 0:
+            with metrics.stage("watermark_save"):
+                watermark_serializer.save_watermarks()
+
+    def finish():
+        last_updated_serializer.save_last_updated(force_compact=True)
+        watermark_serializer.save_watermarks()
+        print(
+            "fetched {} transaction pages for {} products, {} stopped at their "
+            "watermark skipping {} pages".format(
+                page_stats["fetched"],
+                page_stats["products"],
+                page_stats["reached_watermark"],
+                page_stats["skipped"],
+            )
+        )
+        if args.schedule and not queue:
+            scheduler.print_coverage(planned, updated)
+        if queue:
+            # back to the queue rather than waiting out their leases
+            for job in leased.values():
+                queue.release(job, owner)
+            print("work queue {}".format(queue.get_stats()))
+            queue.close()
+        feed.transport.print_stats()
+        finish_metrics(args, metrics)
+
+    def on_error(product_id, e):
+        if product_id in leased:
+            queue.fail(
+                leased.pop(product_id),
+                owner,
+                "{}: {}".format(type(e).__name__, e),
+                dead_letter=isinstance(e, (SizerError, KeyError)),
+            )
+        handle_update_error(e)
+        metrics.count("error_" + type(e).__name__)
+        with metrics.stage("last_updated_save"):
+            last_updated_serializer.save_last_updated()
+
+    def run_jobs(jobs):
+        if args.engine == "async":
+            for product_id in jobs:
+                log_job(product_id)
+            engine = AsyncUpdateEngine(max_in_flight=args.max_in_flight)
+            engine.run(jobs, fetch, on_result, on_error)
+        else:
+            for product_id in jobs:
+                log_job(product_id)
                 try:
-                    size_prices, gender = feed.get_size_prices_from_product_id(product_id)
+                    result = fetch(product_id)
+                except Exception as e:
+                    on_error(product_id, e)
+                    continue
+                on_result(product_id, result)
+
+    def run_queue():
+        # until nothing is left to lease (or limit is reached)
+        leased_count = 0
+        while not args.limit or leased_count < int(args.limit):
+            batch_size = args.queue_batch
+            if args.limit:
+                batch_size = min(batch_size, int(args.limit) - leased_count)
+            batch = queue.lease(owner, "du", batch_size, args.lease_seconds)
+            if not batch:
+                break
+            leased_count += len(batch)
+            for job in batch:
+                if not job.product_id:
+                    queue.fail(job, owner, "no du product_id", dead_letter=True)
+                    continue
+                leased[job.product_id] = job
+                style_ids[job.product_id] = job.style_id
+            run_jobs(list(leased.keys()))
 
-                    max_page = (
-                        int(args.transaction_history_maxpage)
-                        if args.transaction_history_maxpage
-                        else 0
-                    )
-                    up_to_time = (
-                        datetime.datetime.strptime(
-                            args.transaction_history_date, "%Y%m%d"
-                        )
-                        if args.transaction_history_date
-                        else None
-                    )
-                    transactions = feed.get_historical_transactions(
-                        product_id, gender, max_page=max_page, up_to_time=up_to_time
-                    )
-                    size_transactions = feed.split_size_transactions(transactions)
-                    
-                    update_time = last_updated_serializer.update_last_updated(
-                        style_id, "du"
-                    )
-                    time_series_serializer.update(
-                        "du", update_time, style_id, size_prices, size_transactions
-                    )
-                except KeyError as e:
-                    print("get_tick failed {}".format(e))
-                except RuntimeError as e:
-                    print("get_tick failed {}".format(e))
-                except json.decoder.JSONDecodeError as e:
-                    print("get_tick failed {}".format(e))
-                except SizerError as e:
-                    print(e.msg, e.in_code, e.out_code, e.in_size)
-                last_updated_serializer.save_last_updated()
-            else:
-                print("should skip {}".format(product_id))
+    try:
+        if queue:
+            run_queue()
+        else:
+            run_jobs(jobs)
     except KeyboardInterrupt:
-        last_updated_serializer.save_last_updated()
         print("Caught KeyboardInterrupt. Saving last_updated and exiting")
+        finish()
+        exit(1)
+    finish()
+
+
+def get_shard_limit(limit, shard, shards):
+    if not limit:
+        return limit
+    return str(int(limit) // shards + (1 if shard < int(limit) % shards else 0))
+
+
+def merge_shard_metrics(metrics, shard_metrics_file):
+    if not os.path.isfile(shard_metrics_file):
+        return
+    with open(shard_metrics_file, "r") as infile:
+        metrics.merge(json.loads(infile.read()))
+    os.remove(shard_metrics_file)
+    return
+
+
+def sharded_update_mode(args):
+    """
+    update_mode across args.workers processes. Each updates the styles of one
+    shard of start_from (see update_shards) with its share of the request
+    budget, its own metrics, last_updated journal and watermarks, which are
+    merged back once all workers exit. A worker that crashes only loses what
+    its shard did since it last saved.
+    """
+    shards = args.workers
+    metrics = get_metrics(args)
+    last_updated_serializer = LastUpdatedSerializer(
+        args.last_updated if args.last_updated else "last_updated.log",
+        args.min_interval_seconds,
+        journaled=args.journal_last_updated,
+    )
+    watermark_serializer = TransactionWatermarkSerializer(args.watermarks)
+    metrics_file = args.metrics_out if args.metrics_out else args.metrics_prom
+
+    # shards of a run that didn't get to merge them
+    leftovers = get_leftover_shards(last_updated_serializer.dst_file_path)
+    for shard_path in leftovers:
+        print("merging leftover {}".format(shard_path))
+        merge_last_updated(last_updated_serializer, shard_path)
+    for shard_path in get_leftover_shards(watermark_serializer.dst_file_path):
+        print("merging leftover {}".format(shard_path))
+        merge_watermarks(watermark_serializer, shard_path)
+
+    static_info, _ = StaticInfoSerializer().load_static_info_from_csv(
+        args.start_from, return_key="du_product_id"
+    )
+    last_updated_paths = split_last_updated(last_updated_serializer, shards)
+    watermark_paths = split_watermarks(
+        watermark_serializer,
+        {product_id: v.style_id for product_id, v in static_info.items()},
+        shards,
+    )
+
+    workers = []
+    for i in range(shards):
+        shard_args = copy.copy(args)
+        shard_args.last_updated = last_updated_paths[i]
+        shard_args.journal_last_updated = True
+        shard_args.watermarks = watermark_paths[i]
+        shard_args.rate_limit = args.rate_limit / shards if args.rate_limit else None
+        shard_args.limit = get_shard_limit(args.limit, i, shards)
+        shard_args.metrics_out = (
+            get_shard_path(metrics_file, i, shards) if metrics.enabled else None
+        )
+        shard_args.metrics_prom = None
+        worker = multiprocessing.Process(
+            target=update_mode,
+            args=(shard_args, (i, shards)),
+            name="du_feed shard {} of {}".format(i, shards),
+        )
+        worker.start()
+        workers.append(worker)
+
+    interrupted = False
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        # workers got the same signal, let them save
+        print("Caught KeyboardInterrupt. Waiting for shards to save and exit")
+        interrupted = True
+        for worker in workers:
+            worker.join()
+
+    for i, worker in enumerate(workers):
+        if worker.exitcode != 0:
+            print(
+                "shard {} of {} exited with {}, merging what it saved".format(
+                    i, shards, worker.exitcode
+                )
+            )
+            metrics.count("failed_shards")
+        merged = merge_last_updated(last_updated_serializer, last_updated_paths[i])
+        merge_watermarks(watermark_serializer, watermark_paths[i])
+        if metrics.enabled:
+            merge_shard_metrics(metrics, get_shard_path(metrics_file, i, shards))
+        print("shard {} of {} updated {} items".format(i, shards, merged))
+    last_updated_serializer.save_last_updated(force_compact=True)
+    watermark_serializer.save_watermarks()
+    finish_metrics(args, metrics)
+    if interrupted:
         exit(1)
 
 
 def get_mode(args):
-    feed = DuFeed()
+    feed = DuFeed(get_transport(args), args.base_url)
     serializer = StaticInfoSerializer()
     pp = pprint.PrettyPrinter()
 
@@ -367,18 +921,7 @@ def get_mode(args):
         size_prices, gender = feed.get_size_prices_from_product_id(product_id)
         pp.pprint(size_prices)
         print(gender)
-        max_page = (
-            int(args.transaction_history_maxpage)
-            if args.transaction_history_maxpage
-            else 0
-        )
-        up_to_time = (
-            datetime.datetime.strptime(
-                args.transaction_history_date, "%Y%m%d"
-            )
-            if args.transaction_history_date
-            else None
-        )
+        max_page, up_to_time = get_transaction_history_args(args)
         transactions = feed.get_historical_transactions(
             product_id, gender, max_page=max_page, up_to_time=up_to_time
         )
@@ -388,7 +931,7 @@ def get_mode(args):
             reversed_t = transactions[::-1]
             for t in reversed_t:
                 t.size = t.size.strip().strip('Y')
-            filtered_t = [t for in reversed_t if float(t.size) == float(args.plot_size)]
+            filtered_t = [t for t in reversed_t if float(t.size) == float(args.plot_size)]
             
             if args.style_id:
                 fig_filename = "{}.{}.png".format(args.style_id, args.plot_size)
@@ -407,9 +950,16 @@ if __name__ == "__main__":
             raise RuntimeError("args.pages is mandatory in query mode")
         query_mode(args)
     elif args.mode == "update":
-        if not args.start_from:
+        if not args.start_from and not args.queue:
             raise RuntimeError("args.start_from is mandatory in update mode")
-        update_mode(args)
+        if args.workers > 1 and args.queue:
+            raise RuntimeError(
+                "args.workers and args.queue are exclusive, run several queue consumers instead"
+            )
+        if args.workers > 1:
+            sharded_update_mode(args)
+        else:
+            update_mode(args)
     elif args.mode == "getraw" or args.mode == "gets":
         if not args.start_from:
             raise RuntimeError("args.start_from is required in get modes")
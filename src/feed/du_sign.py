@@ -0,0 +1,31 @@
+import hashlib
+
+"""
+Du request signers.
+
+getSign in sign.js is an MD5 of the UTF-8 bytes of the sign query, rendered as
+lower case hex. DuSigner computes the same digest in process, ExecJsSigner keeps
+the original sign.js around for parity checks and as a fallback.
+"""
+
+
+class DuSigner:
+    def sign(self, sign_query):
+        """
+        @param sign_query  str concatenated request params and salt
+        @return str the sign value sign.js would produce for sign_query
+        """
+        return hashlib.md5(sign_query.encode("utf-8")).hexdigest()
+
+
+class ExecJsSigner:
+    def __init__(self, sign_js_file="sign.js"):
+        # only needed when explicitly asked for
+        import execjs
+
+        with open(sign_js_file, "r", encoding="utf-8") as f:
+            self.ctx = execjs.compile(f.read())
+        return
+
+    def sign(self, sign_query):
+        return self.ctx.call("getSign", sign_query)
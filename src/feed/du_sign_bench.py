@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+
+import argparse
+import time
+
+from du_sign import DuSigner, ExecJsSigner
+from du_url_builder import DuRequestBuilder
+
+"""
+Microbenchmark of Du URL construction with the in-process signer versus sign.js
+through execjs.
+"""
+
+
+def bench_builder(builder, count):
+    start = time.perf_counter()
+    for i in range(count):
+        builder.get_product_detail_url(i)
+        builder.get_recentsales_list_url(i % 20, i)
+    elapsed = time.perf_counter() - start
+    return 2 * count / elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        """
+        URLs / second built by DuRequestBuilder with each signer.
+
+        example usage:
+          ./du_sign_bench.py --count 200
+    """
+    )
+    parser.add_argument(
+        "--count",
+        default=200,
+        type=int,
+        help="number of products to build detail and recent sales urls for",
+    )
+    args = parser.parse_args()
+
+    native_rate = bench_builder(DuRequestBuilder(DuSigner()), args.count)
+    print("native signer: {:.0f} urls / second".format(native_rate))
+    try:
+        execjs_rate = bench_builder(DuRequestBuilder(ExecJsSigner()), args.count)
+        print("execjs signer: {:.0f} urls / second".format(execjs_rate))
+        print("speedup: {:.0f}x".format(native_rate / execjs_rate))
+    except Exception as e:
+        print("execjs signer unavailable: {}".format(e))
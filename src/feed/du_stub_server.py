@@ -0,0 +1,454 @@
+#!/usr/bin/env python3
+
+import argparse
+import http.server
+import json
+import os
+import pathlib
+import random
+import threading
+import time
+import urllib.parse
+
+from du_url_builder import DuRequestBuilder
+from static_info_serializer import StaticInfoSerializer
+
+"""
+Local stand-in for the Du API, to run du_feed.py (--base_url) offline.
+
+Serves the search/list, flow/product/detail and recentSoldList endpoints from
+a fixtures folder:
+  - search/{title}.json: list of productList entries of a keyword, paged by
+    page and limit
+  - detail/{product_id}.json: recorded product detail response
+  - recent_sold/{product_id}.json: list of sales, latest first, paged by lastId
+    (here the offset of the next page, opaque to the feed as du's own)
+Fixtures are recorded from the live API (--mode record) or fabricated
+(--mode synthesize).
+
+Per endpoint (search, detail, recent_sold, or "*" for all of them) a faults
+config can add latency (+ uniform jitter), answer a random error_rate of
+requests with error_status, and answer burst_length requests in a row with
+burst_status every burst_every requests (429s carry a Retry-After of
+retry_after seconds if set), e.g.
+  {"*": {"latency": 0.05, "jitter": 0.05},
+   "recent_sold": {"error_rate": 0.02, "error_status": 503,
+                   "burst_every": 200, "burst_length": 10, "burst_status": 429}}
+Requests with a wrong sign are answered with status 403 in the body.
+"""
+
+API_PREFIX = "/api/v1/h5"
+
+ENDPOINTS = {
+    "/product/fire/search/list": "search",
+    "/index/fire/flow/product/detail": "detail",
+    "/product/fire/recentSoldList": "recent_sold",
+}
+
+# sizes of the nike men chart, as du lists them
+SYNTHETIC_SIZES = ["40", "40.5", "41", "42", "42.5", "43", "44", "44.5", "45", "45.5"]
+
+
+class EndpointFaults:
+    def __init__(
+        self,
+        latency=0,
+        jitter=0,
+        error_rate=0,
+        error_status=500,
+        burst_every=0,
+        burst_length=0,
+        burst_status=429,
+        retry_after=None,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.burst_every = burst_every
+        self.burst_length = burst_length
+        self.burst_status = burst_status
+        # seconds sent in the Retry-After header of injected 429s
+        self.retry_after = retry_after
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.rng = random.Random(0)
+        return
+
+    def apply(self):
+        """
+        Sleep the configured latency.
+
+        @return HTTP status to fail the request with, None to serve it
+        """
+        with self.lock:
+            count = self.requests
+            self.requests += 1
+            delay = self.latency + self.rng.uniform(0, self.jitter)
+            failed = self.rng.random() < self.error_rate
+        if delay > 0:
+            time.sleep(delay)
+        if self.burst_every and count % self.burst_every < self.burst_length:
+            return self.burst_status
+        if failed:
+            return self.error_status
+        return None
+
+
+def load_faults(faults):
+    """
+    @param faults  {endpoint or "*": {EndpointFaults argument: value}}
+    @return {endpoint: EndpointFaults}
+    """
+    result = {}
+    for endpoint in ENDPOINTS.values():
+        config = dict(faults.get("*", {}))
+        config.update(faults.get(endpoint, {}))
+        result[endpoint] = EndpointFaults(**config)
+    return result
+
+
+class DuStubHandler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, obj, status=200, headers=None):
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _load_fixture(self, kind, name):
+        # names come from the query string, keep them inside the fixtures folder
+        f = os.path.join(
+            self.server.fixtures_folder, kind, os.path.basename(name) + ".json"
+        )
+        if not os.path.isfile(f):
+            return None
+        with open(f, "r") as infile:
+            return json.loads(infile.read())
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        path = url.path[len(API_PREFIX) :] if url.path.startswith(API_PREFIX) else ""
+        if path not in ENDPOINTS:
+            self._send_json({"status": 404, "msg": "unknown endpoint"}, 404)
+            return
+        endpoint = ENDPOINTS[path]
+        query = {k: v[0] for k, v in urllib.parse.parse_qs(url.query).items()}
+
+        faults = self.server.faults[endpoint]
+        status = faults.apply()
+        if status:
+            headers = {}
+            if status == 429 and faults.retry_after is not None:
+                headers["Retry-After"] = str(faults.retry_after)
+            self._send_json({"status": status, "msg": "injected"}, status, headers)
+            return
+        if self.server.check_sign and query.get("sign") != get_expected_sign(
+            endpoint, query
+        ):
+            self._send_json({"status": 403, "msg": "invalid sign"})
+            return
+
+        if endpoint == "search":
+            self._send_json(self.get_search(query))
+        elif endpoint == "detail":
+            detail = self._load_fixture("detail", query.get("productId", ""))
+            if detail is None:
+                self._send_json({"status": 404, "msg": "product not found"})
+            else:
+                self._send_json(detail)
+        else:
+            self._send_json(self.get_recent_sold(query))
+
+    def get_search(self, query):
+        products = self._load_fixture("search", query.get("title", "")) or []
+        page = int(query.get("page", 0))
+        limit = int(query.get("limit", 20))
+        return {
+            "status": 200,
+            "data": {
+                "total": len(products),
+                "productList": products[page * limit : (page + 1) * limit],
+            },
+        }
+
+    def get_recent_sold(self, query):
+        sales = self._load_fixture("recent_sold", query.get("productId", "")) or []
+        last_id = int(query.get("lastId", 0) or 0)
+        limit = int(query.get("limit", 20))
+        page = sales[last_id : last_id + limit]
+        return {
+            "status": 200,
+            "data": {"lastId": last_id + len(page), "list": page},
+        }
+
+
+def get_expected_sign(endpoint, query):
+    builder = DuRequestBuilder()
+    if endpoint == "search":
+        url = builder.get_search_by_keywords_url(
+            query.get("title", ""),
+            query.get("page"),
+            query.get("sortMode"),
+            query.get("sortType"),
+            query.get("limit"),
+        )
+    elif endpoint == "detail":
+        url = builder.get_product_detail_url(query.get("productId"))
+    else:
+        url = builder.get_recentsales_list_url(
+            query.get("lastId"), query.get("productId"), query.get("limit")
+        )
+    return urllib.parse.parse_qs(urllib.parse.urlparse(url).query)["sign"][0]
+
+
+class DuStubServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self, fixtures_folder, faults=None, host="127.0.0.1", port=0, check_sign=True
+    ):
+        """
+        @param faults  {endpoint or "*": {...}} see load_faults
+        @param port  0 picks a free port, see base_url
+        """
+        super().__init__((host, port), DuStubHandler)
+        self.fixtures_folder = fixtures_folder
+        self.faults = load_faults(faults if faults else {})
+        self.check_sign = check_sign
+        self.verbose = False
+        self.thread = None
+        return
+
+    @property
+    def base_url(self):
+        """
+        @return base url to pass DuRequestBuilder / du_feed.py --base_url
+        """
+        return "http://{}:{}{}".format(
+            self.server_address[0], self.server_address[1], API_PREFIX
+        )
+
+    def start(self):
+        """
+        Serve from a background thread, e.g. in tests.
+        """
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self.thread:
+            self.thread.join()
+        return
+
+
+def write_fixture(fixtures_folder, kind, name, obj):
+    folder = os.path.join(fixtures_folder, kind)
+    pathlib.Path(folder).mkdir(parents=True, exist_ok=True)
+    with open(os.path.join(folder, "{}.json".format(name)), "w") as outfile:
+        outfile.write(json.dumps(obj, ensure_ascii=False))
+    return
+
+
+def synthesize_fixtures(fixtures_folder, products, sales=60, keyword="aj", seed=0):
+    """
+    Fabricate fixtures of products with product ids 1 to products, all found by
+    keyword.
+
+    @param sales  number of recent sales of each product
+    """
+    rng = random.Random(seed)
+    product_list = []
+    for product_id in range(1, products + 1):
+        title = "Synthetic {}".format(product_id)
+        product_list.append(
+            {"productId": product_id, "title": title, "soldNum": rng.randint(0, 5000)}
+        )
+        size_list = [
+            {
+                "size": size,
+                "buyerBiddingItem": {"price": rng.randint(300, 2000) * 100},
+                "showItem": {"price": rng.randint(500, 3000) * 100},
+            }
+            for size in SYNTHETIC_SIZES
+        ]
+        write_fixture(
+            fixtures_folder,
+            "detail",
+            product_id,
+            {
+                "status": 200,
+                "data": {
+                    "detail": {
+                        "articleNumber": "SYN{:06d}-{:03d}".format(
+                            product_id, product_id % 1000
+                        ),
+                        "title": title,
+                        "sellDate": "2019.01.01",
+                        "sizeList": SYNTHETIC_SIZES,
+                    },
+                    "sizeList": size_list,
+                },
+            },
+        )
+        write_fixture(
+            fixtures_folder,
+            "recent_sold",
+            product_id,
+            [
+                {
+                    "price": rng.randint(500, 3000) * 100,
+                    "sizeDesc": rng.choice(SYNTHETIC_SIZES) + "码",
+                    "userName": "u{}".format(rng.getrandbits(32)),
+                    # latest first, an hour to a day apart
+                    "formatTime": "{}小时前".format(i * 24 + rng.randint(0, 23)),
+                }
+                for i in range(sales)
+            ],
+        )
+    write_fixture(fixtures_folder, "search", keyword, product_list)
+    print("synthesized fixtures of {} products in {}".format(products, fixtures_folder))
+    return
+
+
+def record_fixtures(fixtures_folder, product_ids, keywords=None, max_page=10):
+    """
+    Record detail and recent sales (up to max_page pages) of the given
+    products, and search results of the given keywords, from the live API.
+    """
+    # here to keep the server free of feed dependencies
+    from du_feed import DuFeed
+
+    feed = DuFeed()
+    for product_id in product_ids:
+        detail = json.loads(feed.get_details_from_product_id_raw(product_id))
+        write_fixture(fixtures_folder, "detail", product_id, detail)
+        sales = []
+        last_id = 0
+        for _ in range(max_page):
+            url = feed.builder.get_recentsales_list_url(last_id, product_id)
+            data = json.loads(feed.transport.get(url).text)["data"]
+            if len(data["list"]) == 0:
+                break
+            sales += data["list"]
+            last_id = data["lastId"]
+        write_fixture(fixtures_folder, "recent_sold", product_id, sales)
+        print("recorded {} with {} sales".format(product_id, len(sales)))
+    for keyword in keywords if keywords else []:
+        products = []
+        page = 0
+        while True:
+            url = feed.builder.get_search_by_keywords_url(keyword, page, 1, 0)
+            product_list = json.loads(feed.transport.get(url).text)["data"][
+                "productList"
+            ]
+            if len(product_list) == 0 or page >= max_page:
+                break
+            products += product_list
+            page += 1
+        write_fixture(fixtures_folder, "search", keyword, products)
+        print("recorded {} search results of {}".format(len(products), keyword))
+    feed.transport.print_stats()
+    return
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        """
+        local stand-in for the Du API.
+
+        example usage:
+          ./du_stub_server.py --mode synthesize --fixtures du_fixtures --products 500
+          ./du_stub_server.py --mode record --fixtures du_fixtures --start_from merged.20191225.csv --limit 50 --kw aj
+          ./du_stub_server.py --mode serve --fixtures du_fixtures --port 8000 --faults faults.json
+          ./du_feed.py --mode update --start_from merged.20191225.csv --base_url http://127.0.0.1:8000/api/v1/h5
+    """
+    )
+    parser.add_argument(
+        "--mode", default="serve", help="[serve|record|synthesize] what to do"
+    )
+    parser.add_argument("--fixtures", default="du_fixtures", help="fixtures folder")
+    parser.add_argument("--host", default="127.0.0.1", help="in serve mode, host")
+    parser.add_argument("--port", default=8000, type=int, help="in serve mode, port")
+    parser.add_argument(
+        "--faults",
+        help="in serve mode, JSON file of per endpoint latency / errors / bursts",
+    )
+    parser.add_argument(
+        "--no_check_sign",
+        action="store_true",
+        help="in serve mode, accept requests with a wrong sign",
+    )
+    parser.add_argument(
+        "--verbose", action="store_true", help="in serve mode, log every request"
+    )
+    parser.add_argument(
+        "--start_from",
+        help="in record mode, the mapping whose products to record",
+    )
+    parser.add_argument(
+        "--limit", default=20, type=int, help="in record mode, number of products"
+    )
+    parser.add_argument(
+        "--kw", help="in record mode, comma separated keywords to record searches of"
+    )
+    parser.add_argument(
+        "--max_page",
+        default=10,
+        type=int,
+        help="in record mode, pages of recent sales / search results per product / keyword",
+    )
+    parser.add_argument(
+        "--products",
+        default=100,
+        type=int,
+        help="in synthesize mode, number of products",
+    )
+    parser.add_argument(
+        "--sales",
+        default=60,
+        type=int,
+        help="in synthesize mode, number of recent sales per product",
+    )
+    args = parser.parse_args()
+
+    if args.mode == "serve":
+        faults = {}
+        if args.faults:
+            with open(args.faults, "r") as infile:
+                faults = json.loads(infile.read())
+        server = DuStubServer(
+            args.fixtures, faults, args.host, args.port, not args.no_check_sign
+        )
+        server.verbose = args.verbose
+        print("serving {} at {}".format(args.fixtures, server.base_url))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
+    elif args.mode == "record":
+        if not args.start_from:
+            raise RuntimeError("args.start_from is mandatory in record mode")
+        static_info, _ = StaticInfoSerializer().load_static_info_from_csv(
+            args.start_from, return_key="du_product_id"
+        )
+        record_fixtures(
+            args.fixtures,
+            list(static_info.keys())[: args.limit],
+            args.kw.split(",") if args.kw else None,
+            args.max_page,
+        )
+    elif args.mode == "synthesize":
+        synthesize_fixtures(args.fixtures, args.products, args.sales)
+    else:
+        raise RuntimeError("unrecognized mode {}".format(args.mode))
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+import shutil
+import tempfile
+import time
+import unittest
+
+import requests
+
+from du_feed import DuFeed
+from du_stub_server import DuStubServer, synthesize_fixtures
+from du_transport import DuTransport
+from du_url_builder import DuRequestBuilder
+
+
+class TestDuStubServer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.fixtures = tempfile.mkdtemp()
+        synthesize_fixtures(cls.fixtures, products=30, sales=50)
+        return
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.fixtures)
+        return
+
+    def start_feed(self, faults=None):
+        self.server = DuStubServer(self.fixtures, faults).start()
+        self.addCleanup(self.server.stop)
+        transport = DuTransport(
+            DuRequestBuilder.du_headers, max_retries=3, backoff_base=0.001
+        )
+        return DuFeed(transport, self.server.base_url)
+
+    def test_detail(self):
+        feed = self.start_feed()
+        size_prices, gender = feed.get_size_prices_from_product_id(7)
+        self.assertEqual(gender, "eu-nike-men")
+        self.assertEqual(len(size_prices), 10)
+        self.assertIsNone(feed.get_size_prices_from_product_id(1000))
+
+    def test_recent_sales_paging(self):
+        feed = self.start_feed()
+        fetch_info = {}
+        sales = feed.get_historical_transactions(
+            3, "eu-nike-men", max_page=10, fetch_info=fetch_info
+        )
+        self.assertEqual(len(sales), 50)
+        # 20 + 20 + 10, then the empty page
+        self.assertEqual(fetch_info["pages"], 4)
+
+        newer = feed.get_historical_transactions(
+            3, "eu-nike-men", max_page=10, up_to_id=sales[25].id
+        )
+        self.assertEqual([s.id for s in newer], [s.id for s in sales[:25]])
+
+    def test_search(self):
+        feed = self.start_feed()
+        items = feed.search_pages("aj", pages=2)
+        self.assertEqual(len(items), 30)
+        self.assertEqual(items["1"].style_id, "SYN000001-001")
+
+    def test_injected_faults_are_retried(self):
+        feed = self.start_feed(
+            {"detail": {"burst_every": 1000, "burst_length": 2, "burst_status": 503}}
+        )
+        self.assertIsNotNone(feed.get_size_prices_from_product_id(1))
+        stats = feed.transport.get_stats()["/api/v1/h5/index/fire/flow/product/detail"]
+        self.assertEqual(stats["requests"], 3)
+        self.assertEqual(stats["retries"], 2)
+
+    def test_default_429_burst_is_retried(self):
+        feed = self.start_feed(
+            {"detail": {"burst_every": 1000, "burst_length": 1, "retry_after": 0.2}}
+        )
+        start = time.monotonic()
+        self.assertIsNotNone(feed.get_size_prices_from_product_id(1))
+        # the Retry-After of the response, not the 1ms backoff
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+        stats = feed.transport.get_stats()["/api/v1/h5/index/fire/flow/product/detail"]
+        self.assertEqual((stats["requests"], stats["retries"]), (2, 1))
+
+    def test_invalid_sign(self):
+        feed = self.start_feed()
+        url = feed.builder.get_product_detail_url(1).replace(
+            "productId=1", "productId=2"
+        )
+        self.assertEqual(requests.get(url).json()["status"], 403)
+
+
+if __name__ == "__main__":
+    unittest.main()
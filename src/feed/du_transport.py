@@ -0,0 +1,219 @@
+import datetime
+import email.utils
+import random
+import threading
+import time
+import urllib.parse
+
+import requests
+import requests.adapters
+
+from run_metrics import DISABLED
+
+"""
+Pooled keep-alive HTTP transport for Du requests.
+
+One transport is shared by everything a DuFeed sends, so connections to
+app.poizon.com are reused across products and threads. Connection errors,
+timeouts, 429 and 5xx responses are retried with jittered exponential backoff
+(or after the Retry-After of the response, up to backoff_max), and requests,
+retries, bytes and latency are counted per endpoint.
+"""
+
+
+def is_retried_status(status):
+    return status == 429 or status >= 500
+
+
+def get_retry_after(response):
+    """
+    @return seconds the Retry-After header of response asks to wait, None if
+        it has none
+    """
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return max((retry_at - now).total_seconds(), 0)
+
+
+class EndpointStats:
+    def __init__(self):
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.bytes = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def to_dict(self):
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "failures": self.failures,
+            "bytes": self.bytes,
+            "latency_avg": self.latency_total / self.requests if self.requests else 0,
+            "latency_max": self.latency_max,
+        }
+
+
+class DuTransport:
+    def __init__(
+        self,
+        headers,
+        pool_size=10,
+        connect_timeout=5,
+        read_timeout=30,
+        max_retries=3,
+        backoff_base=0.5,
+        backoff_max=30,
+        rate_limiter=None,
+        metrics=None,
+    ):
+        """
+        @param headers          dict headers sent with every request
+        @param pool_size        int number of persistent connections kept per host
+        @param connect_timeout  float seconds to wait for a connection
+        @param read_timeout     float seconds to wait for a response
+        @param max_retries      int retries after the first attempt
+        @param backoff_base     float seconds of backoff before the first retry,
+            doubled on every following retry
+        @param backoff_max      float cap on the backoff of a single retry
+        @param rate_limiter     HostRateLimiter (optional) consulted before every
+            attempt
+        @param metrics          RunMetrics (optional) observing every attempt's
+            latency, status and bytes
+        """
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = int(max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_limiter = rate_limiter
+        self.metrics = metrics if metrics else DISABLED
+
+        self.stats = {}
+        self.stats_lock = threading.Lock()
+        return
+
+    @staticmethod
+    def get_endpoint(url):
+        return urllib.parse.urlparse(url).path
+
+    def _get_backoff(self, attempt):
+        # full jitter: uniform in [0, min(cap, base * 2 ^ attempt)]
+        return random.uniform(
+            0, min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        )
+
+    def _record(self, endpoint, latency=None, num_bytes=0, retry=False, failure=False):
+        with self.stats_lock:
+            if endpoint not in self.stats:
+                self.stats[endpoint] = EndpointStats()
+            stats = self.stats[endpoint]
+            if latency is not None:
+                stats.requests += 1
+                stats.latency_total += latency
+                stats.latency_max = max(stats.latency_max, latency)
+            stats.bytes += num_bytes
+            if retry:
+                stats.retries += 1
+            if failure:
+                stats.failures += 1
+        return
+
+    def get(self, url):
+        """
+        GET url, retrying connection errors, timeouts, 429 and 5xx responses.
+
+        @return requests.Response the first response not retried, or the last
+            429 / 5xx response if retries are exhausted
+        @throws RuntimeError if every attempt failed to get a response
+        """
+        endpoint = self.get_endpoint(url)
+        for attempt in range(self.max_retries + 1):
+            backoff = self._get_backoff(attempt)
+            if self.rate_limiter:
+                self.rate_limiter.wait(url)
+            start = time.monotonic()
+            try:
+                response = self.session.get(url, timeout=self.timeout)
+            except (
+                requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout,
+            ) as e:
+                latency = time.monotonic() - start
+                self._record(endpoint, latency=latency)
+                self.metrics.observe_request(endpoint, latency, type(e).__name__)
+                if attempt == self.max_retries:
+                    self._record(endpoint, failure=True)
+                    raise RuntimeError(
+                        "du request failed after {} attempts: {}".format(
+                            attempt + 1, e
+                        )
+                    ) from e
+                print("retrying {} after error {}".format(endpoint, e))
+            else:
+                latency = time.monotonic() - start
+                self._record(
+                    endpoint,
+                    latency=latency,
+                    num_bytes=len(response.content),
+                )
+                self.metrics.observe_request(
+                    endpoint, latency, response.status_code, len(response.content)
+                )
+                retried = is_retried_status(response.status_code)
+                if not retried or attempt == self.max_retries:
+                    if retried:
+                        self._record(endpoint, failure=True)
+                    return response
+                retry_after = get_retry_after(response)
+                if retry_after is not None:
+                    backoff = min(retry_after, self.backoff_max)
+                print(
+                    "retrying {} after status {} in {:.2f}s".format(
+                        endpoint, response.status_code, backoff
+                    )
+                )
+            self._record(endpoint, retry=True)
+            time.sleep(backoff)
+
+    def get_stats(self):
+        with self.stats_lock:
+            return {k: v.to_dict() for k, v in self.stats.items()}
+
+    def print_stats(self):
+        for endpoint, stats in sorted(self.get_stats().items()):
+            print(
+                "{}: {} requests, {} retries, {} failures, {} bytes, "
+                "latency avg {:.3f}s max {:.3f}s".format(
+                    endpoint,
+                    stats["requests"],
+                    stats["retries"],
+                    stats["failures"],
+                    stats["bytes"],
+                    stats["latency_avg"],
+                    stats["latency_max"],
+                )
+            )
+        return
+
+    def close(self):
+        self.session.close()
+        return
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+import contextlib
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+
+from du_stub_server import DuStubServer, synthesize_fixtures
+from du_transport import DuTransport
+from du_url_builder import DuRequestBuilder
+
+DETAIL = "/api/v1/h5/index/fire/flow/product/detail"
+
+
+class TestDuTransport(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.fixtures = tempfile.mkdtemp()
+        synthesize_fixtures(cls.fixtures, products=3, sales=1)
+        return
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.fixtures)
+        return
+
+    def get_detail_url(self, faults=None):
+        server = DuStubServer(self.fixtures, faults).start()
+        self.addCleanup(server.stop)
+        return DuRequestBuilder(base_url=server.base_url).get_product_detail_url(1)
+
+    def make_transport(self, max_retries=3):
+        transport = DuTransport(
+            DuRequestBuilder.du_headers, max_retries=max_retries, backoff_base=0.001
+        )
+        self.addCleanup(transport.close)
+        return transport
+
+    def get(self, transport, url):
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            return transport.get(url)
+
+    def test_5xx_then_200(self):
+        url = self.get_detail_url(
+            {"detail": {"burst_every": 1000, "burst_length": 1, "burst_status": 500}}
+        )
+        transport = self.make_transport()
+        self.assertEqual(self.get(transport, url).status_code, 200)
+        stats = transport.get_stats()[DETAIL]
+        self.assertEqual(
+            (stats["requests"], stats["retries"], stats["failures"]), (2, 1, 0)
+        )
+        self.assertGreater(stats["bytes"], 0)
+
+    def test_retries_exhausted(self):
+        url = self.get_detail_url(
+            {"detail": {"burst_every": 1000, "burst_length": 10, "burst_status": 503}}
+        )
+        transport = self.make_transport(max_retries=2)
+        # the last response is returned for the caller to handle
+        self.assertEqual(self.get(transport, url).status_code, 503)
+        stats = transport.get_stats()[DETAIL]
+        self.assertEqual(
+            (stats["requests"], stats["retries"], stats["failures"]), (3, 2, 1)
+        )
+
+    def test_4xx_is_not_retried(self):
+        url = self.get_detail_url()
+        transport = self.make_transport()
+        # a sign that doesn't match the query
+        response = self.get(transport, url.replace("productId=1", "productId=2"))
+        self.assertEqual(response.json()["status"], 403)
+        self.assertEqual(transport.get_stats()[DETAIL]["retries"], 0)
+
+    def test_connection_errors(self):
+        # a port nothing listens on
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        transport = self.make_transport(max_retries=2)
+        with self.assertRaises(RuntimeError):
+            self.get(transport, "http://127.0.0.1:{}{}".format(port, DETAIL))
+        stats = transport.get_stats()[DETAIL]
+        self.assertEqual(
+            (stats["requests"], stats["retries"], stats["failures"]), (3, 2, 1)
+        )
+
+    def test_backoff_is_capped(self):
+        transport = DuTransport({}, backoff_base=1, backoff_max=5)
+        self.addCleanup(transport.close)
+        for attempt in range(10):
+            self.assertLessEqual(transport._get_backoff(attempt), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
-import execjs
+from du_sign import DuSigner
+from run_metrics import DISABLED
 
 
 class DuRequestBuilder:
@@ -16,17 +17,28 @@ class DuRequestBuilder:
         "Accept": "*/*",
     }
 
-    def __init__(self):
+    default_base_url = "https://app.poizon.com/api/v1/h5"
+
+    def __init__(self, signer=None, base_url=None, metrics=None):
+        """
+        @param signer  object with sign(str) -> str. Defaults to the in-process
+            DuSigner, pass du_sign.ExecJsSigner() to sign with sign.js instead
+        @param base_url  str (optional) e.g. of du_stub_server, instead of
+            app.poizon.com
+        @param metrics  RunMetrics (optional) timing the "sign" stage
+        """
         self.salt = "19bc545a393a25177083d4a748807cc0"
-        self.base_url = "https://app.poizon.com/api/v1/h5"
+        self.base_url = base_url if base_url else self.default_base_url
+        self.signer = signer if signer else DuSigner()
+        self.metrics = metrics if metrics else DISABLED
 
-        with open("sign.js", "r", encoding="utf-8") as f:
-            self.ctx = execjs.compile(f.read())
+    def _sign(self, query):
+        with self.metrics.stage("sign"):
+            return self.signer.sign(query)
 
     def get_recentsales_list_url(self, last_id, product_id, limit=20):
         # recent sales
-        sign = self.ctx.call(
-            "getSign",
+        sign = self._sign(
             "lastId{}limit{}productId{}sourceAppapp{}".format(
                 last_id, limit, product_id, self.salt
             ),
@@ -41,8 +53,7 @@ class DuRequestBuilder:
 
     def get_search_by_keywords_url(self, title, page, sort_mode, sort_type, limit=20):
         # search by keyword
-        sign = self.ctx.call(
-            "getSign",
+        sign = self._sign(
             "limit{}page{}sortMode{}sortType{}title{}unionId{}".format(
                 limit, page, sort_mode, sort_type, title, self.salt
             ),
@@ -58,9 +69,8 @@ class DuRequestBuilder:
 
     def get_brand_list_url(self, last_id, tab_id, limit=20):
         # list
-        sign = self.ctx.call(
-            "getSign",
-            "lastId{}limit{}tabId{}{}".format(last_id, limit, tab_id, self.salt),
+        sign = self._sign(
+            "lastId{}limit{}tabId{}{}".format(last_id, limit, tab_id, self.salt)
         )
         url = (
             self.base_url + "/index/fire/shoppingTab?"
@@ -70,8 +80,8 @@ class DuRequestBuilder:
 
     def get_product_detail_url(self, product_id):
         # product details
-        sign = self.ctx.call(
-            "getSign", "productId{}productSourceNamewx{}".format(product_id, self.salt)
+        sign = self._sign(
+            "productId{}productSourceNamewx{}".format(product_id, self.salt)
         )
         url = (
             self.base_url + "/index/fire/flow/product/detail?"
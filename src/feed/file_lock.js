@@ -0,0 +1,118 @@
+const crypto = require('crypto');
+const fs = require('fs');
+const os = require('os');
+
+// Advisory lock of a data/{style_id}/ folder and atomic file replacement, the
+// same protocol as file_lock.py so the stockx and du feeds can update the same
+// files at the same time: whoever creates data/{style_id}/.lock exclusively
+// holds it and only removes it if it still holds its token, a lock older than
+// staleSeconds is left over by a crashed writer and broken (renamed aside, then
+// removed if it is the same file), files are written aside and renamed over
+// the original.
+const LOCK_FILE = ".lock";
+
+function sleepSync(ms) {
+    Atomics.wait(new Int32Array(new SharedArrayBuffer(4)), 0, 0, ms);
+}
+
+class FileLock {
+    constructor(path, timeout, staleSeconds, pollSeconds) {
+        this.path = path;
+        this.timeout = timeout === undefined ? 60 : timeout;
+        this.staleSeconds = staleSeconds === undefined ? 120 : staleSeconds;
+        this.pollSeconds = pollSeconds === undefined ? 0.005 : pollSeconds;
+        this.owner = undefined;
+    }
+
+    breakIfStale() {
+        let stat;
+        try {
+            stat = fs.statSync(this.path, {bigint: true});
+        } catch (e) {
+            return;
+        }
+        let age = (Date.now() - Number(stat.mtimeMs)) / 1000;
+        if (age <= this.staleSeconds) {
+            return;
+        }
+        // move it under a name of our own first: of the waiters that saw it
+        // stale, only one moves it, and that one checks it moved the file it saw
+        let stalePath = this.path + "." + process.pid + ".stale";
+        try {
+            fs.renameSync(this.path, stalePath);
+        } catch (e) {
+            return;
+        }
+        let moved = fs.statSync(stalePath, {bigint: true});
+        // inode numbers are reused right away, a fresh lock has a new mtime
+        if (moved.ino !== stat.ino || moved.mtimeNs !== stat.mtimeNs) {
+            // another waiter broke it and took the lock in between, give it back
+            try {
+                fs.linkSync(stalePath, this.path);
+            } catch (e) {
+                console.log("lock " + this.path + " was taken while restoring it");
+            }
+        } else {
+            console.log("removing stale lock " + this.path + " (" + Math.round(age) + "s old)");
+        }
+        fs.unlinkSync(stalePath);
+    }
+
+    acquire() {
+        let deadline = Date.now() + this.timeout * 1000;
+        while (true) {
+            let fd;
+            try {
+                fd = fs.openSync(this.path, "wx");
+            } catch (e) {
+                if (e.code !== "EEXIST") {
+                    throw e;
+                }
+                this.breakIfStale();
+                if (Date.now() > deadline) {
+                    throw new Error("timed out after " + this.timeout + "s waiting for lock " + this.path);
+                }
+                // jitter so waiters don't retry in lockstep
+                sleepSync(this.pollSeconds * 1000 * (0.5 + Math.random()));
+                continue;
+            }
+            this.owner = os.hostname() + " " + process.pid + " " + crypto.randomBytes(16).toString("hex") + "\n";
+            fs.writeSync(fd, this.owner);
+            fs.closeSync(fd);
+            return this;
+        }
+    }
+
+    release() {
+        let owner;
+        try {
+            owner = fs.readFileSync(this.path, "utf8");
+        } catch (e) {
+            owner = undefined;
+        }
+        if (owner !== this.owner) {
+            // held past staleSeconds, broken and maybe taken by someone else
+            console.log("lock " + this.path + " is no longer ours, leaving it");
+            return;
+        }
+        fs.unlinkSync(this.path);
+    }
+
+    // run fn holding the lock
+    withLock(fn) {
+        this.acquire();
+        try {
+            return fn();
+        } finally {
+            this.release();
+        }
+    }
+}
+
+function atomicWrite(path, content) {
+    let tmpPath = path + "." + process.pid + ".tmp";
+    fs.writeFileSync(tmpPath, content);
+    fs.renameSync(tmpPath, path);
+}
+
+module.exports = {FileLock, LOCK_FILE, atomicWrite};
@@ -0,0 +1,120 @@
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+
+"""
+Advisory locking and atomic replacement of data files shared by feeds.
+
+The protocol is shared with file_lock.js, so the du feed (python) and the
+stockx feed (node) can update the same data/{style_id}/ folder at the same
+time:
+  - a writer holds data/{style_id}/.lock while it reads, modifies and writes
+    any file of the style. The lock file is created with O_CREAT | O_EXCL, and
+    holds "host pid token" of its owner, who only removes it if it still holds
+    that. Others poll until it is gone.
+  - a lock file older than stale_seconds is left over by a crashed writer (locks
+    are held for milliseconds) and is broken by whoever is waiting on it: renamed
+    to a name of the waiter's own, then removed if it is still the same file.
+  - files are written aside to a temp file next to them, then renamed over the
+    original, so readers, which never lock, see either the old or the new file,
+    never a truncated one.
+"""
+
+LOCK_FILE = ".lock"
+
+
+class FileLock:
+    def __init__(self, path, timeout=60, stale_seconds=120, poll_seconds=0.005):
+        self.path = path
+        self.timeout = timeout
+        self.stale_seconds = stale_seconds
+        self.poll_seconds = poll_seconds
+        self.owner = None
+        return
+
+    def _break_if_stale(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        age = time.time() - stat.st_mtime
+        if age <= self.stale_seconds:
+            return
+        # move it under a name of our own first: of the waiters that saw it
+        # stale, only one moves it, and that one checks it moved the file it saw
+        stale_path = "{}.{}.{}.stale".format(
+            self.path, os.getpid(), threading.get_ident()
+        )
+        try:
+            os.rename(self.path, stale_path)
+        except FileNotFoundError:
+            return
+        moved = os.stat(stale_path)
+        # inode numbers are reused right away, a fresh lock has a new mtime
+        if (moved.st_ino, moved.st_mtime_ns) != (stat.st_ino, stat.st_mtime_ns):
+            # another waiter broke it and took the lock in between, give it back
+            try:
+                os.link(stale_path, self.path)
+            except FileExistsError:
+                print("lock {} was taken while restoring it".format(self.path))
+        else:
+            print("removing stale lock {} ({:.0f}s old)".format(self.path, age))
+        os.remove(stale_path)
+        return
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                self._break_if_stale()
+                if time.monotonic() > deadline:
+                    raise RuntimeError(
+                        "timed out after {}s waiting for lock {}".format(
+                            self.timeout, self.path
+                        )
+                    )
+                # jitter so waiters don't retry in lockstep
+                time.sleep(self.poll_seconds * (0.5 + random.random()))
+                continue
+            self.owner = "{} {} {}\n".format(
+                socket.gethostname(), os.getpid(), uuid.uuid4().hex
+            )
+            with os.fdopen(fd, "w") as lockfile:
+                lockfile.write(self.owner)
+            return self
+
+    def release(self):
+        try:
+            with open(self.path, "r") as lockfile:
+                owner = lockfile.read()
+        except FileNotFoundError:
+            owner = None
+        if owner != self.owner:
+            # held past stale_seconds, broken and maybe taken by someone else
+            print("lock {} is no longer ours, leaving it".format(self.path))
+            return
+        os.remove(self.path)
+        return
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
+
+
+def atomic_write(path, content):
+    """
+    Replace path with content, readers never see a partially written file
+    """
+    tmp_file_path = "{}.{}.{}.tmp".format(path, os.getpid(), threading.get_ident())
+    with open(tmp_file_path, "w") as outfile:
+        outfile.write(content)
+    os.replace(tmp_file_path, path)
+    return
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+
+import datetime
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import file_lock
+from file_lock import FileLock
+from time_series_serializer import TimeSeriesSerializer
+
+UPDATES = 100
+SIZES = ["9", "9.5", "10"]
+
+# stockx feed side of the stress test, run in the data folder's sibling so the
+# serializer's ../data is the test's data folder
+STOCKX_UPDATES_JS = """
+const TimeSeriesSerializer = require(process.argv[1]);
+const serializer = new TimeSeriesSerializer("json");
+const prices = {bestBid: 100, bestAsk: 120, annualHigh: 150, annualLow: 90,
+    volatility: 0.1, salesLast72Hours: 3, numberOfAsks: 10, numberOfBids: 5};
+let sizePrices = {};
+for (let size of process.argv[3].split(",")) {
+    sizePrices[size] = prices;
+}
+for (let i = 0; i < parseInt(process.argv[2]); i++) {
+    serializer.update(new Date(), "S1", sizePrices);
+}
+"""
+
+
+def python_updates(data_folder, venue, updates):
+    serializer = TimeSeriesSerializer(data_folder)
+    for i in range(updates):
+        serializer.update(
+            venue,
+            datetime.datetime.utcnow(),
+            "S1",
+            {size: {"list_price": 50000 + i} for size in SIZES},
+            {
+                size: [
+                    {
+                        "id": str(i),
+                        "price": 50000 + i,
+                        "time": "2026-10-01T00:00:00.000Z",
+                    }
+                ]
+                for size in SIZES
+            },
+        )
+    return
+
+
+def can_run_node():
+    try:
+        subprocess.run(
+            [
+                "node",
+                "-e",
+                "require(process.argv[1])",
+                os.path.abspath("time_series_serializer.js"),
+            ],
+            check=True,
+            capture_output=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return False
+    return True
+
+
+class TestFileLock(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+        self.data_folder = os.path.join(self.folder, "data")
+        return
+
+    def check_files(self, venues):
+        serializer = TimeSeriesSerializer(self.data_folder)
+        size_prices = serializer.get("S1")
+        self.assertEqual(sorted(size_prices), sorted(SIZES))
+        for size in SIZES:
+            for venue in venues:
+                self.assertEqual(len(size_prices[size][venue]["prices"]), UPDATES)
+        # the manifest matches every file, nothing is summarized from scratch
+        manifest = serializer._read_summary("S1")
+        fingerprints = serializer.get_fingerprints("S1")
+        for size in SIZES:
+            self.assertEqual(
+                manifest[size]["fingerprint"], [str(x) for x in fingerprints[size]]
+            )
+            self.assertEqual(manifest[size]["summary"]["du"]["price_count"], UPDATES)
+        leftovers = [
+            f
+            for f in os.listdir(os.path.join(self.data_folder, "S1"))
+            if f.endswith(".tmp") or f == ".lock"
+        ]
+        self.assertEqual(leftovers, [])
+
+    def test_both_venues_in_parallel(self):
+        workers = [
+            multiprocessing.Process(
+                target=python_updates, args=(self.data_folder, venue, UPDATES)
+            )
+            for venue in ["du", "stockx"]
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+            self.assertEqual(worker.exitcode, 0)
+        self.check_files(["du", "stockx"])
+
+    @unittest.skipUnless(can_run_node(), "node or the feed's node modules missing")
+    def test_du_and_stockx_feeds_in_parallel(self):
+        feed_folder = os.path.join(self.folder, "feed")
+        os.makedirs(feed_folder)
+        stockx = subprocess.Popen(
+            [
+                "node",
+                "-e",
+                STOCKX_UPDATES_JS,
+                os.path.abspath("time_series_serializer.js"),
+                str(UPDATES),
+                ",".join(SIZES),
+            ],
+            cwd=feed_folder,
+            stdout=subprocess.DEVNULL,
+        )
+        python_updates(self.data_folder, "du", UPDATES)
+        self.assertEqual(stockx.wait(), 0)
+        self.check_files(["du", "stockx"])
+
+    def test_stale_lock_is_removed(self):
+        os.makedirs(os.path.join(self.data_folder, "S1"))
+        lock_path = os.path.join(self.data_folder, "S1", ".lock")
+        with open(lock_path, "w") as lockfile:
+            lockfile.write("crashed 1\n")
+        stale = time.time() - 3600
+        os.utime(lock_path, (stale, stale))
+        python_updates(self.data_folder, "du", 1)
+        self.assertFalse(os.path.exists(lock_path))
+
+        with FileLock(lock_path):
+            with self.assertRaises(RuntimeError):
+                FileLock(lock_path, timeout=0.05).acquire()
+
+    def test_fresh_lock_is_not_broken(self):
+        lock_path = os.path.join(self.folder, ".lock")
+        with open(lock_path, "w") as lockfile:
+            lockfile.write("crashed 1\n")
+        stale = time.time() - 3600
+        os.utime(lock_path, (stale, stale))
+        rename = os.rename
+        fresh = FileLock(lock_path)
+
+        def break_and_take_first(src, dst):
+            # another waiter breaks the stale lock and takes it in between
+            os.remove(lock_path)
+            fresh.acquire()
+            return rename(src, dst)
+
+        with mock.patch.object(file_lock.os, "rename", break_and_take_first):
+            FileLock(lock_path)._break_if_stale()
+        with open(lock_path, "r") as lockfile:
+            self.assertEqual(lockfile.read(), fresh.owner)
+        self.assertEqual(os.listdir(self.folder), [".lock"])
+
+        # held past stale_seconds, broken and taken by another writer
+        os.remove(lock_path)
+        other = FileLock(lock_path).acquire()
+        fresh.release()
+        self.assertTrue(os.path.exists(lock_path))
+        other.release()
+        self.assertFalse(os.path.exists(lock_path))
+
+
+if __name__ == "__main__":
+    unittest.main()
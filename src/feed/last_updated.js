@@ -1,12 +1,86 @@
 const csvParser = require('csv-parser');
 const fs = require('fs');
 const createCsvWriter = require('csv-writer').createObjectCsvWriter;
+const {FileLock, LOCK_FILE} = require('./file_lock.js');
 
+// same as the time formats LastUpdatedSerializer.parse_time accepts in python
+const TIME_REGEX = /^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d{1,6})?Z$/;
+
+function isTime(timeStr) {
+    return TIME_REGEX.test(timeStr) && !isNaN(Date.parse(timeStr));
+}
+
+// a row the way python's csv.writer writes it: fields holding a delimiter,
+// quote or line break are quoted, quotes doubled
+function formatCsvRow(fields) {
+    return fields.map((field) => {
+        field = String(field);
+        if (/[",\r\n]/.test(field)) {
+            return '"' + field.replace(/"/g, '""') + '"';
+        }
+        return field;
+    }).join(',') + '\n';
+}
+
+// rows of content the way python's csv.reader reads them
+function parseCsvRows(content) {
+    let rows = [];
+    let row = [];
+    let field = '';
+    let quoted = false;
+    let i = 0;
+    while (i < content.length) {
+        let c = content[i];
+        if (quoted) {
+            if (c === '"' && content[i + 1] === '"') {
+                field += '"';
+                i++;
+            } else if (c === '"') {
+                quoted = false;
+            } else {
+                field += c;
+            }
+        } else if (c === '"' && field === '') {
+            quoted = true;
+        } else if (c === ',') {
+            row.push(field);
+            field = '';
+        } else if (c === '\n' || c === '\r') {
+            if (c === '\r' && content[i + 1] === '\n') {
+                i++;
+            }
+            row.push(field);
+            rows.push(row);
+            row = [];
+            field = '';
+        } else {
+            field += c;
+        }
+        i++;
+    }
+    if (field !== '' || row.length > 0) {
+        row.push(field);
+        rows.push(row);
+    }
+    return rows;
+}
+
+// In journaled mode this reads and writes the same snapshot + journal format as
+// last_updated.py: "style_id,venue,time" lines in lastUpdatedFile (snapshot) and
+// lastUpdatedFile.journal (appended on every update), quoted as python's csv
+// module quotes them. Files of the positional format written without journaling
+// are converted as they are loaded. Loading, appending and compacting hold
+// lastUpdatedFile.lock, the file_lock.js protocol.
 class LastUpdatedSerializer {
-    constructor(lastUpdatedFile, minUpdateTime) {
+    constructor(lastUpdatedFile, minUpdateTime, journaled) {
         this.lastUpdatedFile = lastUpdatedFile;
+        this.journalFile = lastUpdatedFile + '.journal';
         this.minUpdateTime = minUpdateTime;
+        this.journaled = journaled === true;
+        this.venue = 'stockx';
         this.lastUpdated = {};
+        // every venue's entries, kept to write them back on compaction
+        this.allLastUpdated = {};
     }
     shouldUpdate(styleId) {
         if (this.minUpdateTime === undefined || this.lastUpdated[styleId] === undefined) {
@@ -17,9 +91,100 @@ class LastUpdatedSerializer {
     }
     updateLastUpdated(styleId) {
         this.lastUpdated[styleId] = new Date();
+        if (this.journaled) {
+            this.setAllLastUpdated(styleId, this.venue, this.lastUpdated[styleId]);
+            this.lock().withLock(() => {
+                fs.appendFileSync(this.journalFile,
+                    formatCsvRow([styleId, this.venue, this.lastUpdated[styleId].toISOString()]));
+            });
+        }
         return;
     }
+    setAllLastUpdated(styleId, venue, time) {
+        if (this.allLastUpdated[styleId] === undefined) {
+            this.allLastUpdated[styleId] = {};
+        }
+        let current = this.allLastUpdated[styleId][venue];
+        if (current === undefined || current < time) {
+            this.allLastUpdated[styleId][venue] = time;
+        }
+        if (venue === this.venue) {
+            this.lastUpdated[styleId] = this.allLastUpdated[styleId][venue];
+        }
+    }
+    // rows of the positional format written without journaling are converted:
+    // "style_id,du time,stockx time,flightclub time" (last_updated.py) or
+    // "style_id,stockx time" under a "style_id,stockx_last_updated" header
+    replayLines(content) {
+        let columns = ['du', 'stockx', 'flightclub'];
+        for (let row of parseCsvRows(content)) {
+            if (row.length < 2) {
+                continue;
+            }
+            if (row[0] === 'style_id') {
+                columns = row.slice(1).map((column) => column.replace('_last_updated', ''));
+                continue;
+            }
+            let records;
+            if (row[1] === '' || isTime(row[1])) {
+                records = [];
+                for (let i = 1; i < row.length && i <= columns.length; i++) {
+                    if (row[i] !== '') {
+                        records.push([row[0], columns[i - 1], row[i]]);
+                    }
+                }
+            } else if (row.length === 3) {
+                records = [row];
+            } else {
+                console.log('skipping malformed last_updated record ' + row);
+                continue;
+            }
+            for (let [styleId, venue, timeStr] of records) {
+                if (!isTime(timeStr)) {
+                    console.log('skipping malformed last_updated record ' + row);
+                    continue;
+                }
+                this.setAllLastUpdated(styleId, venue, new Date(Date.parse(timeStr)));
+            }
+        }
+    }
+    lock() {
+        return new FileLock(this.lastUpdatedFile + LOCK_FILE);
+    }
+    // the caller holds the lock, so no compaction moves the journal into the
+    // snapshot in between
+    replayJournal() {
+        if (fs.existsSync(this.lastUpdatedFile)) {
+            this.replayLines(fs.readFileSync(this.lastUpdatedFile, 'utf8'));
+        }
+        if (fs.existsSync(this.journalFile)) {
+            this.replayLines(fs.readFileSync(this.journalFile, 'utf8'));
+        }
+    }
+    compactJournal() {
+        this.lock().withLock(() => {
+            this.replayJournal();
+
+            let lines = [];
+            for (let styleId in this.allLastUpdated) {
+                for (let venue in this.allLastUpdated[styleId]) {
+                    lines.push(formatCsvRow([styleId, venue, this.allLastUpdated[styleId][venue].toISOString()]));
+                }
+            }
+            let tmpFile = this.lastUpdatedFile + '.tmp';
+            fs.writeFileSync(tmpFile, lines.join(''));
+            fs.renameSync(tmpFile, this.lastUpdatedFile);
+            if (fs.existsSync(this.journalFile)) {
+                fs.unlinkSync(this.journalFile);
+            }
+        });
+        console.log('Done compacting last updated to ' + this.lastUpdatedFile);
+    }
     dumps() {
+        if (this.journaled) {
+            this.compactJournal();
+            return;
+        }
         const csvWriter = createCsvWriter({
             path: this.lastUpdatedFile,
             header: [
@@ -41,6 +206,11 @@ class LastUpdatedSerializer {
         return;
     }
     loads(callback) {
+        if (this.journaled) {
+            this.lock().withLock(() => this.replayJournal());
+            callback();
+            return;
+        }
         if (fs.existsSync(this.lastUpdatedFile)) {
             fs.createReadStream(this.lastUpdatedFile)
                 .pipe(csvParser())
@@ -5,6 +5,8 @@ import os
 import datetime
 import time
 
+from file_lock import FileLock, LOCK_FILE
+
 """
 Encapsulates reading and writing of last updated.
 Last updated keeps track of the last time we updated a model, feed loads this
@@ -13,44 +15,158 @@ in to decide if we should get another reading in this run.
 @note saving to file is done in one go. Should a program updating multiple
 entries crash in the process, it probably should save the ones successfully
 updated on exit.
+
+In journaled mode every update is instead appended to {file}.journal as one
+"style_id,venue,time" line as it happens, and {file} is a snapshot of the same
+lines. Loading replays snapshot then journal, keeping the latest time of each
+(style_id, venue). Files of the positional format written without journaling
+are converted as they are loaded, and either format can be loaded without
+journaling. Compaction merges the journal into a new snapshot written
+aside and renamed over, then removes the journal. The same format is read and
+written by last_updated.js, so du and stockx feeds can share one file: loading,
+appending and compacting all hold {file}.lock (see file_lock.py), so no append
+is lost to a compaction and compactions don't interleave.
 """
 
 
 class LastUpdatedSerializer:
-    def __init__(self, last_updated_file, min_update_time=None):
+    def __init__(
+        self,
+        last_updated_file,
+        min_update_time=None,
+        journaled=False,
+        compact_every=1000,
+    ):
         self.dst_file_path = last_updated_file
+        self.journal_file_path = last_updated_file + ".journal"
+        self.journaled = journaled
+        self.compact_every = compact_every
+        self.journaled_since_compact = 0
         self.last_updated = {}
         self.columns = ["du", "stockx", "flightclub"]
         self.min_update_time = (
             float(min_update_time) if min_update_time is not None else 0
         )
-        if os.path.isfile(last_updated_file):
-            self.load_last_updated()
+        self.load_last_updated()
+
+    @staticmethod
+    def parse_time(time_str):
+        try:
+            return datetime.datetime.strptime(time_str, "%Y-%m-%dT%H:%M:%S.%fZ")
+        except ValueError:
+            return datetime.datetime.strptime(time_str, "%Y-%m-%dT%H:%M:%SZ")
+
+    @classmethod
+    def is_time(cls, time_str):
+        try:
+            cls.parse_time(time_str)
+        except ValueError:
+            return False
+        return True
+
+    def _replay_lines(self, infile):
+        """
+        Merge "style_id,venue,time" rows into memory, converting rows of the
+        positional format written without journaling on the fly: either
+        "style_id,du time,stockx time,flightclub time" (last_updated.py) or
+        "style_id,stockx time" under a "style_id,stockx_last_updated" header
+        (last_updated.js).
+        """
+        columns = self.columns
+        for row in csv.reader(infile):
+            if len(row) < 2:
+                continue
+            if row[0] == "style_id":
+                columns = [column.replace("_last_updated", "") for column in row[1:]]
+                continue
+            if row[1] == "" or self.is_time(row[1]):
+                records = [
+                    (row[0], venue, time_str)
+                    for venue, time_str in zip(columns, row[1:])
+                    if time_str
+                ]
+            elif len(row) == 3:
+                records = [row]
+            else:
+                print("skipping malformed last_updated record {}".format(row))
+                continue
+            for style_id, venue, time_str in records:
+                try:
+                    update_time = self.parse_time(time_str)
+                except ValueError:
+                    print("skipping malformed last_updated record {}".format(row))
+                    continue
+                if style_id not in self.last_updated:
+                    self.last_updated[style_id] = {}
+                if (
+                    venue not in self.last_updated[style_id]
+                    or self.last_updated[style_id][venue] < update_time
+                ):
+                    self.last_updated[style_id][venue] = update_time
+
+    def _lock(self):
+        return FileLock(self.dst_file_path + LOCK_FILE)
+
+    def replay_journal(self):
+        """
+        Merge snapshot and journal into memory. The caller holds the lock, so
+        no compaction moves the journal into the snapshot in between.
+        """
+        if os.path.isfile(self.dst_file_path):
+            with open(self.dst_file_path, "r", newline="") as infile:
+                self._replay_lines(infile)
+        if os.path.isfile(self.journal_file_path):
+            with open(self.journal_file_path, "r", newline="") as infile:
+                self._replay_lines(infile)
+
+    def append_journal(self, style_id, venue, update_time):
+        with self._lock():
+            with open(self.journal_file_path, "a", newline="") as outfile:
+                csv.writer(outfile, lineterminator="\n").writerow(
+                    [style_id, venue, update_time.isoformat() + "Z"]
+                )
+                outfile.flush()
+                os.fsync(outfile.fileno())
+        self.journaled_since_compact += 1
+
+    def compact_journal(self):
+        with self._lock():
+            # pick up what other writers journaled before writing the snapshot
+            self.replay_journal()
+
+            tmp_file_path = self.dst_file_path + ".tmp"
+            with open(tmp_file_path, "w", newline="") as outfile:
+                wr = csv.writer(outfile, lineterminator="\n")
+                for style_id in self.last_updated:
+                    for venue in self.last_updated[style_id]:
+                        wr.writerow(
+                            [
+                                style_id,
+                                venue,
+                                self.last_updated[style_id][venue].isoformat() + "Z",
+                            ]
+                        )
+                outfile.flush()
+                os.fsync(outfile.fileno())
+            os.replace(tmp_file_path, self.dst_file_path)
+            if os.path.isfile(self.journal_file_path):
+                os.remove(self.journal_file_path)
+        self.journaled_since_compact = 0
 
     def load_last_updated(self):
-        with open(self.dst_file_path) as infile:
-            rr = csv.reader(infile)
-            for row in rr:
-                style_id = row[0]
-                self.last_updated[style_id] = {}
-
-                for i in range(len(self.columns)):
-                    if i + 1 < len(row):
-                        try:
-                            self.last_updated[style_id][
-                                self.columns[i]
-                            ] = datetime.datetime.strptime(
-                                row[i + 1], "%Y-%m-%dT%H:%M:%S.%fZ"
-                            )
-                        except ValueError:
-                            self.last_updated[style_id][
-                                self.columns[i]
-                            ] = datetime.datetime.strptime(row[i + 1], "%Y-%m-%dT%H:%M:%SZ")
+        """
+        Load a file of either format, e.g. when journaling was turned off. Its
+        journal is replayed too, as it may hold updates not compacted yet.
+        """
+        with self._lock():
+            self.replay_journal()
 
     def update_last_updated(self, style_id, venue):
         if style_id not in self.last_updated:
             self.last_updated[style_id] = {}
         self.last_updated[style_id][venue] = datetime.datetime.utcnow()
+        if self.journaled:
+            self.append_journal(style_id, venue, self.last_updated[style_id][venue])
         return self.last_updated[style_id][venue]
 
     def should_update(self, style_id, venue):
@@ -64,13 +180,24 @@ class LastUpdatedSerializer:
             else:
                 return True
 
-    def save_last_updated(self):
+    def save_last_updated(self, force_compact=False):
+        if self.journaled:
+            # updates are already durable in the journal
+            if force_compact or self.journaled_since_compact >= self.compact_every:
+                self.compact_journal()
+            return
         with open(self.dst_file_path, "w") as outfile:
             wr = csv.writer(outfile)
             for style_id in self.last_updated:
+                # positional, an empty field for venues never updated
                 out_list = [style_id]
-                for venue in self.last_updated[style_id]:
-                    out_list.append(
-                        self.last_updated[style_id][venue].isoformat() + "Z"
-                    )
+                for venue in self.columns:
+                    if venue in self.last_updated[style_id]:
+                        out_list.append(
+                            self.last_updated[style_id][venue].isoformat() + "Z"
+                        )
+                    else:
+                        out_list.append("")
+                while out_list[-1] == "":
+                    out_list.pop()
                 wr.writerow(out_list)
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+
+import datetime
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from last_updated import LastUpdatedSerializer
+
+UPDATES = 200
+
+T1 = "2026-10-01T00:00:00.000000Z"
+T2 = "2026-10-02T00:00:00.000000Z"
+
+
+# stockx feed side of the round trip: load the journaled file, update a style
+# and compact
+STOCKX_UPDATE_JS = """
+const LastUpdatedSerializer = require(process.argv[1]);
+let serializer = new LastUpdatedSerializer(process.argv[2], undefined, true);
+serializer.loads(() => {
+    console.log(JSON.stringify(Object.keys(serializer.allLastUpdated).sort()));
+    serializer.updateLastUpdated(process.argv[3]);
+    serializer.dumps();
+});
+"""
+
+
+def can_run_node():
+    try:
+        subprocess.run(
+            [
+                "node",
+                "-e",
+                "require(process.argv[1])",
+                os.path.abspath("last_updated.js"),
+            ],
+            check=True,
+            capture_output=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return False
+    return True
+
+
+def journal_updates(path, worker):
+    serializer = LastUpdatedSerializer(path, journaled=True, compact_every=20)
+    for i in range(UPDATES):
+        serializer.update_last_updated("W{}-{}".format(worker, i), "du")
+        serializer.save_last_updated()
+    return
+
+
+class TestLastUpdated(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+        self.path = os.path.join(self.folder, "last_updated.log")
+        return
+
+    def write(self, path, lines):
+        with open(path, "w") as outfile:
+            outfile.write("".join(line + "\n" for line in lines))
+        return
+
+    def test_positional_files_are_converted(self):
+        t1 = LastUpdatedSerializer.parse_time(T1)
+        t2 = LastUpdatedSerializer.parse_time(T2)
+        self.write(self.path, ["S1,{}".format(T1), "S2,{},{}".format(T1, T2)])
+        expected = {"S1": {"du": t1}, "S2": {"du": t1, "stockx": t2}}
+        self.assertEqual(
+            LastUpdatedSerializer(self.path, journaled=True).last_updated, expected
+        )
+
+        stockx_path = os.path.join(self.folder, "last_updated_stockx.log")
+        self.write(stockx_path, ["style_id,stockx_last_updated", "S1,{}".format(T2)])
+        self.assertEqual(
+            LastUpdatedSerializer(stockx_path, journaled=True).last_updated,
+            {"S1": {"stockx": t2}},
+        )
+
+    def test_journaling_turned_off(self):
+        journaled = LastUpdatedSerializer(self.path, journaled=True)
+        journaled.last_updated["S1"] = {"stockx": datetime.datetime(2026, 10, 1)}
+        journaled.save_last_updated(force_compact=True)
+        journaled.update_last_updated("S2", "du")
+        expected = dict(journaled.last_updated)
+
+        serializer = LastUpdatedSerializer(self.path)
+        self.assertEqual(serializer.last_updated, expected)
+        serializer.save_last_updated()
+        os.remove(self.path + ".journal")
+        self.assertEqual(LastUpdatedSerializer(self.path).last_updated, expected)
+
+    def test_concurrent_compactions_lose_nothing(self):
+        workers = [
+            multiprocessing.Process(target=journal_updates, args=(self.path, worker))
+            for worker in range(2)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+            self.assertEqual(worker.exitcode, 0)
+        self.assertEqual(
+            sorted(LastUpdatedSerializer(self.path, journaled=True).last_updated),
+            sorted(
+                "W{}-{}".format(worker, i)
+                for worker in range(2)
+                for i in range(UPDATES)
+            ),
+        )
+        self.assertFalse(os.path.exists(self.path + ".lock"))
+
+    @unittest.skipUnless(can_run_node(), "node or the feed's node modules missing")
+    def test_quoted_style_ids_round_trip_with_js(self):
+        serializer = LastUpdatedSerializer(self.path, journaled=True)
+        serializer.update_last_updated("B,2", "du")
+        serializer.update_last_updated("S1", "du")
+        output = subprocess.run(
+            [
+                "node",
+                "-e",
+                STOCKX_UPDATE_JS,
+                os.path.abspath("last_updated.js"),
+                self.path,
+                'Q"3',
+            ],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        self.assertIn(json.dumps(["B,2", "S1"]).replace(" ", ""), output)
+
+        loaded = LastUpdatedSerializer(self.path, journaled=True).last_updated
+        self.assertEqual(
+            {k: sorted(v) for k, v in loaded.items()},
+            {"B,2": ["du"], "S1": ["du"], 'Q"3': ["stockx"]},
+        )
+        # js keeps milliseconds
+        self.assertLess(
+            abs(loaded["B,2"]["du"] - serializer.last_updated["B,2"]["du"]),
+            datetime.timedelta(milliseconds=1),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
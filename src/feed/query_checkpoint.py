@@ -0,0 +1,104 @@
+import json
+import os
+
+from du_response_parser import DuItem
+from file_lock import atomic_write
+
+"""
+Encapsulates the checkpoint of a query mode crawl, so an interrupted crawl can
+be resumed (du_feed.py --mode query --resume) without redoing its work.
+
+The checkpoint is two files:
+  - {file}.items.jsonl: the static info of every item detailed so far, one JSON
+    line each, appended as soon as the item is detailed
+  - {file}: the cursor, the search pages of each keyword that were fully
+    processed, replaced atomically after each page
+
+A crawl started without --resume refuses to run over an existing checkpoint.
+A resumed crawl starts from the checkpointed items, so their details aren't
+fetched again, and skips the pages in the cursor. Pages that failed are not in
+the cursor and are retried. Items of a page that was interrupted halfway are
+checkpointed already, the page is searched again but only its new items are
+detailed.
+"""
+
+
+class QueryCheckpoint:
+    def __init__(self, checkpoint_file, resume=False):
+        self.cursor_file_path = checkpoint_file
+        self.items_file_path = checkpoint_file + ".items.jsonl"
+        # {keyword: set of pages}
+        self.completed_pages = {}
+        self.items = {}
+        if resume:
+            self.load()
+        elif self.exists():
+            # a forgotten --resume would throw the interrupted crawl away
+            raise RuntimeError(
+                "{} exists, rerun with --resume to continue its crawl, or remove "
+                "it and {} to start over".format(
+                    self.cursor_file_path, self.items_file_path
+                )
+            )
+
+    def exists(self):
+        return os.path.isfile(self.cursor_file_path) or os.path.isfile(
+            self.items_file_path
+        )
+
+    def load(self):
+        if os.path.isfile(self.cursor_file_path):
+            with open(self.cursor_file_path, "r") as infile:
+                cursor = json.loads(infile.read())
+            self.completed_pages = {
+                keyword: set(pages) for keyword, pages in cursor["pages"].items()
+            }
+        if os.path.isfile(self.items_file_path):
+            with open(self.items_file_path, "r") as infile:
+                for line in infile:
+                    try:
+                        info = json.loads(line)
+                    except ValueError:
+                        # a torn trailing write from an interrupted crawl
+                        print("skipping malformed checkpointed item {}".format(line))
+                        continue
+                    item = DuItem(info["product_id"], info["title"], 0)
+                    item.populate_details(
+                        info["style_id"], {}, info["release_date"], info["gender"]
+                    )
+                    self.items[item.product_id] = item
+        print(
+            "resuming from {} items and {} completed pages".format(
+                len(self.items),
+                sum(len(pages) for pages in self.completed_pages.values()),
+            )
+        )
+
+    def is_page_completed(self, keyword, page):
+        return page in self.completed_pages.get(keyword, ())
+
+    def add_item(self, item):
+        with open(self.items_file_path, "a") as outfile:
+            outfile.write(json.dumps(item.get_static_info()) + "\n")
+            outfile.flush()
+            os.fsync(outfile.fileno())
+        self.items[item.product_id] = item
+
+    def complete_page(self, keyword, page):
+        self.completed_pages.setdefault(keyword, set()).add(page)
+        atomic_write(
+            self.cursor_file_path,
+            json.dumps(
+                {
+                    "pages": {
+                        keyword: sorted(pages)
+                        for keyword, pages in self.completed_pages.items()
+                    }
+                }
+            ),
+        )
+
+    def remove(self):
+        for path in [self.cursor_file_path, self.items_file_path]:
+            if os.path.isfile(path):
+                os.remove(path)
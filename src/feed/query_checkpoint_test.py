@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import du_feed
+from du_stub_server import DuStubServer, synthesize_fixtures
+from static_info_serializer import StaticInfoSerializer
+
+PRODUCTS = 30
+
+
+class TestQueryCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+        # query mode writes its mapping file to the working directory
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.folder)
+        return
+
+    def test_resume_does_not_query_twice(self):
+        synthesize_fixtures("fixtures", products=PRODUCTS, sales=1)
+        server = DuStubServer("fixtures").start()
+        self.addCleanup(server.stop)
+        argv = ["--mode", "query", "--kw", "aj", "--pages", "2"]
+        argv += ["--base_url", server.base_url]
+
+        detailed = []
+        searched = []
+        populate_item_details = du_feed.DuFeed._populate_item_details
+        send_du_request = du_feed.DuFeed._send_du_request
+
+        def populate_or_interrupt(feed, item, product_id):
+            # interrupted halfway through the second page
+            if len(detailed) == 25:
+                raise KeyboardInterrupt()
+            detailed.append(product_id)
+            return populate_item_details(feed, item, product_id)
+
+        def record_search(feed, url, *request_args):
+            if "search" in url:
+                searched.append(url)
+            return send_du_request(feed, url, *request_args)
+
+        with mock.patch.object(
+            du_feed.DuFeed, "_populate_item_details", populate_or_interrupt
+        ), mock.patch.object(du_feed.DuFeed, "_send_du_request", record_search):
+            with self.assertRaises(SystemExit):
+                du_feed.query_mode(du_feed.parse_args(argv))
+            self.assertEqual(len(searched), 2)
+            self.assertEqual(
+                sorted(os.listdir(".")),
+                [
+                    "du_query.checkpoint.json",
+                    "du_query.checkpoint.json.items.jsonl",
+                    "fixtures",
+                ],
+            )
+
+            # forgetting --resume doesn't throw the checkpoint away
+            with self.assertRaises(RuntimeError):
+                du_feed.query_mode(du_feed.parse_args(argv))
+            self.assertEqual(len(searched), 2)
+            self.assertIn("du_query.checkpoint.json", os.listdir("."))
+
+            detailed.clear()
+            searched.clear()
+            du_feed.query_mode(du_feed.parse_args(argv + ["--resume"]))
+        self.assertEqual(len(detailed), PRODUCTS - 25)
+        # the first page was completed, only the second is searched again
+        self.assertEqual(len(searched), 1)
+
+        mapping = [name for name in os.listdir(".") if name.startswith("du.mapping")]
+        self.assertEqual(len(mapping), 1)
+        self.assertEqual(sorted(os.listdir(".")), sorted(["fixtures"] + mapping))
+        items, _ = StaticInfoSerializer().load_static_info_from_csv(
+            mapping[0], return_key="du_product_id"
+        )
+        self.assertEqual(len(items), PRODUCTS)
+
+
+if __name__ == "__main__":
+    unittest.main()
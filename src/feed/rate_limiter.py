@@ -0,0 +1,40 @@
+import threading
+import time
+import urllib.parse
+
+"""
+Per-host request rate limiting, shared by every thread issuing requests through
+the same feed.
+"""
+
+
+class HostRateLimiter:
+    def __init__(self, max_requests_per_second):
+        """
+        @param max_requests_per_second  float the most number of requests sent
+            to a single host in one second. None or 0 disables limiting
+        """
+        self.min_interval = (
+            1.0 / float(max_requests_per_second) if max_requests_per_second else 0
+        )
+        self.next_slot = {}
+        self.lock = threading.Lock()
+        return
+
+    def wait(self, url):
+        """
+        Blocks the calling thread until a request to the host of url is allowed.
+        Slots are handed out in call order so concurrent callers are spaced
+        min_interval apart instead of all waking up at once.
+        """
+        if not self.min_interval:
+            return
+        host = urllib.parse.urlparse(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.min_interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+        return
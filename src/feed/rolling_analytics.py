@@ -0,0 +1,181 @@
+import datetime
+
+import numpy as np
+
+from time_series_serializer import parse_time
+
+"""
+Rolling transaction analytics on NumPy arrays.
+
+Transactions of one or many (style_id, size) pairs are laid out as in
+CatalogSnapshot: times (datetime64[us]) and prices back to back, oldest first
+within a pair, pair i being [offsets[i], offsets[i + 1]). get_batch_stats
+computes, as of now, for every pair at once:
+  - sales_per_day_{w}d: sales in the last w days / w
+  - volatility_{w}d: standard deviation of log returns between consecutive
+    sales, for sales in the last w days (nan with fewer than two returns)
+  - ewma_price: average price, each sale weighted by 0.5 ** (age / halflife)
+  - max_drawdown: largest fall from a running high, as a ratio of that high
+  - days_since_last_sale
+nan where a pair has no transactions. get_stats does the same from stored
+transactions.
+"""
+
+DEFAULT_WINDOWS_DAYS = [7, 30, 90]
+DEFAULT_EWMA_HALFLIFE_DAYS = 7
+
+SECONDS_PER_DAY = 86400
+
+
+def parse_times(timestrs):
+    """
+    @param timestrs  list of stored time strings, None where missing
+    @return datetime64[us] array, NaT where missing
+    """
+    try:
+        # numpy parses ISO 8601 in C, much faster than strptime per string
+        return np.array(
+            [t[:-1] if t and t.endswith("Z") else (t or "NaT") for t in timestrs],
+            dtype="datetime64[us]",
+        )
+    except ValueError:
+        # e.g. the legacy %Y%m%d-%H%M%S du times
+        return np.array(
+            [parse_time(t) if t else "NaT" for t in timestrs], dtype="datetime64[us]"
+        )
+
+
+def to_arrays(transactions_list):
+    """
+    @param transactions_list  list of stored du transactions lists (latest
+        first, prices in CNY fen), one per pair
+    @return (times, prices in CNY, offsets) oldest first within a pair
+    """
+    timestrs = []
+    prices = []
+    offsets = [0]
+    for transactions in transactions_list:
+        for t in transactions[::-1]:
+            timestrs.append(t["time"])
+            prices.append(t["price"])
+        offsets.append(len(prices))
+    return (
+        parse_times(timestrs),
+        np.array(prices, dtype=np.float64) / 100,
+        np.array(offsets, dtype=np.int64),
+    )
+
+
+def _segment_sums(values, offsets):
+    # reduceat per pair rather than a difference of prefix sums over the whole
+    # batch, so a pair's stats don't depend on what else is in the batch
+    lengths = np.diff(offsets)
+    sums = np.zeros(len(lengths))
+    nonempty = lengths > 0
+    if nonempty.any():
+        sums[nonempty] = np.add.reduceat(
+            np.asarray(values, dtype=np.float64), offsets[:-1][nonempty]
+        )
+    return sums
+
+
+def _segment_running_max(values, starts):
+    """
+    @param starts  int array, the index of the first value of each value's pair
+    """
+    # doubling scan: after the step of k, each value is the max of the k * 2
+    # values up to it within its pair
+    running_max = values.copy()
+    positions = np.arange(len(values))
+    k = 1
+    while k < len(values):
+        has_prior = positions - k >= starts
+        if not has_prior.any():
+            break
+        prior = np.where(has_prior, np.roll(running_max, k), -np.inf)
+        running_max = np.maximum(running_max, prior)
+        k *= 2
+    return running_max
+
+
+def get_batch_stats(
+    times,
+    prices,
+    offsets,
+    now=None,
+    windows_days=DEFAULT_WINDOWS_DAYS,
+    ewma_halflife_days=DEFAULT_EWMA_HALFLIFE_DAYS,
+):
+    """
+    @param times  datetime64 array, oldest first within a pair
+    @param prices  float array
+    @param offsets  int array of len(pairs) + 1
+    @return {stat name: float64 array with one value per pair}
+    """
+    now = np.datetime64(now if now else datetime.datetime.utcnow(), "us")
+    prices = np.asarray(prices, dtype=np.float64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    lengths = np.diff(offsets)
+    pair_ids = np.repeat(np.arange(len(lengths)), lengths)
+    ages_days = (now - times) / np.timedelta64(1, "s") / SECONDS_PER_DAY
+
+    # log returns, the first sale of a pair has none
+    log_prices = np.log(prices)
+    log_returns = np.zeros(len(prices))
+    log_returns[1:] = np.diff(log_prices)
+    has_return = np.ones(len(prices), dtype=bool)
+    has_return[offsets[:-1][lengths > 0]] = False
+
+    stats = {}
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for window in windows_days:
+            in_window = ages_days <= window
+            stats["sales_per_day_{}d".format(window)] = (
+                _segment_sums(in_window, offsets) / window
+            )
+            returns_in_window = in_window & has_return
+            count = _segment_sums(returns_in_window, offsets)
+            mean = _segment_sums(np.where(returns_in_window, log_returns, 0), offsets)
+            mean /= count
+            deviations = np.where(
+                returns_in_window, (log_returns - mean[pair_ids]) ** 2, 0
+            )
+            volatility = np.sqrt(_segment_sums(deviations, offsets) / count)
+            volatility[count < 2] = np.nan
+            stats["volatility_{}d".format(window)] = volatility
+
+        weights = 0.5 ** (ages_days / ewma_halflife_days)
+        stats["ewma_price"] = _segment_sums(weights * prices, offsets) / _segment_sums(
+            weights, offsets
+        )
+
+        running_high = _segment_running_max(prices, offsets[:-1][pair_ids])
+        drawdowns = (running_high - prices) / running_high
+        max_drawdown = np.full(len(lengths), np.nan)
+        nonempty = lengths > 0
+        max_drawdown[nonempty] = np.maximum.reduceat(drawdowns, offsets[:-1][nonempty])
+        stats["max_drawdown"] = max_drawdown
+
+        days_since_last_sale = np.full(len(lengths), np.nan)
+        days_since_last_sale[nonempty] = ages_days[offsets[1:][nonempty] - 1]
+        stats["days_since_last_sale"] = days_since_last_sale
+
+    for window in windows_days:
+        stats["sales_per_day_{}d".format(window)][~nonempty] = np.nan
+    return stats
+
+
+def get_stats(transactions_list, now=None, **kwargs):
+    """
+    get_batch_stats of stored transactions.
+
+    @param transactions_list  list of stored du transactions lists (latest
+        first), one per pair
+    @return list of {stat name: float}, one per pair
+    """
+    times, prices, offsets = to_arrays(transactions_list)
+    stats = get_batch_stats(times, prices, offsets, now, **kwargs)
+    return [
+        {name: float(values[i]) for name, values in stats.items()}
+        for i in range(len(transactions_list))
+    ]
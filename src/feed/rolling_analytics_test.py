@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+import datetime
+import math
+import random
+import unittest
+
+import numpy as np
+
+import rolling_analytics
+
+NOW = datetime.datetime(2019, 8, 1, 12)
+
+
+def make_transactions(rng, count):
+    # stored latest first
+    transactions = []
+    hours_ago = rng.uniform(0, 48)
+    for _ in range(count):
+        transactions.append(
+            {
+                "price": rng.randint(50000, 300000),
+                "time": (NOW - datetime.timedelta(hours=hours_ago)).isoformat() + "Z",
+            }
+        )
+        hours_ago += rng.uniform(1, 200)
+    return transactions
+
+
+def get_expected_stats(transactions, windows_days, halflife_days):
+    ordered = transactions[::-1]
+    ages = [
+        (NOW - datetime.datetime.strptime(t["time"], "%Y-%m-%dT%H:%M:%S.%fZ"))
+        / datetime.timedelta(days=1)
+        for t in ordered
+    ]
+    prices = [t["price"] / 100 for t in ordered]
+    expected = {}
+    for window in windows_days:
+        expected["sales_per_day_{}d".format(window)] = (
+            len([a for a in ages if a <= window]) / window
+        )
+        returns = [
+            math.log(prices[i] / prices[i - 1])
+            for i in range(1, len(prices))
+            if ages[i] <= window
+        ]
+        expected["volatility_{}d".format(window)] = (
+            float(np.std(returns)) if len(returns) >= 2 else math.nan
+        )
+    weights = [0.5 ** (a / halflife_days) for a in ages]
+    expected["ewma_price"] = sum(w * p for w, p in zip(weights, prices)) / sum(weights)
+    high = 0
+    max_drawdown = 0
+    for p in prices:
+        high = max(high, p)
+        max_drawdown = max(max_drawdown, (high - p) / high)
+    expected["max_drawdown"] = max_drawdown
+    expected["days_since_last_sale"] = ages[-1]
+    return expected
+
+
+class TestRollingAnalytics(unittest.TestCase):
+    def test_batch_matches_per_pair(self):
+        rng = random.Random(0)
+        transactions_list = [
+            make_transactions(rng, rng.choice([1, 2, 5, 30, 120])) for _ in range(50)
+        ]
+        actual = rolling_analytics.get_stats(
+            transactions_list, NOW, windows_days=[7, 30], ewma_halflife_days=5
+        )
+        for transactions, stats in zip(transactions_list, actual):
+            expected = get_expected_stats(transactions, [7, 30], 5)
+            self.assertEqual(stats.keys(), expected.keys())
+            for name in expected:
+                if math.isnan(expected[name]):
+                    self.assertTrue(math.isnan(stats[name]), name)
+                else:
+                    self.assertAlmostEqual(stats[name], expected[name], 9, name)
+
+    def test_empty_pairs(self):
+        rng = random.Random(1)
+        transactions = make_transactions(rng, 10)
+        stats = rolling_analytics.get_stats([[], transactions, []], NOW)
+        for name in stats[0]:
+            self.assertTrue(math.isnan(stats[0][name]), name)
+            self.assertTrue(math.isnan(stats[2][name]), name)
+        self.assertEqual(stats[1], rolling_analytics.get_stats([transactions], NOW)[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
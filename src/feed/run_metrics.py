@@ -0,0 +1,275 @@
+import bisect
+import json
+import os
+import threading
+import time
+
+"""
+Per-stage timing and per-endpoint request metrics of a feed run.
+
+Stages are timed with `with metrics.stage(name):` and summed per name across
+threads. Requests are observed by the transport into a latency histogram,
+status code counts and byte counts per endpoint, and anything else (e.g.
+errors by type) is a named counter. At the end of a run the metrics go to a JSON
+summary and optionally a Prometheus text format file, e.g. for the node
+exporter textfile collector.
+
+A disabled RunMetrics (DISABLED, the default everywhere) records nothing, its
+stage() hands back one shared no-op context manager.
+"""
+
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.add_stage_time(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class RunMetrics:
+    def __init__(self, enabled=True, prefix="du_feed"):
+        self.enabled = enabled
+        self.prefix = prefix
+        self.start_time = time.time()
+        self.lock = threading.Lock()
+        # {stage: [calls, seconds]}
+        self.stages = {}
+        # {endpoint: {"buckets": [count per LATENCY_BUCKETS + inf], "sum": s,
+        #   "count": n, "bytes": n, "status": {status: n}}}
+        self.requests = {}
+        self.counters = {}
+        return
+
+    def stage(self, name):
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def add_stage_time(self, name, seconds):
+        with self.lock:
+            stage = self.stages.setdefault(name, [0, 0.0])
+            stage[0] += 1
+            stage[1] += seconds
+        return
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+        return
+
+    def _get_request_stats(self, endpoint):
+        if endpoint not in self.requests:
+            self.requests[endpoint] = {
+                "buckets": [0] * (len(LATENCY_BUCKETS) + 1),
+                "sum": 0.0,
+                "count": 0,
+                "bytes": 0,
+                "status": {},
+            }
+        return self.requests[endpoint]
+
+    def observe_request(self, endpoint, latency, status, num_bytes=0):
+        """
+        @param status  int HTTP status, or str e.g. "error" if there was no response
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            stats = self._get_request_stats(endpoint)
+            stats["buckets"][bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+            stats["sum"] += latency
+            stats["count"] += 1
+            stats["bytes"] += num_bytes
+            stats["status"][str(status)] = stats["status"].get(str(status), 0) + 1
+        return
+
+    def merge(self, summary):
+        """
+        Add the to_dict() of another run, e.g. of a worker process, to these
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            for name, stage in summary["stages"].items():
+                calls_seconds = self.stages.setdefault(name, [0, 0.0])
+                calls_seconds[0] += stage["calls"]
+                calls_seconds[1] += stage["seconds"]
+            for endpoint, other in summary["requests"].items():
+                stats = self._get_request_stats(endpoint)
+                for i, count in enumerate(other["latency_buckets"].values()):
+                    stats["buckets"][i] += count
+                stats["sum"] += other["latency_sum"]
+                stats["count"] += other["count"]
+                stats["bytes"] += other["bytes"]
+                for status, count in other["status"].items():
+                    stats["status"][status] = stats["status"].get(status, 0) + count
+            for name, count in summary["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + count
+        return
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                "start_time": self.start_time,
+                "run_seconds": time.time() - self.start_time,
+                "stages": {
+                    name: {"calls": calls, "seconds": seconds}
+                    for name, (calls, seconds) in self.stages.items()
+                },
+                "requests": {
+                    endpoint: {
+                        "latency_buckets": dict(
+                            zip(
+                                [str(b) for b in LATENCY_BUCKETS] + ["+Inf"],
+                                stats["buckets"],
+                            )
+                        ),
+                        "latency_sum": stats["sum"],
+                        "count": stats["count"],
+                        "bytes": stats["bytes"],
+                        "status": dict(stats["status"]),
+                    }
+                    for endpoint, stats in self.requests.items()
+                },
+                "counters": dict(self.counters),
+            }
+
+    def to_prometheus(self):
+        summary = self.to_dict()
+        p = self.prefix
+        lines = [
+            "# HELP {}_run_seconds Wall time of the run so far".format(p),
+            "# TYPE {}_run_seconds gauge".format(p),
+            "{}_run_seconds {}".format(p, summary["run_seconds"]),
+            "# HELP {}_stage_seconds_total Time spent per stage".format(p),
+            "# TYPE {}_stage_seconds_total counter".format(p),
+        ]
+        for name, stage in sorted(summary["stages"].items()):
+            lines.append(
+                '{}_stage_seconds_total{{stage="{}"}} {}'.format(
+                    p, name, stage["seconds"]
+                )
+            )
+        lines += [
+            "# HELP {}_stage_calls_total Times each stage ran".format(p),
+            "# TYPE {}_stage_calls_total counter".format(p),
+        ]
+        for name, stage in sorted(summary["stages"].items()):
+            lines.append(
+                '{}_stage_calls_total{{stage="{}"}} {}'.format(p, name, stage["calls"])
+            )
+
+        lines += [
+            "# HELP {}_request_duration_seconds Request latency per endpoint".format(p),
+            "# TYPE {}_request_duration_seconds histogram".format(p),
+        ]
+        for endpoint, stats in sorted(summary["requests"].items()):
+            cumulative = 0
+            for le, count in stats["latency_buckets"].items():
+                cumulative += count
+                lines.append(
+                    '{}_request_duration_seconds_bucket{{endpoint="{}",le="{}"}} {}'.format(
+                        p, endpoint, le, cumulative
+                    )
+                )
+            lines.append(
+                '{}_request_duration_seconds_sum{{endpoint="{}"}} {}'.format(
+                    p, endpoint, stats["latency_sum"]
+                )
+            )
+            lines.append(
+                '{}_request_duration_seconds_count{{endpoint="{}"}} {}'.format(
+                    p, endpoint, stats["count"]
+                )
+            )
+        lines += [
+            "# HELP {}_responses_total Responses per endpoint and status".format(p),
+            "# TYPE {}_responses_total counter".format(p),
+        ]
+        for endpoint, stats in sorted(summary["requests"].items()):
+            for status, count in sorted(stats["status"].items()):
+                lines.append(
+                    '{}_responses_total{{endpoint="{}",status="{}"}} {}'.format(
+                        p, endpoint, status, count
+                    )
+                )
+        lines += [
+            "# HELP {}_response_bytes_total Response bytes per endpoint".format(p),
+            "# TYPE {}_response_bytes_total counter".format(p),
+        ]
+        for endpoint, stats in sorted(summary["requests"].items()):
+            lines.append(
+                '{}_response_bytes_total{{endpoint="{}"}} {}'.format(
+                    p, endpoint, stats["bytes"]
+                )
+            )
+        lines += [
+            "# HELP {}_events_total Named event counts, e.g. errors by type".format(p),
+            "# TYPE {}_events_total counter".format(p),
+        ]
+        for name, count in sorted(summary["counters"].items()):
+            lines.append('{}_events_total{{name="{}"}} {}'.format(p, name, count))
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, out_file):
+        with open(out_file, "w") as outfile:
+            outfile.write(json.dumps(self.to_dict(), indent=2))
+        print("run metrics written to {}".format(out_file))
+        return
+
+    def write_prometheus(self, out_file):
+        # write aside then rename, collectors may read it any time
+        tmp_file_path = out_file + ".tmp"
+        with open(tmp_file_path, "w") as outfile:
+            outfile.write(self.to_prometheus())
+        os.replace(tmp_file_path, out_file)
+        print("prometheus metrics written to {}".format(out_file))
+        return
+
+    def print_summary(self):
+        if not self.enabled:
+            return
+        summary = self.to_dict()
+        print("run took {:.2f}s".format(summary["run_seconds"]))
+        for name, stage in sorted(
+            summary["stages"].items(), key=lambda x: x[1]["seconds"], reverse=True
+        ):
+            print(
+                "  {:<20} {:9.3f}s in {} calls".format(
+                    name, stage["seconds"], stage["calls"]
+                )
+            )
+        for endpoint, stats in sorted(summary["requests"].items()):
+            print(
+                "  {}: {} requests, status {}, {} bytes".format(
+                    endpoint, stats["count"], stats["status"], stats["bytes"]
+                )
+            )
+        for name, count in sorted(summary["counters"].items()):
+            print("  {}: {}".format(name, count))
+        return
+
+
+DISABLED = RunMetrics(enabled=False)
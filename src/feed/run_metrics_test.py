@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from run_metrics import RunMetrics, DISABLED
+
+
+class TestRunMetrics(unittest.TestCase):
+    def test_stages_and_requests(self):
+        metrics = RunMetrics()
+        for _ in range(3):
+            with metrics.stage("parse"):
+                pass
+        with self.assertRaises(KeyError):
+            with metrics.stage("sign"):
+                raise KeyError("timed all the same")
+        metrics.observe_request("/detail", 0.07, 200, 100)
+        metrics.observe_request("/detail", 0.3, 200, 50)
+        metrics.observe_request("/detail", 50, 429)
+        metrics.count("error_SizerError")
+
+        summary = metrics.to_dict()
+        self.assertEqual(summary["stages"]["parse"]["calls"], 3)
+        self.assertEqual(summary["stages"]["sign"]["calls"], 1)
+        detail = summary["requests"]["/detail"]
+        self.assertEqual(detail["count"], 3)
+        self.assertEqual(detail["bytes"], 150)
+        self.assertEqual(detail["status"], {"200": 2, "429": 1})
+        self.assertEqual(detail["latency_buckets"]["0.1"], 1)
+        self.assertEqual(detail["latency_buckets"]["0.5"], 1)
+        self.assertEqual(detail["latency_buckets"]["+Inf"], 1)
+        self.assertEqual(summary["counters"], {"error_SizerError": 1})
+
+        prometheus = metrics.to_prometheus()
+        self.assertIn(
+            'du_feed_request_duration_seconds_bucket{endpoint="/detail",le="0.5"} 2\n',
+            prometheus,
+        )
+        self.assertIn(
+            'du_feed_request_duration_seconds_bucket{endpoint="/detail",le="+Inf"} 3\n',
+            prometheus,
+        )
+        self.assertIn(
+            'du_feed_responses_total{endpoint="/detail",status="429"} 1\n', prometheus
+        )
+        self.assertIn('du_feed_stage_calls_total{stage="parse"} 3\n', prometheus)
+
+    def test_merge(self):
+        worker = RunMetrics()
+        with worker.stage("parse"):
+            pass
+        worker.observe_request("/detail", 0.07, 200, 100)
+        worker.count("error_KeyError")
+        metrics = RunMetrics()
+        metrics.observe_request("/detail", 3, 503)
+        metrics.merge(worker.to_dict())
+        metrics.merge(worker.to_dict())
+
+        summary = metrics.to_dict()
+        self.assertEqual(summary["stages"]["parse"]["calls"], 2)
+        detail = summary["requests"]["/detail"]
+        self.assertEqual(detail["count"], 3)
+        self.assertEqual(detail["bytes"], 200)
+        self.assertEqual(detail["status"], {"200": 2, "503": 1})
+        self.assertEqual(detail["latency_buckets"]["0.1"], 2)
+        self.assertEqual(detail["latency_buckets"]["5"], 1)
+        self.assertEqual(summary["counters"], {"error_KeyError": 2})
+
+    def test_disabled_records_nothing(self):
+        with DISABLED.stage("parse"):
+            pass
+        DISABLED.observe_request("/detail", 0.1, 200, 10)
+        DISABLED.count("error_KeyError")
+        summary = DISABLED.to_dict()
+        self.assertEqual(summary["stages"], {})
+        self.assertEqual(summary["requests"], {})
+        self.assertEqual(summary["counters"], {})
+
+
+if __name__ == "__main__":
+    unittest.main()
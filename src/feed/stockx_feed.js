@@ -47,6 +47,14 @@ function setupArgs() {
         help: 'in update mode, the maximum number of pages to query. This is introduced \n' +
               'such that we violate stockx\'s PerimeterX bot check less often.'
     });
+    parser.addArgument(['--journal_last_updated'], {
+        help: 'in update mode, append each update to a journal shared with du_feed.py instead of rewriting last_updated',
+        action: 'storeTrue'
+    });
+    parser.addArgument(['--storage'], {
+        help: 'in update mode, [json|log] how time series readings are stored',
+        defaultValue: 'json'
+    });
     parser.addArgument(['--style_id'], {
         help: 'in get mode, get product detail for this style_id. No effect in other modes'
     })
@@ -204,7 +212,7 @@ function parseProduct(product) {
             await logIn('../../credentials/credentials.json');
 
             let staticInfoSerializer = new StaticInfoSerializer();
-            let timeSeriesSerializer = new TimeSeriesSerializer();
+            let timeSeriesSerializer = new TimeSeriesSerializer(args.storage);
 
             staticInfoSerializer.loadStaticInfoFromCsv(args.start_from, (staticInfo) => {
                 let lastUpdatedFile = "last_updated_stockx.log";
@@ -212,7 +220,7 @@ function parseProduct(product) {
                     lastUpdatedFile = args.last_updated;
                 }
                 
-                let lastUpdatedSerializer = new LastUpdatedSerializer(lastUpdatedFile, args.min_interval_seconds);
+                let lastUpdatedSerializer = new LastUpdatedSerializer(lastUpdatedFile, args.min_interval_seconds, args.journal_last_updated);
                 lastUpdatedSerializer.loads(async () => {
                     let count = 0;
 
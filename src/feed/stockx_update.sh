@@ -1,7 +1,8 @@
 #!/usr/bin/env bash
 
 # ./stockx_update.sh merged.csv wraps around daily stockx update in several runs
-# to circumvent 403
+# to circumvent 403. The csv can be a plan written by update_scheduler.py to
+# update the most valuable stale items first
 
 if [ "$#" -ne 1 ]; then
   echo "Expect one csv argument to update from. Usage: ./stockx_update.sh merged.csv" >&2
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+
+import argparse
+import csv
+import datetime
+import json
+import os
+import pathlib
+import random
+
+from csv_merge import merge_csvs
+from time_series_migrate import migrate_to_log, import_to_sqlite, write_summaries
+
+"""
+Fabricates a catalog at any scale, for benchmarks and tests.
+
+make_synthetic_size_prices generates time series with the readings du_feed.py
+(du) and stockx_feed.js (stockx) store, latest first, with a mix of fresh /
+stale / missing readings and transactions. write_catalog writes them as the
+data/ tree of the json storage (optionally migrated to log / sqlite), along with
+the du and stockx mapping csvs and the merged csv csv_merge makes of them.
+"""
+
+
+def to_du_time(t):
+    # datetime.isoformat() + "Z" as du_feed.py writes
+    return t.isoformat() + "Z"
+
+
+def to_stockx_time(t):
+    # Date.toISOString() as stockx_feed.js writes, milliseconds
+    return t.strftime("%Y-%m-%dT%H:%M:%S.") + "{:03d}Z".format(t.microsecond // 1000)
+
+
+def make_style_id(idx):
+    return "SYN{:06d}-{:03d}".format(idx, idx % 1000)
+
+
+def make_synthetic_size_prices(styles, sizes, seed=0, readings=1, transactions=5):
+    """
+    @param readings  number of price readings per venue of a pair
+    @param transactions  most du transactions of a pair, pairs have none or 2
+        to this many
+    @return {style_id: {size: {venue: {"prices": [...], "transactions": [...]}}}}
+    """
+    rng = random.Random(seed)
+    now = datetime.datetime.utcnow()
+
+    def hours_ago(hours):
+        return now - datetime.timedelta(hours=hours)
+
+    def reading_times():
+        # latest within the last 100 hours, older ones up to two days apart
+        times = [rng.uniform(0, 100)]
+        for _ in range(readings - 1):
+            times.append(times[-1] + rng.uniform(6, 48))
+        return times
+
+    all_size_prices = {}
+    for s in range(styles):
+        style_id = make_style_id(s)
+        all_size_prices[style_id] = {}
+        for z in range(sizes):
+            size = str(4 + 0.5 * z)
+            stockx_ask = rng.randint(80, 400)
+            du_list = int(stockx_ask * rng.uniform(5.5, 11.0)) * 100
+            last_sale_hours = rng.uniform(0, 600)
+            num_transactions = (
+                rng.randint(2, max(2, transactions))
+                if transactions and rng.random() > 0.2
+                else 0
+            )
+            data = {
+                "du": {
+                    "prices": [
+                        {
+                            "time": to_du_time(hours_ago(h)),
+                            "bid_price": None,
+                            "ask_price": None,
+                            "list_price": int(du_list * rng.uniform(0.9, 1.1))
+                            if rng.random() > 0.05
+                            else None,
+                        }
+                        for h in reading_times()
+                    ],
+                    "transactions": [
+                        {
+                            "price": int(du_list * rng.uniform(0.8, 1.2)),
+                            "time": to_du_time(hours_ago(last_sale_hours + 24 * t)),
+                            "id": "{:032x}".format(rng.getrandbits(128)),
+                        }
+                        for t in range(num_transactions)
+                    ],
+                },
+                "stockx": {
+                    "prices": [
+                        {
+                            "time": to_stockx_time(hours_ago(h)),
+                            "bid_price": stockx_ask - rng.randint(1, 40),
+                            "ask_price": stockx_ask,
+                            "annual_high": stockx_ask + rng.randint(0, 300),
+                            "annual_low": max(stockx_ask - rng.randint(0, 60), 1),
+                            "volatility": rng.uniform(0, 0.3),
+                            "sale_72_hours": rng.randint(0, 20),
+                            "number_asks": rng.randint(0, 50),
+                            "number_bids": rng.randint(0, 50),
+                        }
+                        for h in reading_times()
+                    ],
+                    "transactions": [],
+                },
+            }
+            if rng.random() < 0.1:
+                del data["stockx"]
+            all_size_prices[style_id][size] = data
+    return all_size_prices
+
+
+def write_mapping_csvs(style_ids, out_folder, seed=0):
+    """
+    @return (du mapping csv, stockx mapping csv) in the columns du_feed.py and
+        stockx_feed.js write
+    """
+    rng = random.Random(seed)
+    du_file = os.path.join(out_folder, "du.mapping.synthetic.csv")
+    stockx_file = os.path.join(out_folder, "stockx.mapping.synthetic.csv")
+    with open(du_file, "w") as du_out, open(stockx_file, "w") as stockx_out:
+        du_writer = csv.writer(du_out)
+        du_writer.writerow(
+            ["style_id", "du_product_id", "du_title", "release_date", "gender"]
+        )
+        stockx_writer = csv.writer(stockx_out)
+        stockx_writer.writerow(
+            [
+                "stockx_gender",
+                "stockx_url_key",
+                "stockx_color_way",
+                "stockx_name",
+                "stockx_title",
+                "stockx_retail_price",
+                "stockx_uuid",
+                "stockx_pid",
+                "style_id",
+                "stockx_release_date",
+            ]
+        )
+        for idx, style_id in enumerate(style_ids):
+            # du genders are sizer size chart codes
+            du_gender = rng.choice(["eu-nike-men", "eu-nike-women", "eu-adidas-men"])
+            gender = du_gender.split("-")[-1]
+            release_date = (
+                datetime.date(2015, 1, 1)
+                + datetime.timedelta(days=rng.randint(0, 1800))
+            ).isoformat()
+            title = "Synthetic {}".format(style_id)
+            du_writer.writerow([style_id, 10000 + idx, title, release_date, du_gender])
+            stockx_writer.writerow(
+                [
+                    gender,
+                    "synthetic-{}".format(style_id.lower()),
+                    "Black/White",
+                    title,
+                    title,
+                    rng.choice([110, 140, 160, 170, 190, 220]),
+                    "{:032x}".format(rng.getrandbits(128)),
+                    "{:032x}".format(rng.getrandbits(128)),
+                    style_id,
+                    release_date,
+                ]
+            )
+    return du_file, stockx_file
+
+
+def write_catalog(all_size_prices, out_folder, storage="json", seed=0, merge=True):
+    """
+    Write the data/ tree under out_folder/data and the merged csv to
+    out_folder/merged.synthetic.csv.
+
+    @param merge  False to only write the du and stockx mapping csvs, leaving
+        their merge to the caller (e.g. to time it on its own)
+    @return (data folder, merged csv)
+    """
+    data_folder = os.path.join(out_folder, "data")
+    for style_id, size_prices in all_size_prices.items():
+        style_folder = os.path.join(data_folder, style_id)
+        pathlib.Path(style_folder).mkdir(parents=True, exist_ok=True)
+        for size, data in size_prices.items():
+            with open(os.path.join(style_folder, size + ".json"), "w") as outfile:
+                outfile.write(json.dumps(data))
+    if storage == "log":
+        migrate_to_log(data_folder, remove_json=True)
+    elif storage == "sqlite":
+        import_to_sqlite(data_folder)
+    elif storage != "json":
+        raise RuntimeError("unsupported time series storage {}".format(storage))
+    if storage != "sqlite":
+        # as the feeds would have left them
+        write_summaries(data_folder, storage)
+
+    du_file, stockx_file = write_mapping_csvs(all_size_prices.keys(), out_folder, seed)
+    merged_file = os.path.join(out_folder, "merged.synthetic.csv")
+    if merge:
+        merge_csvs([du_file, stockx_file], merged_file, False)
+    return data_folder, merged_file
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        """
+        write a synthetic catalog: data/ tree and merged csv.
+
+        example usage:
+          ./synthetic_catalog.py --styles 50000 --sizes 15 --readings 10 --out ../../synthetic
+          cd ../strategy && ./strategy.py --start_from ../../synthetic/merged.synthetic.csv \\
+              --data_folder ../../synthetic/data
+    """
+    )
+    parser.add_argument("--styles", default=5000, type=int, help="number of styles")
+    parser.add_argument(
+        "--sizes", default=15, type=int, help="number of sizes per style"
+    )
+    parser.add_argument(
+        "--readings",
+        default=1,
+        type=int,
+        help="number of price readings per venue of a pair",
+    )
+    parser.add_argument(
+        "--transactions",
+        default=5,
+        type=int,
+        help="most du transactions of a pair",
+    )
+    parser.add_argument("--seed", default=0, type=int, help="random seed")
+    parser.add_argument(
+        "--storage",
+        default="json",
+        help="[json|log|sqlite] how time series readings are stored",
+    )
+    parser.add_argument("--out", required=True, help="folder to write the catalog to")
+    args = parser.parse_args()
+
+    all_size_prices = make_synthetic_size_prices(
+        args.styles, args.sizes, args.seed, args.readings, args.transactions
+    )
+    data_folder, merged_file = write_catalog(
+        all_size_prices, args.out, args.storage, args.seed
+    )
+    print(
+        "wrote {} styles to {}, merged csv {}".format(
+            len(all_size_prices), data_folder, merged_file
+        )
+    )
@@ -0,0 +1,168 @@
+import json
+import os
+import glob
+import pathlib
+
+from time_series_serializer import (
+    TimeSeriesSerializer,
+    count_daily_transactions,
+    is_current_summary,
+    summarize,
+)
+
+"""
+Append-only storage for time series readings.
+
+Each (style_id, size) is a JSON Lines log at data/{style_id}/{size}.jsonl. Every
+price reading and every new transaction is one record, appended in the order it
+was observed:
+  {"venue": "du", "type": "price", "time": ..., "bid_price": ..., ...}
+  {"venue": "du", "type": "transaction", "price": ..., "time": ..., "id": ...}
+
+Updates never read or rewrite history: the style's summary manifest is carried
+forward from the appended records, and the only lookup, the id of the newest
+stored transaction, comes from it. A log is only read in full when the manifest
+doesn't match it. Readers rebuild the same {venue: {"prices": [...],
+"transactions": [...]}} view (latest first) that TimeSeriesSerializer.get
+returns.
+"""
+
+
+class TimeSeriesLogSerializer(TimeSeriesSerializer):
+    summary_file = ".summary.log.json"
+
+    def _find_path(self, style_id, size):
+        return "{}/{}/{}.jsonl".format(self.parent_folder, style_id, size)
+
+    @staticmethod
+    def _parse_line(line):
+        line = line.strip()
+        if not line:
+            return None
+        try:
+            return json.loads(line)
+        except ValueError:
+            # a torn trailing write from a crashed writer
+            print("skipping malformed time series record {}".format(line[:80]))
+            return None
+
+    @staticmethod
+    def to_records(data):
+        """
+        Convert a {venue: {"prices": [...], "transactions": [...]}} view (latest
+        first) to log records in the order they would have been appended.
+        """
+        records = []
+        for venue in data:
+            for t in data[venue].get("transactions", [])[::-1]:
+                records.append(dict(t, venue=venue, type="transaction"))
+            for p in data[venue].get("prices", [])[::-1]:
+                records.append(dict(p, venue=venue, type="price"))
+        return records
+
+    def _read_log(self, f):
+        data = {}
+        with open(f, "r") as infile:
+            for line in infile:
+                record = self._parse_line(line)
+                if not record:
+                    continue
+                venue = record.pop("venue")
+                record_type = record.pop("type")
+                if venue not in data:
+                    data[venue] = {"prices": [], "transactions": []}
+                if record_type == "price":
+                    data[venue]["prices"].append(record)
+                elif record_type == "transaction":
+                    data[venue]["transactions"].append(record)
+        for venue in data:
+            data[venue]["prices"].reverse()
+            data[venue]["transactions"].reverse()
+        return data
+
+    def get(self, style_id, size=None):
+        """
+        Same as TimeSeriesSerializer.get, reading logs.
+
+        Throws FileNotFoundError if no serialized data can be found
+        """
+        size_prices = {}
+        if not size:
+            parent_path = self._find_parent_path(style_id)
+            for f in glob.glob(parent_path + "*.jsonl"):
+                size = ".".join(os.path.basename(f).split(".")[:-1])
+                size_prices[size] = self._read_log(f)
+        else:
+            size_prices[size] = self._read_log(self._find_path(style_id, size))
+        return size_prices
+
+    def get_all_historical_price(self, style_id, size, venue):
+        return self._read_log(self._find_path(style_id, size))[venue]["prices"]
+
+    def get_all_transactions(self, style_id, size, venue):
+        return self._read_log(self._find_path(style_id, size))[venue]["transactions"]
+
+    def append_records(self, outfile, records):
+        if not os.path.isfile(outfile):
+            pathlib.Path(os.path.dirname(outfile)).mkdir(parents=True, exist_ok=True)
+        # one write per batch so concurrent appenders don't interleave records
+        with open(outfile, "a") as appendfile:
+            appendfile.write("".join(json.dumps(r) + "\n" for r in records))
+        return
+
+    def _get_current_summary(self, manifest, style_id, size):
+        """
+        @return summarize() of a log before it is appended to
+        """
+        outfile = self._find_path(style_id, size)
+        if not os.path.isfile(outfile):
+            return {}
+        entry = manifest.get(size)
+        if (
+            entry
+            and entry["fingerprint"] == [str(x) for x in self._get_fingerprint(outfile)]
+            and is_current_summary(entry["summary"])
+        ):
+            return entry["summary"]
+        return summarize(self._read_log(outfile))
+
+    def update(self, venue, update_time, style_id, size_prices, size_transactions):
+        # appends are single writes, the lock keeps the manifest in step with them
+        with self._lock(style_id):
+            manifest = self._read_summary(style_id)
+            size_summaries = {}
+            for size in size_prices:
+                outfile = self._find_path(style_id, size)
+                records = []
+                summary = self._get_current_summary(manifest, style_id, size)
+                if venue not in summary:
+                    summary[venue] = summarize({venue: {}})[venue]
+                new_transactions = []
+
+                if size in size_transactions:
+                    # the summary's newest transaction is the log's
+                    latest = summary[venue]["transactions"]
+                    last_id = latest[0]["id"] if latest else None
+                    new_transactions = self._get_new_transactions(
+                        size_transactions[size], last_id
+                    )
+                    for t in new_transactions[::-1]:
+                        records.append(dict(t, venue=venue, type="transaction"))
+
+                price_record = self._make_price_record(update_time, size_prices[size])
+                records.append(dict(price_record, venue=venue, type="price"))
+                self.append_records(outfile, records)
+
+                summary[venue]["prices"] = [price_record]
+                summary[venue]["price_count"] += 1
+                if new_transactions:
+                    summary[venue]["transactions"] = new_transactions[:1]
+                    summary[venue]["transaction_count"] += len(new_transactions)
+                    summary[venue]["daily_transactions"] = count_daily_transactions(
+                        new_transactions, summary[venue]["daily_transactions"]
+                    )
+                size_summaries[size] = summary
+
+            if size_summaries:
+                self._write_summary(style_id, size_summaries)
+        return
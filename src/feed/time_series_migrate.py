@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+import argparse
+import glob
+import json
+import os
+
+from time_series_serializer import TimeSeriesSerializer
+from time_series_log_serializer import TimeSeriesLogSerializer
+from time_series_sqlite_serializer import TimeSeriesSqliteSerializer
+from time_series_storage import get_time_series_serializer
+
+"""
+Migration of data/{style_id}/{size}.json files to
+  - the append-only data/{style_id}/{size}.jsonl logs read by
+    TimeSeriesLogSerializer (one-shot),
+  - the data/time_series.db database read by TimeSeriesSqliteSerializer
+    (incremental, rerunning only imports readings added since),
+and building the per style summary manifests (data/{style_id}/.summary.json)
+of data written before feeds maintained them.
+"""
+
+
+def migrate_to_log(data_folder, remove_json=False):
+    serializer = TimeSeriesLogSerializer(data_folder)
+    migrated = 0
+    skipped = 0
+    for f in glob.glob("{}/*/*.json".format(data_folder)):
+        outfile = f[: -len(".json")] + ".jsonl"
+        if os.path.isfile(outfile):
+            print("skipping {}, {} already exists".format(f, outfile))
+            skipped += 1
+            continue
+        with open(f, "r") as infile:
+            data = json.loads(infile.read())
+        # write aside then rename so an interrupted run never leaves half a log
+        tmpfile = outfile + ".tmp"
+        if os.path.isfile(tmpfile):
+            os.remove(tmpfile)
+        serializer.append_records(tmpfile, TimeSeriesLogSerializer.to_records(data))
+        os.replace(tmpfile, outfile)
+        if remove_json:
+            os.remove(f)
+        migrated += 1
+    print("migrated {} files, skipped {}".format(migrated, skipped))
+    return
+
+
+def import_to_sqlite(data_folder):
+    json_serializer = TimeSeriesSerializer(data_folder)
+    sqlite_serializer = TimeSeriesSqliteSerializer(data_folder)
+    style_dirs = glob.glob("{}/*/".format(data_folder))
+    for idx, style_dir in enumerate(style_dirs):
+        style_id = os.path.basename(os.path.normpath(style_dir))
+        sqlite_serializer.import_size_prices(style_id, json_serializer.get(style_id))
+        if (idx + 1) % 1000 == 0:
+            print("imported {} / {} styles".format(idx + 1, len(style_dirs)))
+    sqlite_serializer.close()
+    print(
+        "imported {} styles to {}".format(len(style_dirs), sqlite_serializer.db_path)
+    )
+    return
+
+
+def write_summaries(data_folder, storage=None):
+    serializer = get_time_series_serializer(storage, data_folder)
+    style_dirs = glob.glob("{}/*/".format(data_folder))
+    sizes = 0
+    for idx, style_dir in enumerate(style_dirs):
+        style_id = os.path.basename(os.path.normpath(style_dir))
+        sizes += serializer.write_summary(style_id)
+        if (idx + 1) % 1000 == 0:
+            print("summarized {} / {} styles".format(idx + 1, len(style_dirs)))
+    print("summarized {} sizes of {} styles".format(sizes, len(style_dirs)))
+    return
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        """
+        migrate time series data between storage formats.
+
+        example usage:
+          ./time_series_migrate.py --data_folder ../../data --to log
+          ./time_series_migrate.py --data_folder ../../data --to sqlite
+          ./time_series_migrate.py --data_folder ../../data --to summary --storage log
+    """
+    )
+    parser.add_argument(
+        "--data_folder", default="../data", help="the data folder to migrate"
+    )
+    parser.add_argument(
+        "--to",
+        default="log",
+        help="[log|sqlite|summary] the storage to migrate to, or summary to build summary manifests",
+    )
+    parser.add_argument(
+        "--storage",
+        default="json",
+        help="[json|log] in summary migration, the storage whose files are summarized",
+    )
+    parser.add_argument(
+        "--remove_json",
+        action="store_true",
+        help="in log migration, remove each json file after it is migrated",
+    )
+    args = parser.parse_args()
+
+    if args.to == "log":
+        migrate_to_log(args.data_folder, args.remove_json)
+    elif args.to == "sqlite":
+        import_to_sqlite(args.data_folder)
+    elif args.to == "summary":
+        write_summaries(args.data_folder, args.storage)
+    else:
+        raise RuntimeError("unsupported migration target {}".format(args.to))
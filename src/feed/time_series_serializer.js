@@ -1,50 +1,250 @@
 const fs = require('fs');
-const path = require('path');
 let shell = require('shelljs');
+const {FileLock, LOCK_FILE, atomicWrite} = require('./file_lock.js');
+
+// days of transaction counts summaries keep, same as python's SUMMARY_DAYS
+const SUMMARY_DAYS = 30;
 
 class TimeSeriesSerializer {
-    constructor() {
+    constructor(storage) {
         this.venue = "stockx";
+        // json: rewrite data/{style_id}/{size}.json,
+        // log: append to data/{style_id}/{size}.jsonl (see time_series_log_serializer.py)
+        this.storage = storage === undefined ? "json" : storage;
     }
 
     findPath(styleId, size) {
         return "../data/" + styleId + "/" + size + ".json"
     }
 
-    update(updateTime, styleId, sizePrices) {
-        for (let size in sizePrices) {
-            let outfile = this.findPath(styleId, size);
-            let data = {};
-            if (fs.existsSync(outfile)) {
-                data = JSON.parse(fs.readFileSync(outfile));
-                console.log(outfile + " exists, updating");
-            } else {
-                let dirname = path.dirname(outfile);
-                if (!fs.existsSync(dirname)) {
-                    shell.mkdir('-p', dirname);
-                }
+    findLogPath(styleId, size) {
+        return "../data/" + styleId + "/" + size + ".jsonl"
+    }
+
+    // per style manifest of the latest state of each size, kept in step with
+    // TimeSeriesSerializer / TimeSeriesLogSerializer .summary_file in python
+    findSummaryPath(styleId) {
+        let summaryFile = this.storage === "log" ? ".summary.log.json" : ".summary.json";
+        return "../data/" + styleId + "/" + summaryFile;
+    }
+
+    // YYYY-MM-DD of a stored time, same as python's get_day
+    static getDay(time) {
+        let day = null;
+        if (/^\d{4}-\d{2}-\d{2}/.test(time || "")) {
+            day = time.slice(0, 10);
+        } else if (/^\d{8}-\d{6}$/.test(time || "")) {
+            day = time.slice(0, 4) + "-" + time.slice(4, 6) + "-" + time.slice(6, 8);
+        }
+        if (day === null || isNaN(Date.parse(day + "T00:00:00Z"))) {
+            return null;
+        }
+        return day;
+    }
+
+    static getFirstSummaryDay(latestDay) {
+        let first = new Date(Date.parse(latestDay + "T00:00:00Z") - (SUMMARY_DAYS - 1) * 86400000);
+        return first.toISOString().slice(0, 10);
+    }
+
+    // transactions of the SUMMARY_DAYS up to the latest one, per day, same as
+    // python's count_daily_transactions
+    static countDailyTransactions(transactions) {
+        let daily = {};
+        let latestDay = null;
+        let firstDay = null;
+        for (let t of transactions) {
+            let day = TimeSeriesSerializer.getDay(t.time);
+            if (day === null) {
+                continue;
             }
-            if (data[this.venue] === undefined) {
-                data[this.venue] = {
-                    prices: [],
-                    transactions: []
-                }
+            if (latestDay === null || day > latestDay) {
+                latestDay = day;
+                firstDay = TimeSeriesSerializer.getFirstSummaryDay(latestDay);
+            } else if (day < firstDay) {
+                // the rest is older still
+                break;
+            }
+            daily[day] = (daily[day] || 0) + 1;
+        }
+        let summaryDaily = {};
+        for (let day in daily) {
+            if (day >= firstDay) {
+                summaryDaily[day] = daily[day];
+            }
+        }
+        return summaryDaily;
+    }
+
+    static summarize(data) {
+        let summary = {};
+        for (let venue in data) {
+            let prices = data[venue].prices || [];
+            let transactions = data[venue].transactions || [];
+            summary[venue] = {
+                prices: prices.slice(0, 1),
+                transactions: transactions.slice(0, 1),
+                price_count: prices.length,
+                transaction_count: transactions.length,
+                daily_transactions: TimeSeriesSerializer.countDailyTransactions(transactions)
+            };
+        }
+        return summary;
+    }
+
+    // false for summaries written before daily_transactions was kept
+    static isCurrentSummary(summary) {
+        return Object.values(summary).every(v => v.daily_transactions !== undefined);
+    }
+
+    static getFingerprint(file) {
+        // same as python's (st_mtime_ns, st_size), as strings
+        let stat = fs.statSync(file, {bigint: true});
+        return [stat.mtimeNs.toString(), stat.size.toString()];
+    }
+
+    readSummary(styleId) {
+        try {
+            return JSON.parse(fs.readFileSync(this.findSummaryPath(styleId)));
+        } catch (e) {
+            return {};
+        }
+    }
+
+    writeSummary(styleId, sizeSummaries) {
+        let manifest = this.readSummary(styleId);
+        for (let size in sizeSummaries) {
+            let outfile = this.storage === "log" ? this.findLogPath(styleId, size) : this.findPath(styleId, size);
+            manifest[size] = {
+                fingerprint: TimeSeriesSerializer.getFingerprint(outfile),
+                summary: sizeSummaries[size]
+            };
+        }
+        atomicWrite(this.findSummaryPath(styleId), JSON.stringify(manifest));
+    }
+
+    // the lock every writer of the style's files holds, see file_lock.js
+    lock(styleId) {
+        let dirname = "../data/" + styleId;
+        if (!fs.existsSync(dirname)) {
+            shell.mkdir('-p', dirname);
+        }
+        return new FileLock(dirname + "/" + LOCK_FILE);
+    }
+
+    readLog(outfile) {
+        let data = {};
+        for (let line of fs.readFileSync(outfile, "utf8").split("\n")) {
+            let record;
+            try {
+                record = JSON.parse(line);
+            } catch (e) {
+                // blank or torn trailing line
+                continue;
+            }
+            let venue = record.venue;
+            let type = record.type;
+            delete record.venue;
+            delete record.type;
+            if (data[venue] === undefined) {
+                data[venue] = {prices: [], transactions: []};
             }
+            if (type === "price") {
+                data[venue].prices.unshift(record);
+            } else if (type === "transaction") {
+                data[venue].transactions.unshift(record);
+            }
+        }
+        return data;
+    }
 
-            data[this.venue].prices.unshift({
-                time: updateTime.toISOString(),
-                bid_price: sizePrices[size]["bestBid"],
-                ask_price: sizePrices[size]["bestAsk"],
-                annual_high: sizePrices[size]["annualHigh"],
-                annual_low: sizePrices[size]["annualLow"],
-                volatility: sizePrices[size]["volatility"],
-                sale_72_hours: sizePrices[size]["salesLast72Hours"],
-                number_asks: sizePrices[size]["numberOfAsks"],
-                number_bids: sizePrices[size]["numberOfBids"]
-            })
+    // summary of a log before it is appended to
+    getCurrentLogSummary(manifest, styleId, size) {
+        let outfile = this.findLogPath(styleId, size);
+        if (!fs.existsSync(outfile)) {
+            return {};
+        }
+        let entry = manifest[size];
+        if (entry !== undefined &&
+            JSON.stringify(entry.fingerprint) === JSON.stringify(TimeSeriesSerializer.getFingerprint(outfile)) &&
+            TimeSeriesSerializer.isCurrentSummary(entry.summary)) {
+            return entry.summary;
+        }
+        return TimeSeriesSerializer.summarize(this.readLog(outfile));
+    }
 
-            fs.writeFileSync(outfile, JSON.stringify(data));
+    makePriceRecord(updateTime, prices) {
+        return {
+            time: updateTime.toISOString(),
+            bid_price: prices["bestBid"],
+            ask_price: prices["bestAsk"],
+            annual_high: prices["annualHigh"],
+            annual_low: prices["annualLow"],
+            volatility: prices["volatility"],
+            sale_72_hours: prices["salesLast72Hours"],
+            number_asks: prices["numberOfAsks"],
+            number_bids: prices["numberOfBids"]
+        };
+    }
+
+    appendLog(updateTime, styleId, sizePrices) {
+        // appends are single writes, the lock keeps the manifest in step with them
+        this.lock(styleId).withLock(() => {
+            let manifest = this.readSummary(styleId);
+            let sizeSummaries = {};
+            for (let size in sizePrices) {
+                let outfile = this.findLogPath(styleId, size);
+                let summary = this.getCurrentLogSummary(manifest, styleId, size);
+                let priceRecord = this.makePriceRecord(updateTime, sizePrices[size]);
+                let record = Object.assign({}, priceRecord, {
+                    venue: this.venue,
+                    type: "price"
+                });
+                fs.appendFileSync(outfile, JSON.stringify(record) + "\n");
+
+                if (summary[this.venue] === undefined) {
+                    summary[this.venue] = TimeSeriesSerializer.summarize({[this.venue]: {}})[this.venue];
+                }
+                summary[this.venue].prices = [priceRecord];
+                summary[this.venue].price_count += 1;
+                sizeSummaries[size] = summary;
+            }
+            if (Object.keys(sizeSummaries).length > 0) {
+                this.writeSummary(styleId, sizeSummaries);
+            }
+        });
+    }
+
+    update(updateTime, styleId, sizePrices) {
+        if (this.storage === "log") {
+            return this.appendLog(updateTime, styleId, sizePrices);
         }
+        // the du feed may be updating the same files
+        this.lock(styleId).withLock(() => {
+            let sizeSummaries = {};
+            for (let size in sizePrices) {
+                let outfile = this.findPath(styleId, size);
+                let data = {};
+                if (fs.existsSync(outfile)) {
+                    data = JSON.parse(fs.readFileSync(outfile));
+                    console.log(outfile + " exists, updating");
+                }
+                if (data[this.venue] === undefined) {
+                    data[this.venue] = {
+                        prices: [],
+                        transactions: []
+                    }
+                }
+
+                data[this.venue].prices.unshift(this.makePriceRecord(updateTime, sizePrices[size]));
+
+                atomicWrite(outfile, JSON.stringify(data));
+                sizeSummaries[size] = TimeSeriesSerializer.summarize(data);
+            }
+            if (Object.keys(sizeSummaries).length > 0) {
+                this.writeSummary(styleId, sizeSummaries);
+            }
+        });
     }
 }
 
@@ -1,13 +1,123 @@
+import datetime
 import json
 import os
 import glob
 import pathlib
 
+from file_lock import FileLock, LOCK_FILE, atomic_write
+
+# time formats written by feeds over time, newest first
+TIME_FORMATS = [
+    "%Y-%m-%dT%H:%M:%S.%fZ",
+    "%Y-%m-%dT%H:%M:%S.%f",
+    "%Y-%m-%dT%H:%M:%SZ",
+    "%Y%m%d-%H%M%S",
+]
+
+
+def parse_time(timestr):
+    """
+    Parse a stored reading or transaction time to a naive UTC datetime
+    """
+    for time_format in TIME_FORMATS:
+        try:
+            return datetime.datetime.strptime(timestr, time_format)
+        except ValueError:
+            continue
+    raise RuntimeError("unrecognized time {}".format(timestr))
+
+
+# days of transaction counts summaries keep, up to the latest transaction
+SUMMARY_DAYS = 30
+
+
+def get_first_summary_day(latest_day):
+    """
+    @param latest_day  str YYYY-MM-DD
+    @return str YYYY-MM-DD, the first day of the SUMMARY_DAYS ending on latest_day
+    """
+    latest = datetime.datetime.strptime(latest_day, "%Y-%m-%d")
+    return (latest - datetime.timedelta(days=SUMMARY_DAYS - 1)).strftime("%Y-%m-%d")
+
+
+def is_day(day):
+    try:
+        datetime.datetime.strptime(day, "%Y-%m-%d")
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
+def get_day(timestr):
+    """
+    @return str YYYY-MM-DD of a stored time, None if it isn't one
+    """
+    if is_day((timestr or "")[:10]):
+        return timestr[:10]
+    try:
+        return parse_time(timestr).strftime("%Y-%m-%d")
+    except (RuntimeError, TypeError):
+        return None
+
+
+def count_daily_transactions(transactions, daily=None):
+    """
+    @param transactions  list of transactions, latest first
+    @param daily  {YYYY-MM-DD: count} (optional) counts of older transactions
+    @return {YYYY-MM-DD: count} of the SUMMARY_DAYS up to the latest transaction
+    """
+    daily = {day: count for day, count in (daily or {}).items() if is_day(day)}
+    latest_day = max(daily) if daily else None
+    first_day = get_first_summary_day(latest_day) if latest_day else None
+    for t in transactions:
+        day = get_day(t.get("time"))
+        if day is None:
+            continue
+        if latest_day is None or day > latest_day:
+            latest_day = day
+            first_day = get_first_summary_day(latest_day)
+        elif day < first_day:
+            # the rest is older still
+            break
+        daily[day] = daily.get(day, 0) + 1
+    return {day: count for day, count in daily.items() if day >= first_day}
+
+
+def summarize(data):
+    """
+    @param data  {venue: {"prices": [...], "transactions": [...]}} of a size
+    @return the same view with only the latest price reading and transaction of
+        each venue, plus price_count, transaction_count and daily_transactions
+        (see count_daily_transactions)
+    """
+    summary = {}
+    for venue, v in data.items():
+        prices = v.get("prices", [])
+        transactions = v.get("transactions", [])
+        summary[venue] = {
+            "prices": prices[:1],
+            "transactions": transactions[:1],
+            "price_count": len(prices),
+            "transaction_count": len(transactions),
+            "daily_transactions": count_daily_transactions(transactions),
+        }
+    return summary
+
+
+def is_current_summary(summary):
+    """
+    @return False for summaries written before daily_transactions was kept
+    """
+    return all("daily_transactions" in v for v in summary.values())
+
 
 class TimeSeriesSerializer:
+    # per style manifest of the latest state of each size, next to the size
+    # files (a dot file, so the size file globs never pick it up)
+    summary_file = ".summary.json"
+
     def __init__(self, parent_folder=None):
-        if not parent_folder:
-            self.parent_folder = "../data"
+        self.parent_folder = parent_folder if parent_folder else "../data"
         return
 
     def _find_path(self, style_id, size):
@@ -38,6 +148,106 @@ class TimeSeriesSerializer:
                 size_prices[size] = data
         return size_prices
 
+    def _find_summary_path(self, style_id):
+        return self._find_parent_path(style_id) + self.summary_file
+
+    @staticmethod
+    def _get_fingerprint(f):
+        stat = os.stat(f)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _read_summary(self, style_id):
+        """
+        @return {size: {"fingerprint": [mtime_ns, bytes], "summary": {...}}}, empty
+            if the style has no (readable) manifest
+        """
+        try:
+            with open(self._find_summary_path(style_id), "r") as infile:
+                return json.loads(infile.read())
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _write_summary(self, style_id, size_summaries):
+        """
+        Point the manifest entries of the given sizes at their size files as
+        they are now.
+
+        @param size_summaries  {size: summarize() of the size file just written}
+        """
+        manifest = self._read_summary(style_id)
+        for size, summary in size_summaries.items():
+            fingerprint = self._get_fingerprint(self._find_path(style_id, size))
+            manifest[size] = {
+                # mtime as a string, node can only hand it back as a BigInt
+                "fingerprint": [str(x) for x in fingerprint],
+                "summary": summary,
+            }
+        atomic_write(self._find_summary_path(style_id), json.dumps(manifest))
+        return
+
+    def _summarize_size(self, style_id, size):
+        return summarize(self.get(style_id, size)[size])
+
+    def get_summary(self, style_id):
+        """
+        Same as get, with only what summarize keeps of each size, read from the
+        style's manifest. Sizes the manifest doesn't know of, whose files were
+        written since by a writer that didn't update it, or whose summary is
+        of an older format are summarized from their files.
+        """
+        manifest = self._read_summary(style_id)
+        size_prices = {}
+        for size, fingerprint in self.get_fingerprints(style_id).items():
+            entry = manifest.get(size)
+            if (
+                entry
+                and entry["fingerprint"] == [str(x) for x in fingerprint]
+                and is_current_summary(entry["summary"])
+            ):
+                size_prices[size] = entry["summary"]
+            else:
+                try:
+                    size_prices[size] = self._summarize_size(style_id, size)
+                except FileNotFoundError:
+                    continue
+        return size_prices
+
+    def write_summary(self, style_id):
+        """
+        (Re)build the manifest of a style from its size files.
+        """
+        if not os.path.isdir(self._find_parent_path(style_id)):
+            return 0
+        with self._lock(style_id):
+            size_summaries = {
+                size: summarize(data) for size, data in self.get(style_id).items()
+            }
+            if size_summaries:
+                self._write_summary(style_id, size_summaries)
+        return len(size_summaries)
+
+    def _lock(self, style_id):
+        """
+        @return the lock every writer of the style's files holds, see file_lock
+        """
+        pathlib.Path(self._find_parent_path(style_id)).mkdir(
+            parents=True, exist_ok=True
+        )
+        return FileLock(self._find_parent_path(style_id) + LOCK_FILE)
+
+    def get_fingerprints(self, style_id):
+        """
+        Cheap change detection without reading readings.
+
+        @return {size: fingerprint} of a style, a fingerprint changes whenever
+            readings of the size are written
+        """
+        fingerprints = {}
+        for f in glob.glob(self._find_path(style_id, "*")):
+            size = ".".join(os.path.basename(f).split(".")[:-1])
+            fingerprints[size] = self._get_fingerprint(f)
+        return fingerprints
+
     def get_all_historical_price(self, style_id, size, venue):
         f = self._find_path(style_id, size)
         with open(f, "r") as infile:
@@ -50,49 +260,64 @@ class TimeSeriesSerializer:
             data = json.loads(infile.read())
             return data[venue]["transactions"]
 
-    def update(self, venue, update_time, style_id, size_prices, size_transactions):
-        for size in size_prices:
-            outfile = self._find_path(style_id, size)
-            if os.path.isfile(outfile):
-                with open(outfile, "r") as infile:
-                    data = json.loads(infile.read())
+    @staticmethod
+    def _make_price_record(update_time, prices):
+        return {
+            "time": update_time.isoformat() + "Z",
+            "bid_price": prices["bid_price"] if "bid_price" in prices else None,
+            "ask_price": prices["ask_price"] if "ask_price" in prices else None,
+            "list_price": prices["list_price"] if "list_price" in prices else None,
+        }
+
+    @staticmethod
+    def _get_new_transactions(transactions, last_id):
+        """
+        Given transactions ordered latest first, return the ones newer than the
+        transaction identified by last_id (all of them if last_id isn't found)
+        """
+        if not last_id:
+            return transactions
+        idx = 0
+        for t in transactions:
+            if t["id"] == last_id:
+                break
             else:
-                outdir = os.path.dirname(outfile)
-                pathlib.Path(outdir).mkdir(parents=True, exist_ok=True)
-                data = {}
-
-            if not venue in data:
-                data[venue] = {"prices": [], "transactions": []}
-
-            prices = size_prices[size]
-            data[venue]["prices"].insert(
-                0,
-                {
-                    "time": update_time.isoformat() + "Z",
-                    "bid_price": prices["bid_price"] if "bid_price" in prices else None,
-                    "ask_price": prices["ask_price"] if "ask_price" in prices else None,
-                    "list_price": prices["list_price"]
-                    if "list_price" in prices
-                    else None,
-                },
-            )
-
-            if size in size_transactions:
-                transactions = size_transactions[size]
-                if len(data[venue]["transactions"]) > 0:
-                    last_id = data[venue]["transactions"][0]["id"]
-                    idx = 0
-                    for t in transactions:
-                        if t["id"] == last_id:
-                            break
-                        else:
-                            idx += 1
+                idx += 1
+        return transactions[:idx]
+
+    def update(self, venue, update_time, style_id, size_prices, size_transactions):
+        # the other venue's feed may be updating the same files
+        with self._lock(style_id):
+            size_summaries = {}
+            for size in size_prices:
+                outfile = self._find_path(style_id, size)
+                if os.path.isfile(outfile):
+                    with open(outfile, "r") as infile:
+                        data = json.loads(infile.read())
+                else:
+                    data = {}
+
+                if not venue in data:
+                    data[venue] = {"prices": [], "transactions": []}
+
+                data[venue]["prices"].insert(
+                    0, self._make_price_record(update_time, size_prices[size])
+                )
+
+                if size in size_transactions:
+                    last_id = (
+                        data[venue]["transactions"][0]["id"]
+                        if len(data[venue]["transactions"]) > 0
+                        else None
+                    )
                     data[venue]["transactions"] = (
-                        transactions[:idx] + data[venue]["transactions"]
+                        self._get_new_transactions(size_transactions[size], last_id)
+                        + data[venue]["transactions"]
                     )
-                else:
-                    data[venue]["transactions"] = transactions
 
-            with open(outfile, "w") as infile:
-                infile.write(json.dumps(data))
+                atomic_write(outfile, json.dumps(data))
+                size_summaries[size] = summarize(data)
+
+            if size_summaries:
+                self._write_summary(style_id, size_summaries)
         return
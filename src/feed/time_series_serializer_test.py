@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+
+import contextlib
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from time_series_serializer import SUMMARY_DAYS, count_daily_transactions, summarize
+from time_series_log_serializer import TimeSeriesLogSerializer
+from time_series_storage import get_time_series_serializer
+
+
+class TestSummaryManifest(unittest.TestCase):
+    def setUp(self):
+        self.data_folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_folder)
+        return
+
+    def write_readings(self, serializer):
+        now = datetime.datetime(2026, 10, 1)
+        transactions = [
+            {
+                "id": str(i),
+                "price": 50000 + i,
+                "time": "2026-09-{:02d}T00:00:00.000Z".format(i),
+            }
+            for i in range(10, 0, -1)
+        ]
+        serializer.update(
+            "du",
+            now,
+            "S1",
+            {"9": {"list_price": 60000}, "10": {"list_price": 61000}},
+            {"9": transactions[3:]},
+        )
+        serializer.update(
+            "du",
+            now + datetime.timedelta(hours=1),
+            "S1",
+            {"9": {"list_price": 59000}},
+            {"9": transactions},
+        )
+        return
+
+    def test_summary_matches_full_history(self):
+        for storage in ["json", "log", "sqlite"]:
+            serializer = get_time_series_serializer(storage, self.data_folder)
+            self.write_readings(serializer)
+            summary = serializer.get_summary("S1")
+            self.assertEqual(
+                summary,
+                {size: summarize(data) for size, data in serializer.get("S1").items()},
+            )
+            self.assertEqual(summary["9"]["du"]["price_count"], 2)
+            self.assertEqual(summary["9"]["du"]["transaction_count"], 10)
+            self.assertEqual(summary["9"]["du"]["transactions"][0]["id"], "10")
+            self.assertEqual(summary["9"]["du"]["prices"][0]["list_price"], 59000)
+            self.assertEqual(
+                summary["9"]["du"]["daily_transactions"],
+                {"2026-09-{:02d}".format(i): 1 for i in range(1, 11)},
+            )
+
+    def test_stale_manifest_is_not_trusted(self):
+        serializer = get_time_series_serializer("json", self.data_folder)
+        self.write_readings(serializer)
+        # a writer that doesn't know about the manifest
+        path = "{}/S1/10.json".format(self.data_folder)
+        with open(path, "r") as infile:
+            data = json.loads(infile.read())
+        data["du"]["prices"].insert(0, dict(data["du"]["prices"][0], list_price=1))
+        with open(path, "w") as outfile:
+            outfile.write(json.dumps(data))
+        summary = serializer.get_summary("S1")
+        self.assertEqual(summary["10"]["du"]["prices"][0]["list_price"], 1)
+        self.assertEqual(summary["10"]["du"]["price_count"], 2)
+
+
+class TestDailyTransactions(unittest.TestCase):
+    def test_incremental_counts_match(self):
+        start = datetime.datetime(2026, 8, 1)
+        transactions = [
+            {"time": (start + datetime.timedelta(hours=7 * i)).isoformat() + "Z"}
+            for i in range(400, -1, -1)
+        ]
+        daily = count_daily_transactions(transactions)
+        self.assertEqual(len(daily), SUMMARY_DAYS)
+        self.assertEqual(max(daily), transactions[0]["time"][:10])
+        incremental = count_daily_transactions(transactions[300:])
+        for i in range(300, 0, -50):
+            incremental = count_daily_transactions(
+                transactions[i - 50 : i], incremental
+            )
+        self.assertEqual(incremental, daily)
+
+
+class TestLogSerializer(unittest.TestCase):
+    def setUp(self):
+        self.data_folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_folder)
+        self.serializer = get_time_series_serializer("log", self.data_folder)
+        self.now = datetime.datetime(2026, 10, 1)
+        return
+
+    def test_update_only_reads_the_manifest(self):
+        a = {"id": "a", "price": 50000, "time": "2026-09-01T00:00:00.000Z"}
+        b = {"id": "b", "price": 51000, "time": "2026-09-02T00:00:00.000Z"}
+        self.serializer.update("du", self.now, "S1", {"9": {}, "10": {}}, {"9": [a]})
+        with mock.patch("builtins.open", wraps=open) as opened:
+            self.serializer.update(
+                "du", self.now, "S1", {"9": {}, "10": {}}, {"9": [b, a], "10": [a]}
+            )
+        # logs are only appended to
+        self.assertEqual(
+            [
+                c
+                for c in opened.call_args_list
+                if c[0][0].endswith(".jsonl") and c[0][1] != "a"
+            ],
+            [],
+        )
+        size_prices = self.serializer.get("S1")
+        self.assertEqual(
+            [t["id"] for t in size_prices["9"]["du"]["transactions"]], ["b", "a"]
+        )
+        self.assertEqual(
+            [t["id"] for t in size_prices["10"]["du"]["transactions"]], ["a"]
+        )
+
+    def write_json_and_log(self):
+        """
+        @return a json serializer given the same updates as self.serializer
+        """
+        json_serializer = get_time_series_serializer("json", self.data_folder)
+        transactions = [
+            {"id": str(i), "price": 50000 + i, "time": "2026-09-{:02d}".format(i)}
+            for i in range(6, 0, -1)
+        ]
+        for serializer in [json_serializer, self.serializer]:
+            serializer.update(
+                "du", self.now, "S1", {"9": {"list_price": 1}}, {"9": transactions[2:]}
+            )
+            serializer.update(
+                "du",
+                self.now + datetime.timedelta(hours=1),
+                "S1",
+                {"9": {"list_price": 2}, "10": {"list_price": 3}},
+                {"9": transactions},
+            )
+        return json_serializer
+
+    def test_same_view_as_json(self):
+        json_serializer = self.write_json_and_log()
+        self.assertEqual(self.serializer.get("S1"), json_serializer.get("S1"))
+        self.assertEqual(
+            [t["id"] for t in self.serializer.get_all_transactions("S1", "9", "du")],
+            ["6", "5", "4", "3", "2", "1"],
+        )
+        with open("{}/S1/9.jsonl".format(self.data_folder), "r") as infile:
+            records = [json.loads(line) for line in infile]
+        # appended in the order observed: 4 transactions, a price, 2 more, a price
+        self.assertEqual([r["type"][0] for r in records], list("ttttpttp"))
+        self.assertEqual(records[0]["id"], "1")
+
+    def test_migrated_log_round_trip(self):
+        json_serializer = self.write_json_and_log()
+        data = json_serializer.get("S1", "9")["9"]
+        outfile = "{}/S2/9.jsonl".format(self.data_folder)
+        self.serializer.append_records(
+            outfile, TimeSeriesLogSerializer.to_records(data)
+        )
+        self.assertEqual(self.serializer.get("S2", "9")["9"], data)
+
+    def test_torn_trailing_record_is_skipped(self):
+        json_serializer = self.write_json_and_log()
+        with open("{}/S1/9.jsonl".format(self.data_folder), "a") as outfile:
+            outfile.write('{"venue": "du", "type": "pri')
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            self.assertEqual(
+                self.serializer.get("S1", "9"), json_serializer.get("S1", "9")
+            )
+
+
+class TestSqliteImport(unittest.TestCase):
+    def setUp(self):
+        self.data_folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_folder)
+        return
+
+    def test_import_again_after_update(self):
+        serializer = get_time_series_serializer("sqlite", self.data_folder)
+        self.addCleanup(serializer.close)
+        a = {"id": "a", "price": 50000, "time": "2026-09-01T00:00:00.000Z"}
+        b = {"id": "b", "price": 51000, "time": "2026-09-02T00:00:00.000Z"}
+        price = {"time": "2026-09-01T00:00:00.000Z", "list_price": 60000}
+        imported = {"9": {"du": {"prices": [price], "transactions": [a]}}}
+        serializer.import_size_prices("S1", imported)
+        serializer.update(
+            "du", datetime.datetime(2026, 10, 1), "S1", {"9": {}}, {"9": [b, a]}
+        )
+        serializer.import_size_prices("S1", imported)
+        transactions = serializer.get_all_transactions("S1", "9", "du")
+        self.assertEqual([t["id"] for t in transactions], ["b", "a"])
+        self.assertEqual(len(serializer.get_all_historical_price("S1", "9", "du")), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+
+import argparse
+import datetime
+import json
+import os
+import pathlib
+
+import numpy as np
+
+from static_info_serializer import StaticInfoSerializer
+from time_series_serializer import parse_time
+from time_series_storage import get_time_series_serializer
+
+"""
+Columnar snapshot of the whole time series catalog for analytics.
+
+Compiles every (style_id, size, venue) of the catalog into flat NumPy columns
+saved as one .npy file each, so they can be memory mapped:
+  - pair_style, pair_size, pair_venue: categorical codes of each pair, indexing
+    the style_ids / sizes / venues lists in catalog.json
+  - price_* and transaction_*: readings of all pairs back to back, oldest first
+    within a pair. Readings of pair i are [offsets[i], offsets[i + 1])
+  - times are datetime64[us] (UTC), prices are int64 in hundredths of the
+    venue's currency (du: CNY fen as stored, stockx: USD cents), MISSING where
+    the reading has no value
+
+CatalogSnapshot loads a snapshot and hands out zero-copy slices per pair.
+"""
+
+MISSING = -1
+
+# multiplier from stored price to hundredths of the venue's currency
+PRICE_SCALE = {"du": 1, "stockx": 100}
+
+PRICE_FIELDS = ["bid_price", "ask_price", "list_price", "annual_high", "annual_low"]
+PRICE_COUNT_FIELDS = ["sale_72_hours"]
+PRICE_FLOAT_FIELDS = ["volatility"]
+
+
+def to_cents(value, scale):
+    if value is None:
+        return MISSING
+    return int(round(float(value) * scale))
+
+
+class CatalogSnapshotBuilder:
+    def __init__(self):
+        self.style_ids = []
+        self.sizes = []
+        self.venues = []
+        self.codes = {"style_id": {}, "size": {}, "venue": {}}
+
+        self.pairs = {"pair_style": [], "pair_size": [], "pair_venue": []}
+        self.price_offsets = [0]
+        self.transaction_offsets = [0]
+        self.price_columns = {"price_time": []}
+        for field in PRICE_FIELDS + PRICE_COUNT_FIELDS + PRICE_FLOAT_FIELDS:
+            self.price_columns["price_" + field] = []
+        self.transaction_columns = {"transaction_time": [], "transaction_price": []}
+        return
+
+    def _get_code(self, kind, values, value):
+        if value not in self.codes[kind]:
+            self.codes[kind][value] = len(values)
+            values.append(value)
+        return self.codes[kind][value]
+
+    def add_size_prices(self, style_id, size_prices):
+        """
+        @param size_prices  {size: {venue: {"prices": [...], "transactions": [...]}}}
+            as returned by TimeSeriesSerializer.get
+        """
+        for size in sorted(size_prices):
+            for venue in sorted(size_prices[size]):
+                data = size_prices[size][venue]
+                scale = PRICE_SCALE.get(venue, 1)
+                self.pairs["pair_style"].append(
+                    self._get_code("style_id", self.style_ids, style_id)
+                )
+                self.pairs["pair_size"].append(
+                    self._get_code("size", self.sizes, size)
+                )
+                self.pairs["pair_venue"].append(
+                    self._get_code("venue", self.venues, venue)
+                )
+
+                prices = data.get("prices", [])[::-1]
+                for p in prices:
+                    self.price_columns["price_time"].append(parse_time(p["time"]))
+                    for field in PRICE_FIELDS:
+                        self.price_columns["price_" + field].append(
+                            to_cents(p.get(field), scale)
+                        )
+                    for field in PRICE_COUNT_FIELDS:
+                        value = p.get(field)
+                        self.price_columns["price_" + field].append(
+                            MISSING if value is None else int(value)
+                        )
+                    for field in PRICE_FLOAT_FIELDS:
+                        value = p.get(field)
+                        self.price_columns["price_" + field].append(
+                            np.nan if value is None else float(value)
+                        )
+                self.price_offsets.append(self.price_offsets[-1] + len(prices))
+
+                transactions = data.get("transactions", [])[::-1]
+                for t in transactions:
+                    self.transaction_columns["transaction_time"].append(
+                        parse_time(t["time"])
+                    )
+                    self.transaction_columns["transaction_price"].append(
+                        to_cents(t["price"], scale)
+                    )
+                self.transaction_offsets.append(
+                    self.transaction_offsets[-1] + len(transactions)
+                )
+        return
+
+    def save(self, out_folder):
+        pathlib.Path(out_folder).mkdir(parents=True, exist_ok=True)
+        columns = {
+            "pair_style": np.array(self.pairs["pair_style"], dtype=np.int32),
+            "pair_size": np.array(self.pairs["pair_size"], dtype=np.int32),
+            "pair_venue": np.array(self.pairs["pair_venue"], dtype=np.int8),
+            "price_offsets": np.array(self.price_offsets, dtype=np.int64),
+            "transaction_offsets": np.array(self.transaction_offsets, dtype=np.int64),
+        }
+        for name, values in self.price_columns.items():
+            if name == "price_time":
+                columns[name] = np.array(values, dtype="datetime64[us]")
+            elif name[len("price_") :] in PRICE_FLOAT_FIELDS:
+                columns[name] = np.array(values, dtype=np.float64)
+            else:
+                columns[name] = np.array(values, dtype=np.int64)
+        columns["transaction_time"] = np.array(
+            self.transaction_columns["transaction_time"], dtype="datetime64[us]"
+        )
+        columns["transaction_price"] = np.array(
+            self.transaction_columns["transaction_price"], dtype=np.int64
+        )
+
+        for name, array in columns.items():
+            np.save(os.path.join(out_folder, name + ".npy"), array)
+        with open(os.path.join(out_folder, "catalog.json"), "w") as outfile:
+            outfile.write(
+                json.dumps(
+                    {
+                        "created": datetime.datetime.utcnow().isoformat() + "Z",
+                        "style_ids": self.style_ids,
+                        "sizes": self.sizes,
+                        "venues": self.venues,
+                        "price_scale": PRICE_SCALE,
+                        "missing": MISSING,
+                        "columns": sorted(columns.keys()),
+                    }
+                )
+            )
+        print(
+            "saved {} pairs, {} price readings, {} transactions to {}".format(
+                len(columns["pair_style"]),
+                len(columns["price_time"]),
+                len(columns["transaction_time"]),
+                out_folder,
+            )
+        )
+        return
+
+
+class CatalogSnapshot:
+    def __init__(self, snapshot_folder, mmap_mode="r"):
+        with open(os.path.join(snapshot_folder, "catalog.json"), "r") as infile:
+            self.catalog = json.loads(infile.read())
+        self.style_ids = self.catalog["style_ids"]
+        self.sizes = self.catalog["sizes"]
+        self.venues = self.catalog["venues"]
+        self.columns = {}
+        for name in self.catalog["columns"]:
+            self.columns[name] = np.load(
+                os.path.join(snapshot_folder, name + ".npy"), mmap_mode=mmap_mode
+            )
+
+        self.pair_index = {}
+        for idx, (style, size, venue) in enumerate(
+            zip(
+                self.columns["pair_style"],
+                self.columns["pair_size"],
+                self.columns["pair_venue"],
+            )
+        ):
+            self.pair_index[
+                (self.style_ids[style], self.sizes[size], self.venues[venue])
+            ] = idx
+        return
+
+    def __len__(self):
+        return len(self.pair_index)
+
+    def pairs(self):
+        """
+        @return list of (style_id, size, venue) in snapshot order
+        """
+        return sorted(self.pair_index, key=lambda k: self.pair_index[k])
+
+    def _get_slices(self, style_id, size, venue, prefix):
+        idx = self.pair_index[(style_id, size, venue)]
+        offsets = self.columns[prefix + "_offsets"]
+        start, end = offsets[idx], offsets[idx + 1]
+        return {
+            name[len(prefix) + 1 :]: array[start:end]
+            for name, array in self.columns.items()
+            if name.startswith(prefix + "_") and name != prefix + "_offsets"
+        }
+
+    def get_prices(self, style_id, size, venue):
+        """
+        @return {"time": datetime64 array, "bid_price": int64 array, ...} views of
+            the pair's price readings, oldest first
+        @throws KeyError if the pair isn't in the snapshot
+        """
+        return self._get_slices(style_id, size, venue, "price")
+
+    def get_transactions(self, style_id, size, venue):
+        """
+        @return {"time": datetime64 array, "price": int64 array} views of the
+            pair's transactions, oldest first
+        @throws KeyError if the pair isn't in the snapshot
+        """
+        return self._get_slices(style_id, size, venue, "transaction")
+
+
+def compile_snapshot(static_info_file, data_folder, storage, out_folder):
+    static_info, _ = StaticInfoSerializer().load_static_info_from_csv(
+        static_info_file, return_key="style_id"
+    )
+    serializer = get_time_series_serializer(storage, data_folder)
+    builder = CatalogSnapshotBuilder()
+    for style_id in static_info:
+        builder.add_size_prices(style_id, serializer.get(style_id))
+    builder.save(out_folder)
+    return
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        """
+        compile stored time series of a catalog into a memory-mappable columnar snapshot.
+
+        example usage:
+          ./time_series_snapshot.py --start_from merged.20191225.csv --out ../data/snapshot
+    """
+    )
+    parser.add_argument(
+        "--start_from", help="the merged static info listing the styles to export"
+    )
+    parser.add_argument(
+        "--data_folder",
+        help="the data folder from where to look for price and transaction readings",
+    )
+    parser.add_argument(
+        "--storage",
+        default="json",
+        help="[json|log|sqlite] how time series readings are stored",
+    )
+    parser.add_argument(
+        "--out", default="../data/snapshot", help="the folder to write the snapshot to"
+    )
+    args = parser.parse_args()
+    if not args.start_from:
+        raise RuntimeError("args.start_from is required in snapshot")
+    compile_snapshot(args.start_from, args.data_folder, args.storage, args.out)
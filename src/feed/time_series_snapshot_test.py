@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+import contextlib
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from time_series_snapshot import MISSING, CatalogSnapshot, CatalogSnapshotBuilder
+
+SIZE_PRICES = {
+    "S1": {
+        "9": {
+            "du": {
+                "prices": [
+                    {"time": "2026-09-02T00:00:00.000Z", "list_price": 61000},
+                    {"time": "20260901-000000", "list_price": 60000},
+                ],
+                "transactions": [
+                    {"id": "2", "price": 52000, "time": "2026-09-02T01:00:00.000Z"},
+                    {"id": "1", "price": 51000, "time": "2026-09-01T01:00:00.000Z"},
+                ],
+            },
+            "stockx": {
+                "prices": [
+                    {
+                        "time": "2026-09-02T00:00:00.000Z",
+                        "bid_price": 180,
+                        "ask_price": 210.5,
+                        "sale_72_hours": 4,
+                        "volatility": 0.07,
+                    }
+                ],
+                "transactions": [],
+            },
+        }
+    },
+    "S2": {"10": {"du": {"prices": [], "transactions": []}}},
+}
+
+
+class TestCatalogSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+        builder = CatalogSnapshotBuilder()
+        for style_id, size_prices in SIZE_PRICES.items():
+            builder.add_size_prices(style_id, size_prices)
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            builder.save(self.folder)
+        self.snapshot = CatalogSnapshot(self.folder)
+        return
+
+    def test_pairs(self):
+        self.assertEqual(len(self.snapshot), 3)
+        self.assertEqual(
+            self.snapshot.pairs(),
+            [("S1", "9", "du"), ("S1", "9", "stockx"), ("S2", "10", "du")],
+        )
+        with self.assertRaises(KeyError):
+            self.snapshot.get_prices("S3", "9", "du")
+
+    def test_round_trip(self):
+        prices = self.snapshot.get_prices("S1", "9", "du")
+        # oldest first
+        self.assertEqual(
+            list(prices["time"]),
+            [
+                np.datetime64("2026-09-01T00:00:00"),
+                np.datetime64("2026-09-02T00:00:00"),
+            ],
+        )
+        self.assertEqual(list(prices["list_price"]), [60000, 61000])
+        self.assertEqual(list(prices["bid_price"]), [MISSING, MISSING])
+        self.assertTrue(np.isnan(prices["volatility"]).all())
+
+        transactions = self.snapshot.get_transactions("S1", "9", "du")
+        self.assertEqual(list(transactions["price"]), [51000, 52000])
+        self.assertEqual(transactions["time"][1], np.datetime64("2026-09-02T01:00:00"))
+
+        # stockx prices in cents
+        stockx = self.snapshot.get_prices("S1", "9", "stockx")
+        self.assertEqual(list(stockx["bid_price"]), [18000])
+        self.assertEqual(list(stockx["ask_price"]), [21050])
+        self.assertEqual(list(stockx["sale_72_hours"]), [4])
+        self.assertEqual(list(stockx["volatility"]), [0.07])
+        self.assertEqual(
+            len(self.snapshot.get_transactions("S1", "9", "stockx")["price"]), 0
+        )
+        self.assertEqual(len(self.snapshot.get_prices("S2", "10", "du")["time"]), 0)
+
+    def test_slices_are_memory_mapped(self):
+        prices = self.snapshot.get_prices("S1", "9", "du")
+        self.assertIsInstance(prices["list_price"].base, np.memmap)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,294 @@
+import json
+import os
+import pathlib
+import sqlite3
+
+from time_series_serializer import TimeSeriesSerializer, count_daily_transactions
+
+"""
+SQLite storage for time series readings, one database file under the data
+folder (data/time_series.db).
+
+Price readings keep their full record (stockx readings carry more fields than du)
+next to indexed time / price columns. Rows of a (style_id, size, venue) are
+returned in insertion order, latest first, which is the same view
+TimeSeriesSerializer.get builds from JSON files. The database runs in WAL mode
+so strategy can read while a feed writes.
+"""
+
+
+class TimeSeriesSqliteSerializer(TimeSeriesSerializer):
+    db_file_name = "time_series.db"
+
+    def __init__(self, parent_folder=None):
+        super().__init__(parent_folder)
+        pathlib.Path(self.parent_folder).mkdir(parents=True, exist_ok=True)
+        self.db_path = os.path.join(self.parent_folder, self.db_file_name)
+        self.conn = sqlite3.connect(self.db_path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_tables()
+        return
+
+    def _create_tables(self):
+        with self.conn:
+            self.conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS prices (
+                    style_id TEXT NOT NULL,
+                    size TEXT NOT NULL,
+                    venue TEXT NOT NULL,
+                    time TEXT NOT NULL,
+                    bid_price REAL,
+                    ask_price REAL,
+                    list_price REAL,
+                    record TEXT NOT NULL,
+                    UNIQUE (style_id, size, venue, time)
+                );
+                CREATE TABLE IF NOT EXISTS transactions (
+                    style_id TEXT NOT NULL,
+                    size TEXT NOT NULL,
+                    venue TEXT NOT NULL,
+                    time TEXT NOT NULL,
+                    price REAL,
+                    id TEXT
+                );
+                CREATE INDEX IF NOT EXISTS transactions_pair_time
+                    ON transactions (style_id, size, venue, time);
+                """
+            )
+            if not self.conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?",
+                ("transactions_unique",),
+            ).fetchone():
+                # databases imported before the index may hold duplicates,
+                # keep the first copy of each
+                self.conn.execute(
+                    """
+                    DELETE FROM transactions WHERE rowid NOT IN (
+                        SELECT MIN(rowid) FROM transactions
+                        GROUP BY style_id, size, venue, id, time)
+                    """
+                )
+                self.conn.execute(
+                    """
+                    CREATE UNIQUE INDEX transactions_unique
+                        ON transactions (style_id, size, venue, id, time)
+                    """
+                )
+        return
+
+    def close(self):
+        self.conn.close()
+        return
+
+    def _insert_prices(self, style_id, size, venue, prices):
+        """
+        @param prices  list of price records, oldest first
+        """
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO prices "
+            "(style_id, size, venue, time, bid_price, ask_price, list_price, record) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    style_id,
+                    size,
+                    venue,
+                    p["time"],
+                    p.get("bid_price"),
+                    p.get("ask_price"),
+                    p.get("list_price"),
+                    json.dumps(p),
+                )
+                for p in prices
+            ],
+        )
+        return
+
+    def _insert_transactions(self, style_id, size, venue, transactions):
+        """
+        @param transactions  list of transactions ordered latest first, the ones
+            not newer than the last stored transaction are dropped, as are the
+            ones already stored (the last stored one may not be in the list,
+            e.g. files imported again after the feed wrote to the database)
+        """
+        row = self.conn.execute(
+            "SELECT id FROM transactions WHERE style_id = ? AND size = ? AND venue = ? "
+            "ORDER BY rowid DESC LIMIT 1",
+            (style_id, size, venue),
+        ).fetchone()
+        new_transactions = self._get_new_transactions(
+            transactions, row[0] if row else None
+        )
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO transactions "
+            "(style_id, size, venue, time, price, id) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (style_id, size, venue, t["time"], t["price"], t["id"])
+                for t in new_transactions[::-1]
+            ],
+        )
+        return
+
+    def _select(self, style_id, size=None, venue=None):
+        conditions = "style_id = ?"
+        params = [style_id]
+        if size:
+            conditions += " AND size = ?"
+            params.append(size)
+        if venue:
+            conditions += " AND venue = ?"
+            params.append(venue)
+
+        size_prices = {}
+
+        def get_venue(size, venue):
+            if size not in size_prices:
+                size_prices[size] = {}
+            if venue not in size_prices[size]:
+                size_prices[size][venue] = {"prices": [], "transactions": []}
+            return size_prices[size][venue]
+
+        for size, venue, record in self.conn.execute(
+            "SELECT size, venue, record FROM prices WHERE "
+            + conditions
+            + " ORDER BY rowid DESC",
+            params,
+        ):
+            get_venue(size, venue)["prices"].append(json.loads(record))
+        for size, venue, price, time, id in self.conn.execute(
+            "SELECT size, venue, price, time, id FROM transactions WHERE "
+            + conditions
+            + " ORDER BY rowid DESC",
+            params,
+        ):
+            get_venue(size, venue)["transactions"].append(
+                {"price": price, "time": time, "id": id}
+            )
+        return size_prices
+
+    def get(self, style_id, size=None):
+        """
+        Same as TimeSeriesSerializer.get, reading the database.
+
+        Throws FileNotFoundError if size is given and no readings can be found
+        """
+        size_prices = self._select(style_id, size)
+        if size and size not in size_prices:
+            raise FileNotFoundError("no readings for {} {}".format(style_id, size))
+        return size_prices
+
+    def get_fingerprints(self, style_id):
+        """
+        Same as TimeSeriesSerializer.get_fingerprints: the newest price and
+        transaction rowids of each size.
+        """
+        fingerprints = {}
+        for table in ["prices", "transactions"]:
+            for size, rowid in self.conn.execute(
+                "SELECT size, MAX(rowid) FROM "
+                + table
+                + " WHERE style_id = ? GROUP BY size",
+                (style_id,),
+            ):
+                fingerprints[size] = fingerprints.get(size, ()) + ((table, rowid),)
+        return fingerprints
+
+    def get_summary(self, style_id):
+        """
+        Same as TimeSeriesSerializer.get_summary, the database is its own
+        manifest: one aggregate per table.
+        """
+        size_prices = {}
+
+        def get_venue(size, venue):
+            if size not in size_prices:
+                size_prices[size] = {}
+            if venue not in size_prices[size]:
+                size_prices[size][venue] = {
+                    "prices": [],
+                    "transactions": [],
+                    "price_count": 0,
+                    "transaction_count": 0,
+                    "daily_transactions": {},
+                }
+            return size_prices[size][venue]
+
+        # bare columns of a MAX() aggregate come from the row holding the max
+        for size, venue, count, _, record in self.conn.execute(
+            "SELECT size, venue, COUNT(*), MAX(rowid), record FROM prices"
+            " WHERE style_id = ? GROUP BY size, venue",
+            (style_id,),
+        ):
+            get_venue(size, venue)["prices"] = [json.loads(record)]
+            get_venue(size, venue)["price_count"] = count
+        for size, venue, count, _, price, time, id in self.conn.execute(
+            "SELECT size, venue, COUNT(*), MAX(rowid), price, time, id FROM transactions"
+            " WHERE style_id = ? GROUP BY size, venue",
+            (style_id,),
+        ):
+            get_venue(size, venue)["transactions"] = [
+                {"price": price, "time": time, "id": id}
+            ]
+            get_venue(size, venue)["transaction_count"] = count
+        for size, venue, day, count in self.conn.execute(
+            # day of either YYYY-MM-DDTHH... or YYYYMMDD-HHMMSS times
+            "SELECT size, venue, CASE WHEN substr(time, 9, 1) = '-'"
+            " THEN substr(time, 1, 4) || '-' || substr(time, 5, 2) || '-'"
+            " || substr(time, 7, 2) ELSE substr(time, 1, 10) END, COUNT(*)"
+            " FROM transactions WHERE style_id = ? GROUP BY size, venue, 3",
+            (style_id,),
+        ):
+            get_venue(size, venue)["daily_transactions"][day] = count
+        for venues in size_prices.values():
+            for v in venues.values():
+                v["daily_transactions"] = count_daily_transactions(
+                    [], v["daily_transactions"]
+                )
+        return size_prices
+
+    def write_summary(self, style_id):
+        # nothing to maintain
+        return 0
+
+    def get_all_historical_price(self, style_id, size, venue):
+        return self.get(style_id, size)[size][venue]["prices"]
+
+    def get_all_transactions(self, style_id, size, venue):
+        return self.get(style_id, size)[size][venue]["transactions"]
+
+    def update(self, venue, update_time, style_id, size_prices, size_transactions):
+        # one database transaction per product
+        with self.conn:
+            for size in size_prices:
+                if size in size_transactions:
+                    self._insert_transactions(
+                        style_id, size, venue, size_transactions[size]
+                    )
+                self._insert_prices(
+                    style_id,
+                    size,
+                    venue,
+                    [self._make_price_record(update_time, size_prices[size])],
+                )
+        return
+
+    def import_size_prices(self, style_id, size_prices):
+        """
+        Merge a {size: {venue: {"prices": [...], "transactions": [...]}}} view
+        into the database. Already imported readings are skipped, so importing
+        the same files again is harmless.
+        """
+        with self.conn:
+            for size in size_prices:
+                for venue in size_prices[size]:
+                    data = size_prices[size][venue]
+                    self._insert_transactions(
+                        style_id, size, venue, data.get("transactions", [])
+                    )
+                    self._insert_prices(
+                        style_id, size, venue, data.get("prices", [])[::-1]
+                    )
+        return
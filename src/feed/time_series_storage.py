@@ -0,0 +1,25 @@
+from time_series_serializer import TimeSeriesSerializer
+from time_series_log_serializer import TimeSeriesLogSerializer
+from time_series_sqlite_serializer import TimeSeriesSqliteSerializer
+
+"""
+Picks the time series serializer for a --storage option.
+"""
+
+STORAGE_TYPES = {
+    "json": TimeSeriesSerializer,
+    "log": TimeSeriesLogSerializer,
+    "sqlite": TimeSeriesSqliteSerializer,
+}
+
+
+def get_time_series_serializer(storage=None, parent_folder=None):
+    """
+    @param storage        str one of STORAGE_TYPES, defaults to json
+    @param parent_folder  str (optional) the data folder
+    """
+    if not storage:
+        storage = "json"
+    if storage not in STORAGE_TYPES:
+        raise RuntimeError("unsupported time series storage {}".format(storage))
+    return STORAGE_TYPES[storage](parent_folder)
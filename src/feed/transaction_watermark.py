@@ -0,0 +1,42 @@
+import json
+import os
+
+"""
+Encapsulates reading and writing of transaction watermarks.
+A watermark records, per du product_id, the newest transaction id already
+stored and the recentSoldList lastId cursor that came with it. Update mode
+stops paging through recent sales once it reaches the watermark.
+
+@note a watermark should only be advanced after the transactions it covers are
+stored. Losing watermarks (e.g. to a crash before save) is harmless: the next
+run pages further back and the time series serializer drops the duplicates.
+"""
+
+
+class TransactionWatermarkSerializer:
+    def __init__(self, watermark_file):
+        self.dst_file_path = watermark_file
+        self.watermarks = {}
+        if os.path.isfile(watermark_file):
+            self.load_watermarks()
+
+    def load_watermarks(self):
+        with open(self.dst_file_path, "r") as infile:
+            self.watermarks = json.loads(infile.read())
+
+    def get_newest_id(self, product_id):
+        product_id = str(product_id)
+        if product_id in self.watermarks:
+            return self.watermarks[product_id]["newest_id"]
+        return None
+
+    def update_watermark(self, product_id, newest_id, cursor):
+        if not newest_id:
+            return
+        self.watermarks[str(product_id)] = {"newest_id": newest_id, "cursor": cursor}
+
+    def save_watermarks(self):
+        tmp_file_path = self.dst_file_path + ".tmp"
+        with open(tmp_file_path, "w") as outfile:
+            outfile.write(json.dumps(self.watermarks))
+        os.replace(tmp_file_path, self.dst_file_path)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+import csv
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import du_feed
+from du_stub_server import DuStubServer, synthesize_fixtures
+from time_series_storage import get_time_series_serializer
+from transaction_watermark import TransactionWatermarkSerializer
+
+PRODUCTS = 3
+SALES = 50
+
+
+class TestTransactionWatermark(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+        return
+
+    def path(self, name):
+        return os.path.join(self.folder, name)
+
+    def test_save_and_load(self):
+        watermarks = TransactionWatermarkSerializer(self.path("watermarks.json"))
+        watermarks.update_watermark(1, "a", "20")
+        # nothing fetched, the watermark stays
+        watermarks.update_watermark(1, None, "40")
+        watermarks.update_watermark("2", "b", "0")
+        watermarks.save_watermarks()
+
+        loaded = TransactionWatermarkSerializer(self.path("watermarks.json"))
+        self.assertEqual(loaded.get_newest_id("1"), "a")
+        self.assertEqual(loaded.get_newest_id(2), "b")
+        self.assertIsNone(loaded.get_newest_id(3))
+        self.assertEqual(loaded.watermarks["1"]["cursor"], "20")
+        self.assertEqual(os.listdir(self.folder), ["watermarks.json"])
+
+    def test_update_stops_at_watermark(self):
+        fixtures = self.path("fixtures")
+        synthesize_fixtures(fixtures, products=PRODUCTS, sales=SALES)
+        server = DuStubServer(fixtures).start()
+        self.addCleanup(server.stop)
+        with open(self.path("mapping.csv"), "w") as outfile:
+            wr = csv.writer(outfile)
+            wr.writerow(
+                ["style_id", "du_product_id", "du_title", "release_date", "gender"]
+            )
+            for product_id in range(1, PRODUCTS + 1):
+                style_id = "SYN{:06d}-{:03d}".format(product_id, product_id)
+                wr.writerow([style_id, product_id, "t", "2019.01.01", "eu-nike-men"])
+        argv = ["--mode", "update", "--start_from", self.path("mapping.csv")]
+        argv += ["--base_url", server.base_url, "--min_interval_seconds", "0"]
+        argv += ["--last_updated", self.path("last_updated.log")]
+        argv += ["--watermarks", self.path("watermarks.json")]
+        argv += ["--data_folder", self.path("data")]
+        argv += ["--transaction_history_maxpage", "10"]
+
+        fetched = {}
+        fetch_product_update = du_feed.fetch_product_update
+
+        def record_fetch(feed, product_id, *fetch_args):
+            result = fetch_product_update(feed, product_id, *fetch_args)
+            fetched[product_id] = result[2]
+            return result
+
+        with mock.patch("du_feed.fetch_product_update", record_fetch):
+            du_feed.update_mode(du_feed.parse_args(argv))
+            # 20 + 20 + 10, then the empty page
+            self.assertEqual({info["pages"] for info in fetched.values()}, {4})
+
+            # a new sale of product 1
+            sales_file = os.path.join(fixtures, "recent_sold", "1.json")
+            with open(sales_file, "r") as infile:
+                sales = json.loads(infile.read())
+            sales.insert(0, dict(sales[0], userName="new", formatTime="1小时前"))
+            with open(sales_file, "w") as outfile:
+                outfile.write(json.dumps(sales))
+
+            fetched.clear()
+            du_feed.update_mode(du_feed.parse_args(argv))
+        for info in fetched.values():
+            self.assertEqual(info["pages"], 1)
+            self.assertTrue(info["reached_up_to_id"])
+
+        serializer = get_time_series_serializer("json", self.path("data"))
+        for product_id in range(1, PRODUCTS + 1):
+            style_id = "SYN{:06d}-{:03d}".format(product_id, product_id)
+            transactions = [
+                t
+                for data in serializer.get(style_id).values()
+                for t in data["du"]["transactions"]
+            ]
+            self.assertEqual(len(transactions), SALES + 1 if product_id == 1 else SALES)
+        watermarks = TransactionWatermarkSerializer(self.path("watermarks.json"))
+        self.assertEqual(watermarks.get_newest_id(1), fetched["1"]["newest_id"])
+
+
+if __name__ == "__main__":
+    unittest.main()
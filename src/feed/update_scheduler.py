@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+
+import argparse
+import csv
+import datetime
+import heapq
+import json
+import os
+
+from last_updated import LastUpdatedSerializer
+from static_info_serializer import StaticInfoSerializer
+from time_series_serializer import SUMMARY_DAYS
+from time_series_storage import get_time_series_serializer
+from work_queue import WorkQueue
+
+"""
+Value-aware ordering of feed updates.
+
+Instead of walking the merged csv top to bottom, every eligible (style_id,
+venue) is scored and the highest scores are updated first:
+
+  score = staleness_hours * expected_value
+
+staleness_hours is the time since the pair was last updated (capped at
+max_staleness_hours, which is also used for pairs never updated).
+expected_value estimates how much a fresh reading is worth from what is
+already stored for the style, as kept in its summary manifest (see
+TimeSeriesSerializer.get_summary) so no full history is parsed:
+  - du sales per day over the last sales_window_days (whole days, up to
+    SUMMARY_DAYS),
+  - stockx sales per day (sale_72_hours / 3 of each size's latest reading),
+  - stockx volatility of the latest readings, times volatility_weight,
+  - the best profit ratio strategy last found for the style (see strategy.py
+    --profit_out), times profit_weight.
+
+The same budget then buys the updates most likely to move strategy results.
+"""
+
+VENUES = ["du", "stockx"]
+
+
+def load_profit_ratios(profit_file):
+    if not profit_file or not os.path.isfile(profit_file):
+        return {}
+    with open(profit_file, "r") as infile:
+        return json.loads(infile.read())
+
+
+class UpdateScheduler:
+    def __init__(
+        self,
+        time_series_serializer,
+        profit_ratios=None,
+        sales_window_days=14,
+        max_staleness_hours=168,
+        volatility_weight=10,
+        profit_weight=10,
+        now=None,
+    ):
+        self.time_series_serializer = time_series_serializer
+        self.profit_ratios = profit_ratios if profit_ratios else {}
+        if sales_window_days > SUMMARY_DAYS:
+            raise RuntimeError(
+                "sales_window_days {} is longer than the {} days summaries keep".format(
+                    sales_window_days, SUMMARY_DAYS
+                )
+            )
+        self.sales_window_days = sales_window_days
+        self.max_staleness_hours = max_staleness_hours
+        self.volatility_weight = volatility_weight
+        self.profit_weight = profit_weight
+        self.now = now if now else datetime.datetime.utcnow()
+        self.eligible_count = 0
+        self.eligible_score = 0.0
+        return
+
+    def get_signals(self, style_id):
+        """
+        @return {"du_sales_per_day", "stockx_sales_per_day", "volatility",
+            "profit_ratio"} of a style, 0 where nothing is stored
+        """
+        signals = {
+            "du_sales_per_day": 0.0,
+            "stockx_sales_per_day": 0.0,
+            "volatility": 0.0,
+            "profit_ratio": max(float(self.profit_ratios.get(style_id, 0)), 0.0),
+        }
+        # summaries only, the full histories of the catalog are never parsed
+        size_prices = self.time_series_serializer.get_summary(style_id)
+
+        window_start = (
+            self.now - datetime.timedelta(days=self.sales_window_days)
+        ).strftime("%Y-%m-%d")
+        du_sales = 0
+        for size in size_prices:
+            if "du" in size_prices[size]:
+                daily = size_prices[size]["du"].get("daily_transactions", {})
+                du_sales += sum(
+                    count for day, count in daily.items() if day > window_start
+                )
+            if "stockx" in size_prices[size]:
+                prices = size_prices[size]["stockx"].get("prices", [])
+                if prices:
+                    latest = prices[0]
+                    if latest.get("sale_72_hours"):
+                        signals["stockx_sales_per_day"] += (
+                            float(latest["sale_72_hours"]) / 3
+                        )
+                    if latest.get("volatility"):
+                        signals["volatility"] = max(
+                            signals["volatility"], float(latest["volatility"])
+                        )
+        signals["du_sales_per_day"] = float(du_sales) / self.sales_window_days
+        return signals
+
+    def get_expected_value(self, signals):
+        return (
+            1.0
+            + signals["du_sales_per_day"]
+            + signals["stockx_sales_per_day"]
+            + self.volatility_weight * signals["volatility"]
+            + self.profit_weight * signals["profit_ratio"]
+        )
+
+    def get_staleness_hours(self, last_update):
+        if last_update is None:
+            return float(self.max_staleness_hours)
+        hours = (self.now - last_update).total_seconds() / 3600
+        return min(max(hours, 0.0), float(self.max_staleness_hours))
+
+    def plan(
+        self, style_ids, venues, last_updated, min_interval_seconds=0, budget=None
+    ):
+        """
+        @param style_ids  styles to consider
+        @param venues  venues to consider for each style
+        @param last_updated  {style_id: {venue: datetime}} as in LastUpdatedSerializer
+        @param min_interval_seconds  pairs updated more recently are not eligible
+        @param budget  int (optional) the most number of pairs to return
+        @return list of (score, style_id, venue), highest score first
+        """
+        queue = []
+        self.eligible_count = 0
+        self.eligible_score = 0.0
+        for style_id in style_ids:
+            expected_value = None
+            for venue in venues:
+                last_update = last_updated.get(style_id, {}).get(venue)
+                if (
+                    last_update is not None
+                    and min_interval_seconds
+                    and (self.now - last_update).total_seconds() <= min_interval_seconds
+                ):
+                    continue
+                if expected_value is None:
+                    expected_value = self.get_expected_value(self.get_signals(style_id))
+                score = self.get_staleness_hours(last_update) * expected_value
+                self.eligible_count += 1
+                self.eligible_score += score
+                heapq.heappush(queue, (-score, style_id, venue))
+
+        planned = []
+        while queue and (budget is None or len(planned) < budget):
+            score, style_id, venue = heapq.heappop(queue)
+            planned.append((-score, style_id, venue))
+        return planned
+
+    def print_coverage(self, planned, updated=None):
+        """
+        @param planned  list returned by plan
+        @param updated  set of (style_id, venue) (optional) pairs actually updated,
+            all of planned if not given
+        """
+        if updated is None:
+            covered = planned
+        else:
+            covered = [p for p in planned if (p[1], p[2]) in updated]
+        covered_score = sum(p[0] for p in covered)
+        print(
+            "{} {} of {} eligible pairs, covering {:.1f}% of eligible value".format(
+                "scheduled" if updated is None else "updated",
+                len(covered),
+                self.eligible_count,
+                100.0 * covered_score / self.eligible_score
+                if self.eligible_score
+                else 100.0,
+            )
+        )
+        return
+
+
+def enqueue_plan(static_info, planned, queue_file, min_interval_seconds=0):
+    """
+    Enqueue the planned pairs to a work queue with their scores as priorities,
+    for du_feed.py --queue consumers.
+
+    @param static_info  {style_id: static item}
+    """
+    queue = WorkQueue(queue_file)
+    queue.enqueue(
+        [
+            (
+                style_id,
+                venue,
+                static_info[style_id].product_id if venue == "du" else None,
+                score,
+            )
+            for score, style_id, venue in planned
+            if style_id in static_info
+        ],
+        min_interval_seconds,
+    )
+    print(
+        "enqueued {} planned pairs to {}, {}".format(
+            len(planned), queue_file, queue.get_stats()
+        )
+    )
+    queue.close()
+    return
+
+
+def write_plan(static_info_file, planned, out_file):
+    """
+    Write the rows of static_info_file for the planned styles in plan order, so
+    the plan can be fed to stockx_feed.js / stockx_update.sh as --start_from.
+    """
+    rows = {}
+    with open(static_info_file, "r") as infile:
+        reader = csv.DictReader(infile)
+        fieldnames = reader.fieldnames
+        for row in reader:
+            rows[row["style_id"]] = row
+
+    written = set()
+    with open(out_file, "w") as outfile:
+        writer = csv.DictWriter(outfile, fieldnames=fieldnames)
+        writer.writeheader()
+        for _, style_id, _ in planned:
+            if style_id in rows and style_id not in written:
+                writer.writerow(rows[style_id])
+                written.add(style_id)
+    print("wrote {} planned styles to {}".format(len(written), out_file))
+    return
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        """
+        order the items of a merged static info by how valuable updating them is.
+
+        example usage:
+          ./update_scheduler.py --start_from merged.20191225.csv --venue stockx --last_updated last_updated_stockx.log --budget 500 --out plan.stockx.csv
+          ./stockx_update.sh plan.stockx.csv
+          ./update_scheduler.py --start_from merged.20191225.csv --venue du --last_updated last_updated.log --queue queue.db
+    """
+    )
+    parser.add_argument(
+        "--start_from", help="the merged static info containing the items to plan"
+    )
+    parser.add_argument("--venue", default="stockx", help="[du|stockx] venue to plan")
+    parser.add_argument(
+        "--last_updated", help="the last updated file of the venue's feed"
+    )
+    parser.add_argument(
+        "--journal_last_updated",
+        action="store_true",
+        help="the last updated file is the journaled one shared by the feeds",
+    )
+    parser.add_argument(
+        "--min_interval_seconds",
+        help="items updated more recently than this are left out of the plan",
+    )
+    parser.add_argument("--budget", type=int, help="the most number of items to plan")
+    parser.add_argument(
+        "--profit_file",
+        default="../strategy/profit_ratios.json",
+        help="the profit ratios written by strategy.py --profit_out",
+    )
+    parser.add_argument(
+        "--data_folder",
+        help="the data folder from where to look for price and transaction readings",
+    )
+    parser.add_argument(
+        "--storage",
+        default="json",
+        help="[json|log|sqlite] how time series readings are stored",
+    )
+    parser.add_argument("--out", help="the file to write the planned csv to")
+    parser.add_argument(
+        "--queue",
+        help="the work queue file (see work_queue.py) to enqueue the plan to, scores are the priorities",
+    )
+    args = parser.parse_args()
+    if not args.start_from or not args.last_updated or not (args.out or args.queue):
+        raise RuntimeError(
+            "args.start_from, args.last_updated and one of args.out and args.queue are required in scheduler"
+        )
+    if args.venue not in VENUES:
+        raise RuntimeError("unrecognized venue {}".format(args.venue))
+
+    # reads either venue's format, journaled or not
+    last_updated = LastUpdatedSerializer(
+        args.last_updated, journaled=args.journal_last_updated
+    ).last_updated
+
+    static_info, _ = StaticInfoSerializer().load_static_info_from_csv(
+        args.start_from, return_key="style_id"
+    )
+    scheduler = UpdateScheduler(
+        get_time_series_serializer(args.storage, args.data_folder),
+        load_profit_ratios(args.profit_file),
+    )
+    planned = scheduler.plan(
+        static_info.keys(),
+        [args.venue],
+        last_updated,
+        float(args.min_interval_seconds) if args.min_interval_seconds else 0,
+        args.budget,
+    )
+    scheduler.print_coverage(planned)
+    if args.out:
+        write_plan(args.start_from, planned, args.out)
+    if args.queue:
+        enqueue_plan(
+            static_info,
+            planned,
+            args.queue,
+            float(args.min_interval_seconds) if args.min_interval_seconds else 0,
+        )
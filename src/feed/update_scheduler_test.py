@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+import datetime
+import shutil
+import tempfile
+import unittest
+
+from time_series_storage import get_time_series_serializer
+from update_scheduler import UpdateScheduler
+
+
+class TestUpdateScheduler(unittest.TestCase):
+    def setUp(self):
+        self.data_folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_folder)
+        self.now = datetime.datetime(2026, 10, 1, 12)
+        self.serializer = get_time_series_serializer("json", self.data_folder)
+        return
+
+    def write_du_sales(self, style_id, days_ago):
+        transactions = [
+            {
+                "id": "{}-{}".format(style_id, i),
+                "price": 50000,
+                "time": (self.now - datetime.timedelta(days=d)).isoformat() + "Z",
+            }
+            for i, d in enumerate(days_ago)
+        ]
+        self.serializer.update(
+            "du",
+            self.now,
+            style_id,
+            {"9": {"list_price": 60000}},
+            {"9": transactions},
+        )
+        return
+
+    def test_plan_order(self):
+        # 3 sales in the window, 2 of S2's are older than it
+        self.write_du_sales("S1", [0, 1, 2])
+        self.write_du_sales("S2", [0, 20, 25])
+        self.write_du_sales("S3", [0, 1, 2])
+        last_updated = {
+            "S1": {"du": self.now - datetime.timedelta(hours=10)},
+            "S2": {"du": self.now - datetime.timedelta(hours=10)},
+            "S3": {"du": self.now - datetime.timedelta(hours=10)},
+            "S4": {"du": self.now - datetime.timedelta(minutes=10)},
+        }
+        # no full history is read
+        self.serializer.get = None
+        scheduler = UpdateScheduler(
+            self.serializer,
+            profit_ratios={"S3": 0.2},
+            sales_window_days=14,
+            now=self.now,
+        )
+        self.assertEqual(scheduler.get_signals("S2")["du_sales_per_day"], 1.0 / 14)
+
+        planned = scheduler.plan(
+            ["S1", "S2", "S3", "S4", "S5"],
+            ["du"],
+            last_updated,
+            min_interval_seconds=3600,
+        )
+        # S5 was never updated, S4 too recently
+        self.assertEqual([p[1] for p in planned], ["S5", "S3", "S1", "S2"])
+        self.assertEqual(planned[0][0], 168.0)
+        self.assertAlmostEqual(planned[1][0], 10 * (1 + 3.0 / 14 + 10 * 0.2))
+        self.assertEqual(
+            [
+                p[1]
+                for p in scheduler.plan(
+                    ["S1", "S2", "S3"], ["du"], last_updated, budget=2
+                )
+            ],
+            ["S3", "S1"],
+        )
+
+    def test_window_longer_than_summaries(self):
+        with self.assertRaises(RuntimeError):
+            UpdateScheduler(self.serializer, sales_window_days=60)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+import csv
+import glob
+import hashlib
+import os
+
+from last_updated import LastUpdatedSerializer
+from transaction_watermark import TransactionWatermarkSerializer
+
+"""
+Partitioning of an update run into shards, one per worker process.
+
+A style belongs to shard get_shard(style_id, shards), a stable hash, so the same
+styles land on the same worker from run to run. Each worker keeps its own
+last_updated journal and watermarks in {file}.shard{i}of{n}, seeded from the
+shared files with its styles only, and merged back by the launcher when the
+worker is done, whether it finished or crashed. A shard whose merge didn't
+happen (e.g. the launcher itself was killed) is merged at the start of the next
+sharded run.
+"""
+
+
+def get_shard(style_id, shards):
+    """
+    @return int in [0, shards), the same for a style_id across runs and hosts
+    """
+    digest = hashlib.sha1(style_id.encode("utf-8")).hexdigest()
+    return int(digest[:8], 16) % shards
+
+
+def get_shard_path(path, shard, shards):
+    return "{}.shard{}of{}".format(path, shard, shards)
+
+
+def _remove(path):
+    if os.path.isfile(path):
+        os.remove(path)
+    return
+
+
+def split_last_updated(last_updated_serializer, shards):
+    """
+    Seed each shard's journaled last_updated with the entries of its styles.
+
+    @return [shard last_updated file]
+    """
+    paths = [
+        get_shard_path(last_updated_serializer.dst_file_path, i, shards)
+        for i in range(shards)
+    ]
+    outfiles = [open(path, "w", newline="") for path in paths]
+    try:
+        writers = [csv.writer(f, lineterminator="\n") for f in outfiles]
+        for style_id, venues in last_updated_serializer.last_updated.items():
+            wr = writers[get_shard(style_id, shards)]
+            for venue, update_time in venues.items():
+                wr.writerow([style_id, venue, update_time.isoformat() + "Z"])
+    finally:
+        for f in outfiles:
+            f.close()
+    for path in paths:
+        _remove(path + ".journal")
+    return paths
+
+
+def merge_last_updated(last_updated_serializer, shard_path):
+    """
+    Fold a shard's snapshot and journal into the shared last_updated (journaled
+    or not) and remove the shard files. The caller saves last_updated.
+
+    @return number of (style_id, venue) entries that moved forward
+    """
+    shard = LastUpdatedSerializer(shard_path, journaled=True)
+    merged = 0
+    last_updated = last_updated_serializer.last_updated
+    for style_id, venues in shard.last_updated.items():
+        for venue, update_time in venues.items():
+            current = last_updated.get(style_id, {}).get(venue)
+            if current is not None and current >= update_time:
+                continue
+            last_updated.setdefault(style_id, {})[venue] = update_time
+            if last_updated_serializer.journaled:
+                last_updated_serializer.append_journal(style_id, venue, update_time)
+            merged += 1
+    _remove(shard_path)
+    _remove(shard_path + ".journal")
+    return merged
+
+
+def split_watermarks(watermark_serializer, product_style_ids, shards):
+    """
+    Seed each shard's watermarks with those of its products.
+
+    @param product_style_ids  {product_id: style_id} of the run
+    @return [shard watermark file]
+    """
+    shard_watermarks = [{} for _ in range(shards)]
+    for product_id, style_id in product_style_ids.items():
+        watermark = watermark_serializer.watermarks.get(str(product_id))
+        if watermark:
+            shard_watermarks[get_shard(style_id, shards)][str(product_id)] = watermark
+    paths = []
+    for i in range(shards):
+        shard = TransactionWatermarkSerializer(
+            get_shard_path(watermark_serializer.dst_file_path, i, shards)
+        )
+        shard.watermarks = shard_watermarks[i]
+        shard.save_watermarks()
+        paths.append(shard.dst_file_path)
+    return paths
+
+
+def merge_watermarks(watermark_serializer, shard_path):
+    """
+    Fold a shard's watermarks into the shared ones and remove the shard file.
+    The caller saves the watermarks.
+    """
+    shard = TransactionWatermarkSerializer(shard_path)
+    watermark_serializer.watermarks.update(shard.watermarks)
+    _remove(shard_path)
+    return len(shard.watermarks)
+
+
+def get_leftover_shards(path):
+    """
+    @return shard files of path a previous sharded run didn't merge
+    """
+    return [
+        f
+        for f in glob.glob(glob.escape(path) + ".shard*of*")
+        if not f.endswith(".journal") and not f.endswith(".tmp")
+    ]
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+
+import csv
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import du_feed
+from du_stub_server import DuStubServer, synthesize_fixtures
+from last_updated import LastUpdatedSerializer
+from transaction_watermark import TransactionWatermarkSerializer
+from update_shards import (
+    get_shard,
+    merge_last_updated,
+    merge_watermarks,
+    split_last_updated,
+    split_watermarks,
+)
+
+PRODUCTS = 12
+
+
+class TestUpdateShards(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+        return
+
+    def path(self, name):
+        return os.path.join(self.folder, name)
+
+    def test_split_and_merge(self):
+        style_ids = ["S{}".format(i) for i in range(20)]
+        self.assertEqual(
+            [get_shard(s, 3) for s in style_ids], [get_shard(s, 3) for s in style_ids]
+        )
+        self.assertEqual(len({get_shard(s, 3) for s in style_ids}), 3)
+
+        then = datetime.datetime(2026, 10, 1)
+        last_updated = LastUpdatedSerializer(self.path("last_updated.log"))
+        watermarks = TransactionWatermarkSerializer(self.path("watermarks.json"))
+        for i, style_id in enumerate(style_ids):
+            last_updated.last_updated[style_id] = {"du": then, "stockx": then}
+            watermarks.update_watermark(i, "id{}".format(i), "cursor")
+        last_updated_paths = split_last_updated(last_updated, 3)
+        watermark_paths = split_watermarks(
+            watermarks, {i: s for i, s in enumerate(style_ids)}, 3
+        )
+
+        # shard 1 updates its styles, shard 2 crashed before doing anything
+        shard = LastUpdatedSerializer(last_updated_paths[1], journaled=True)
+        shard_watermarks = TransactionWatermarkSerializer(watermark_paths[1])
+        updated = [s for s in style_ids if get_shard(s, 3) == 1]
+        self.assertEqual(sorted(shard.last_updated), sorted(updated))
+        for style_id in updated:
+            shard.update_last_updated(style_id, "du")
+            shard_watermarks.update_watermark(style_ids.index(style_id), "new", "c")
+        shard_watermarks.save_watermarks()
+
+        merged = LastUpdatedSerializer(self.path("last_updated.log"), journaled=True)
+        merged.last_updated = last_updated.last_updated
+        self.assertEqual(
+            [merge_last_updated(merged, path) for path in last_updated_paths],
+            [0, len(updated), 0],
+        )
+        for path in watermark_paths:
+            merge_watermarks(watermarks, path)
+        for i, style_id in enumerate(style_ids):
+            self.assertEqual(
+                merged.last_updated[style_id]["du"] > then, style_id in updated
+            )
+            self.assertEqual(merged.last_updated[style_id]["stockx"], then)
+            self.assertEqual(
+                watermarks.get_newest_id(i),
+                "new" if style_id in updated else "id{}".format(i),
+            )
+        self.assertEqual(sorted(os.listdir(self.folder)), ["last_updated.log.journal"])
+
+    def test_crashed_worker_only_loses_its_shard(self):
+        fixtures = self.path("fixtures")
+        synthesize_fixtures(fixtures, products=PRODUCTS, sales=5)
+        server = DuStubServer(fixtures).start()
+        self.addCleanup(server.stop)
+        style_ids = {}
+        with open(self.path("mapping.csv"), "w") as outfile:
+            wr = csv.writer(outfile)
+            wr.writerow(
+                ["style_id", "du_product_id", "du_title", "release_date", "gender"]
+            )
+            for product_id in range(1, PRODUCTS + 1):
+                style_id = "SYN{:06d}-{:03d}".format(product_id, product_id)
+                style_ids[str(product_id)] = style_id
+                wr.writerow([style_id, product_id, "t", "2019.01.01", "eu-nike-men"])
+
+        args = du_feed.parse_args(
+            [
+                "--mode",
+                "update",
+                "--start_from",
+                self.path("mapping.csv"),
+                "--workers",
+                "2",
+                "--base_url",
+                server.base_url,
+                "--last_updated",
+                self.path("last_updated.log"),
+                "--watermarks",
+                self.path("watermarks.json"),
+                "--data_folder",
+                self.path("data"),
+                "--metrics_out",
+                self.path("metrics.json"),
+            ]
+        )
+        # the last product of shard 1 takes its worker down
+        crashing = [p for p in style_ids if get_shard(style_ids[p], 2) == 1][-1]
+        fetch_product_update = du_feed.fetch_product_update
+
+        def fetch_or_crash(feed, product_id, *fetch_args):
+            if product_id == crashing:
+                os._exit(3)
+            return fetch_product_update(feed, product_id, *fetch_args)
+
+        with mock.patch("du_feed.fetch_product_update", fetch_or_crash):
+            du_feed.sharded_update_mode(args)
+
+        last_updated = LastUpdatedSerializer(self.path("last_updated.log"))
+        expected = sorted(s for p, s in style_ids.items() if p != crashing)
+        self.assertEqual(sorted(last_updated.last_updated), expected)
+        self.assertEqual(sorted(os.listdir(self.path("data"))), expected)
+        self.assertEqual(
+            sorted(os.listdir(self.folder)),
+            [
+                "data",
+                "fixtures",
+                "last_updated.log",
+                "mapping.csv",
+                "metrics.json",
+                "watermarks.json",
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import socket
+import sqlite3
+import time
+
+"""
+Lease-based work queue of feed updates, in one SQLite file shared by every host
+consuming from it (or a local file standing in for it).
+
+There is one job per (style_id, venue), carrying the du product_id and a
+priority (UpdateScheduler score). A job is in one of the states
+  - ready: can be leased once available_at has passed
+  - leased: a consumer works on it until lease_expires, after which it is
+    visible to other consumers again (the consumer crashed or stalled)
+  - done: updated at completed_at, enqueuing it again makes it ready once it is
+    older than the producer's min interval
+  - dead: the dead-letter set, jobs that failed with errors retrying won't fix
+    (SizerError, KeyError) max_failures times, or were leased max_attempts
+    times without completing. requeue_dead puts them back
+A failed job is ready again after an exponential backoff on its attempts.
+
+Leases are taken in BEGIN IMMEDIATE transactions, so two consumers never lease
+the same job. Completing or failing a job only takes effect for the consumer
+still holding its lease. Times are epoch seconds from each host's clock, which
+should be kept in sync. The file uses the rollback journal rather than WAL, WAL
+doesn't work across hosts sharing a network file system.
+"""
+
+STATES = ["ready", "leased", "done", "dead"]
+
+
+def get_owner():
+    """
+    @return this consumer's name in leases
+    """
+    return "{}:{}".format(socket.gethostname(), os.getpid())
+
+
+class Job:
+    def __init__(self, style_id, venue, product_id, priority, attempts):
+        self.style_id = style_id
+        self.venue = venue
+        self.product_id = product_id
+        self.priority = priority
+        # leases of the job since it was last done, this one included
+        self.attempts = attempts
+
+    def __str__(self):
+        return "{} {} {} attempt {}".format(
+            self.style_id, self.venue, self.product_id, self.attempts
+        )
+
+
+class WorkQueue:
+    def __init__(
+        self,
+        queue_file,
+        max_failures=3,
+        max_attempts=10,
+        backoff_base_seconds=60,
+        max_backoff_seconds=3600,
+        clock=time.time,
+    ):
+        self.queue_file = queue_file
+        self.max_failures = max_failures
+        self.max_attempts = max_attempts
+        self.backoff_base_seconds = backoff_base_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.clock = clock
+        # transactions are explicit
+        self.conn = sqlite3.connect(queue_file, timeout=60, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=DELETE")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                style_id TEXT NOT NULL,
+                venue TEXT NOT NULL,
+                product_id TEXT,
+                priority REAL NOT NULL DEFAULT 0,
+                state TEXT NOT NULL DEFAULT 'ready',
+                available_at REAL NOT NULL DEFAULT 0,
+                lease_owner TEXT,
+                lease_expires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                failures INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                completed_at REAL,
+                PRIMARY KEY (style_id, venue)
+            );
+            CREATE INDEX IF NOT EXISTS jobs_venue_state_priority
+                ON jobs (venue, state, priority);
+            """
+        )
+        return
+
+    def close(self):
+        self.conn.close()
+        return
+
+    def _transaction(self, statements):
+        """
+        Run [(sql, params)] in one write transaction
+        """
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            for sql, params in statements:
+                self.conn.execute(sql, params)
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+        return
+
+    def enqueue(self, jobs, min_interval_seconds=0):
+        """
+        Add jobs, or update the priority of existing ones. Done jobs completed
+        more than min_interval_seconds ago are made ready again, leased and
+        dead ones keep their state.
+
+        @param jobs  iterable of (style_id, venue, product_id, priority)
+        """
+        cutoff = self.clock() - min_interval_seconds
+        self._transaction(
+            [
+                (
+                    """
+                    INSERT INTO jobs (style_id, venue, product_id, priority)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (style_id, venue) DO UPDATE SET
+                        product_id = excluded.product_id,
+                        priority = excluded.priority,
+                        state = CASE
+                            WHEN state = 'done' AND completed_at <= ? THEN 'ready'
+                            ELSE state END
+                    """,
+                    (
+                        style_id,
+                        venue,
+                        str(product_id) if product_id else None,
+                        priority,
+                        cutoff,
+                    ),
+                )
+                for style_id, venue, product_id, priority in jobs
+            ]
+        )
+        return
+
+    def lease(self, owner, venue, n=1, visibility_timeout=600):
+        """
+        Lease the n highest priority jobs of a venue that are ready, or whose
+        lease expired. Expired jobs already leased max_attempts times go to the
+        dead-letter set instead.
+
+        @return list of Job, empty if there is nothing to work on right now
+        """
+        now = self.clock()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            # leased max_attempts times without completing or failing, its
+            # consumers crashed or stalled on it
+            self.conn.execute(
+                """
+                UPDATE jobs SET state = 'dead', lease_owner = NULL,
+                    lease_expires = NULL, last_error = 'lease expired'
+                WHERE venue = ? AND state = 'leased' AND lease_expires <= ?
+                    AND attempts >= ?
+                """,
+                (venue, now, self.max_attempts),
+            )
+            rows = self.conn.execute(
+                """
+                SELECT style_id, venue, product_id, priority, attempts FROM jobs
+                WHERE venue = ? AND (
+                    (state = 'ready' AND available_at <= ?)
+                    OR (state = 'leased' AND lease_expires <= ?))
+                ORDER BY priority DESC LIMIT ?
+                """,
+                (venue, now, now, n),
+            ).fetchall()
+            for style_id, venue, _, _, _ in rows:
+                self.conn.execute(
+                    """
+                    UPDATE jobs SET state = 'leased', lease_owner = ?,
+                        lease_expires = ?, attempts = attempts + 1
+                    WHERE style_id = ? AND venue = ?
+                    """,
+                    (owner, now + visibility_timeout, style_id, venue),
+                )
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+        return [
+            Job(style_id, venue, product_id, priority, attempts + 1)
+            for style_id, venue, product_id, priority, attempts in rows
+        ]
+
+    def _update_leased(self, job, owner, assignments, params):
+        cursor = self.conn.execute(
+            "UPDATE jobs SET "
+            + assignments
+            + " WHERE style_id = ? AND venue = ? AND state = 'leased' AND lease_owner = ?",
+            tuple(params) + (job.style_id, job.venue, owner),
+        )
+        if cursor.rowcount == 0:
+            print("lost the lease of {}".format(job))
+            return False
+        return True
+
+    def renew(self, job, owner, visibility_timeout=600):
+        """
+        Extend a lease still held, e.g. while paging through long transaction
+        histories
+        """
+        return self._update_leased(
+            job, owner, "lease_expires = ?", [self.clock() + visibility_timeout]
+        )
+
+    def complete(self, job, owner):
+        return self._update_leased(
+            job,
+            owner,
+            """state = 'done', completed_at = ?, attempts = 0, failures = 0,
+            last_error = NULL, lease_owner = NULL, lease_expires = NULL""",
+            [self.clock()],
+        )
+
+    def release(self, job, owner):
+        """
+        Give a job back without counting the attempt, e.g. on shutdown
+        """
+        return self._update_leased(
+            job,
+            owner,
+            """state = 'ready', attempts = MAX(attempts - 1, 0),
+            lease_owner = NULL, lease_expires = NULL""",
+            [],
+        )
+
+    def get_backoff_seconds(self, attempts):
+        return min(
+            self.backoff_base_seconds * 2 ** max(attempts - 1, 0),
+            self.max_backoff_seconds,
+        )
+
+    def fail(self, job, owner, error, dead_letter=False):
+        """
+        @param error  str what went wrong, kept in last_error
+        @param dead_letter  the error won't go away by retrying, the job goes
+            to the dead-letter set once it happened max_failures times
+        """
+        failures = 1 if dead_letter else 0
+        return self._update_leased(
+            job,
+            owner,
+            """state = CASE WHEN failures + ? >= ? OR attempts >= ?
+                THEN 'dead' ELSE 'ready' END,
+            failures = failures + ?, available_at = ?, last_error = ?,
+            lease_owner = NULL, lease_expires = NULL""",
+            [
+                failures,
+                self.max_failures,
+                self.max_attempts,
+                failures,
+                self.clock() + self.get_backoff_seconds(job.attempts),
+                error,
+            ],
+        )
+
+    def requeue_dead(self):
+        """
+        @return number of jobs moved from the dead-letter set back to ready
+        """
+        cursor = self.conn.execute(
+            """
+            UPDATE jobs SET state = 'ready', attempts = 0, failures = 0,
+                available_at = 0
+            WHERE state = 'dead'
+            """
+        )
+        return cursor.rowcount
+
+    def get_dead_letters(self):
+        """
+        @return list of (style_id, venue, product_id, failures, attempts, last_error)
+        """
+        return self.conn.execute(
+            """
+            SELECT style_id, venue, product_id, failures, attempts, last_error
+            FROM jobs WHERE state = 'dead' ORDER BY style_id, venue
+            """
+        ).fetchall()
+
+    def get_stats(self):
+        """
+        @return {state: number of jobs}, plus "available": ready jobs that can
+            be leased now
+        """
+        stats = {state: 0 for state in STATES}
+        for state, count in self.conn.execute(
+            "SELECT state, COUNT(*) FROM jobs GROUP BY state"
+        ):
+            stats[state] = count
+        stats["available"] = self.conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE state = 'ready' AND available_at <= ?",
+            (self.clock(),),
+        ).fetchone()[0]
+        return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        """
+        inspect the work queue of feed updates. Jobs are enqueued by
+        update_scheduler.py --queue and consumed by du_feed.py --mode update --queue.
+
+        example usage:
+          ./update_scheduler.py --start_from merged.20191225.csv --venue du --last_updated last_updated.log --queue queue.db
+          ./du_feed.py --mode update --queue queue.db --engine async
+          ./work_queue.py --queue queue.db --mode stats
+          ./work_queue.py --queue queue.db --mode dead
+          ./work_queue.py --queue queue.db --mode requeue_dead
+    """
+    )
+    parser.add_argument("--queue", required=True, help="the work queue file")
+    parser.add_argument(
+        "--mode",
+        default="stats",
+        help="[stats|dead|requeue_dead] print job counts per state, "
+        "print the dead-letter set, or make dead-lettered jobs ready again",
+    )
+    args = parser.parse_args()
+
+    queue = WorkQueue(args.queue)
+    if args.mode == "stats":
+        print(queue.get_stats())
+    elif args.mode == "dead":
+        for row in queue.get_dead_letters():
+            print(",".join(str(x) for x in row))
+    elif args.mode == "requeue_dead":
+        print("requeued {} dead-lettered jobs".format(queue.requeue_dead()))
+    else:
+        raise RuntimeError("unsupported mode {}".format(args.mode))
+    queue.close()
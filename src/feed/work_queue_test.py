@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import du_feed
+from du_stub_server import DuStubServer, synthesize_fixtures
+from work_queue import WorkQueue
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestWorkQueue(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+        self.clock = Clock()
+        self.queue = WorkQueue(
+            os.path.join(self.folder, "queue.db"),
+            backoff_base_seconds=10,
+            clock=self.clock,
+        )
+        self.addCleanup(self.queue.close)
+        return
+
+    def test_leases(self):
+        self.queue.enqueue(
+            [("S1", "du", 1, 5.0), ("S2", "du", 2, 9.0), ("S3", "du", 3, 1.0)]
+        )
+        self.queue.enqueue([("S1", "stockx", None, 100.0)])
+        a = self.queue.lease("a", "du", 2, visibility_timeout=60)
+        self.assertEqual([job.style_id for job in a], ["S2", "S1"])
+        b = self.queue.lease("b", "du", 2, visibility_timeout=60)
+        self.assertEqual([job.style_id for job in b], ["S3"])
+        self.assertEqual(self.queue.lease("b", "du"), [])
+
+        # a stalls past its leases, b takes them over
+        self.clock.now += 61
+        b = self.queue.lease("b", "du", 2)
+        self.assertEqual(
+            [(job.style_id, job.attempts) for job in b], [("S2", 2), ("S1", 2)]
+        )
+        self.assertFalse(self.queue.complete(a[0], "a"))
+        self.assertTrue(self.queue.complete(b[0], "b"))
+        self.assertTrue(self.queue.release(b[1], "b"))
+        self.assertEqual(
+            self.queue.get_stats(),
+            {"ready": 2, "leased": 1, "done": 1, "dead": 0, "available": 2},
+        )
+
+        # done jobs come back once older than the producer's min interval
+        self.queue.enqueue([("S2", "du", 2, 9.0)], min_interval_seconds=3600)
+        self.assertEqual(self.queue.get_stats()["done"], 1)
+        self.clock.now += 3601
+        self.queue.enqueue([("S2", "du", 2, 9.0)], min_interval_seconds=3600)
+        self.assertEqual(self.queue.get_stats()["done"], 0)
+
+    def test_backoff_and_dead_letters(self):
+        self.queue.enqueue([("S1", "du", 1, 1.0)])
+        job = self.queue.lease("a", "du")[0]
+        self.queue.fail(job, "a", "RuntimeError: timeout")
+        self.assertEqual(self.queue.lease("a", "du"), [])
+        self.clock.now += 10
+        for backoff in [20, 40]:
+            job = self.queue.lease("a", "du")[0]
+            self.queue.fail(job, "a", "SizerError: no size", dead_letter=True)
+            self.clock.now += backoff
+        job = self.queue.lease("a", "du")[0]
+        self.queue.fail(job, "a", "SizerError: no size", dead_letter=True)
+        self.assertEqual(
+            self.queue.get_dead_letters(),
+            [("S1", "du", "1", 3, 4, "SizerError: no size")],
+        )
+        self.assertEqual(self.queue.requeue_dead(), 1)
+        self.assertEqual(self.queue.lease("a", "du")[0].attempts, 1)
+
+    def test_expired_leases_dead_letter(self):
+        queue = WorkQueue(
+            os.path.join(self.folder, "queue3.db"), max_attempts=3, clock=self.clock
+        )
+        self.addCleanup(queue.close)
+        queue.enqueue([("S1", "du", 1, 1.0), ("S2", "du", 2, 0.0)])
+        for attempt in range(1, 4):
+            job = queue.lease("a", "du", visibility_timeout=60)[0]
+            self.assertEqual((job.style_id, job.attempts), ("S1", attempt))
+            # a consumer crashes on it
+            self.clock.now += 61
+        self.assertEqual(queue.lease("a", "du")[0].style_id, "S2")
+        self.assertEqual(
+            queue.get_dead_letters(), [("S1", "du", "1", 0, 3, "lease expired")]
+        )
+
+    def test_du_feed_consumer(self):
+        fixtures = os.path.join(self.folder, "fixtures")
+        synthesize_fixtures(fixtures, products=6, sales=5)
+        server = DuStubServer(fixtures).start()
+        self.addCleanup(server.stop)
+        self.queue.enqueue(
+            [("SYN{:06d}-{:03d}".format(i, i), "du", i, float(i)) for i in range(1, 7)]
+            # no such product
+            + [("SYN001000-000", "du", 1000, 0.0)]
+        )
+        args = du_feed.parse_args(
+            [
+                "--mode",
+                "update",
+                "--queue",
+                self.queue.queue_file,
+                "--queue_batch",
+                "4",
+                "--base_url",
+                server.base_url,
+                "--last_updated",
+                os.path.join(self.folder, "last_updated.log"),
+                "--watermarks",
+                os.path.join(self.folder, "watermarks.json"),
+                "--data_folder",
+                os.path.join(self.folder, "data"),
+            ]
+        )
+        du_feed.update_mode(args)
+        stats = self.queue.get_stats()
+        self.assertEqual((stats["done"], stats["ready"], stats["leased"]), (6, 1, 0))
+        self.assertEqual(len(os.listdir(os.path.join(self.folder, "data"))), 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -10,8 +10,12 @@ import os
 import hashlib
 import pprint
 import urllib
-import execjs
 import re
+import sys
+
+# hack for import, scrapy runs from src/flightclub
+sys.path.append('../feed/')
+from du_sign import DuSigner
 
 pp = pprint.PrettyPrinter()
 
@@ -48,7 +52,7 @@ class DuSpider(scrapy.Spider):
 
         self.du_token = None
         self.cookie = None
-        self.js_ctx = None
+        self.signer = DuSigner()
         self.prices = {}
         self.max_pages = 400
 
@@ -158,11 +162,6 @@ class DuSpider(scrapy.Spider):
         @param  params dict get request url key values
         @return str the get request url with sign value
         """
-        if not self.js_ctx:
-            with open('sign.js', 'r', encoding='utf-8')as f:
-                all_ = f.read()
-                self.js_ctx = execjs.compile(all_)
-
         sign_query = ''
         url_get = ''
         for key in sorted(params.keys()):
@@ -170,7 +169,7 @@ class DuSpider(scrapy.Spider):
             url_get += key + '=' + params[key] + '&'
 
         sign_query += '048a9c4943398714b356a696503d2d36'
-        sign = self.js_ctx.call('getSign', sign_query)
+        sign = self.signer.sign(sign_query)
 
         url = 'https://m.poizon.com/mapi/' + target + '?{}sign={}'.format(url_get, sign)
         return url
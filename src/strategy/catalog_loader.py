@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+import sys
+
+# hack for import
+sys.path.append("../feed/")
+
+import concurrent.futures
+import resource
+import time
+
+from time_series_storage import get_time_series_serializer
+
+"""
+Loads the stored time series of a catalog for strategy, across a process pool.
+
+Each worker process opens its own serializer and parses whole styles, so JSON
+decoding runs on every core instead of one. In lazy mode a worker only reads
+what Strategy.run filters look at, the latest price reading and transaction of
+each venue, from the summary manifest of each style (see
+TimeSeriesSerializer.get_summary) instead of parsing every size file.
+materialize then reads the full history of the few pairs that survive the
+filters, before the du historical stats need it.
+"""
+
+_serializer = None
+
+
+def _init_worker(storage, data_folder):
+    global _serializer
+    _serializer = get_time_series_serializer(storage, data_folder)
+
+
+def _load_style(style_id, lazy):
+    try:
+        if lazy:
+            size_prices = _serializer.get_summary(style_id)
+        else:
+            size_prices = _serializer.get(style_id)
+    except FileNotFoundError:
+        size_prices = {}
+    return style_id, size_prices
+
+
+def _load_styles(style_ids, lazy):
+    return [_load_style(style_id, lazy) for style_id in style_ids]
+
+
+def get_peak_rss_mb():
+    """
+    @return (this process, largest finished child process) peak resident set
+        size in MB
+    """
+    # ru_maxrss is in KB on linux
+    return (
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    )
+
+
+class CatalogLoader:
+    def __init__(self, data_folder=None, storage=None, workers=1, lazy=False):
+        self.data_folder = data_folder
+        self.storage = storage
+        self.workers = workers
+        self.lazy = lazy
+        self.serializer = None
+        return
+
+    def load(self, style_ids, chunk_size=64):
+        """
+        @return {style_id: {size: {venue: {"prices": [...], "transactions": [...]}}}}
+        """
+        start = time.perf_counter()
+        style_ids = list(style_ids)
+        all_size_prices = {}
+        if self.workers > 1:
+            chunks = [
+                style_ids[i : i + chunk_size]
+                for i in range(0, len(style_ids), chunk_size)
+            ]
+            with concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(self.storage, self.data_folder),
+            ) as executor:
+                for loaded in executor.map(
+                    _load_styles,
+                    chunks,
+                    [self.lazy] * len(chunks),
+                ):
+                    all_size_prices.update(loaded)
+        else:
+            _init_worker(self.storage, self.data_folder)
+            all_size_prices.update(_load_styles(style_ids, self.lazy))
+
+        self_rss, workers_rss = get_peak_rss_mb()
+        print(
+            "loaded {} styles in {:.2f}s with {} workers{}, peak RSS {:.0f} MB (workers {:.0f} MB)".format(
+                len(all_size_prices),
+                time.perf_counter() - start,
+                self.workers,
+                " (lazy)" if self.lazy else "",
+                self_rss,
+                workers_rss,
+            )
+        )
+        return all_size_prices
+
+    def get_fingerprints(self, style_ids):
+        """
+        @return {(style_id, size): fingerprint} of every stored pair, see
+            TimeSeriesSerializer.get_fingerprints
+        """
+        if not self.serializer:
+            self.serializer = get_time_series_serializer(self.storage, self.data_folder)
+        fingerprints = {}
+        for style_id in style_ids:
+            for size, fingerprint in self.serializer.get_fingerprints(style_id).items():
+                fingerprints[(style_id, size)] = fingerprint
+        return fingerprints
+
+    def load_pairs(self, pairs):
+        """
+        @return {(style_id, size): {venue: {"prices": [...], "transactions": [...]}}}
+            full history of the given pairs
+        """
+        if not self.serializer:
+            self.serializer = get_time_series_serializer(self.storage, self.data_folder)
+        return {
+            (style_id, size): self.serializer.get(style_id, size)[size]
+            for style_id, size in pairs
+        }
+
+    def materialize(self, size_prices):
+        """
+        Replace trimmed readings of the given pairs with their full history,
+        keeping anything else (e.g. annotation) already attached to them.
+
+        @param size_prices  {(style_id, size): {venue: {...}, ...}}
+        """
+        if not self.lazy:
+            return
+        if not self.serializer:
+            self.serializer = get_time_series_serializer(self.storage, self.data_folder)
+        for (style_id, size), v in size_prices.items():
+            full = self.serializer.get(style_id, size)[size]
+            for venue in full:
+                v[venue] = full[venue]
+        return
@@ -0,0 +1,96 @@
+import hashlib
+import json
+import os
+import pickle
+
+"""
+Persistent cache of strategy evaluations, so reruns only evaluate the
+(style_id, size) pairs whose stored readings changed.
+
+An entry keeps, per pair, the fingerprint of its stored readings
+(TimeSeriesSerializer.get_fingerprints), the result of evaluating it (None if
+it was filtered out, else its latest readings and annotation) and the time
+until which that result holds: a selected pair drops out on its own once its
+readings or transactions are no longer fresh, a filtered out pair can't come
+back without new readings. The whole cache belongs to one config key (options,
+fees, spot and dated fx rates); a different key starts from scratch.
+"""
+
+
+def get_config_key(options, fees_conf, fx_rates, fx_history=None):
+    """
+    @param fx_history  list (optional) the dated fx rates transactions are
+        converted at, see FxRateTable.to_list
+    """
+    config = {
+        "options": options,
+        "fees": fees_conf,
+        "fx_rates": sorted([list(k) + [v] for k, v in fx_rates.items()]),
+        "fx_history": fx_history if fx_history else [],
+    }
+    return hashlib.sha1(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class EvaluationCache:
+    def __init__(self, cache_file):
+        self.dst_file_path = cache_file
+        self.config_key = None
+        self.entries = {}
+        if os.path.isfile(cache_file):
+            self.load_cache()
+
+    def load_cache(self):
+        with open(self.dst_file_path, "rb") as infile:
+            cache = pickle.load(infile)
+        self.config_key = cache["config_key"]
+        self.entries = cache["entries"]
+
+    def reset(self, config_key):
+        """
+        Drop every entry unless they were evaluated with the same config.
+        """
+        if config_key != self.config_key:
+            self.entries = {}
+        self.config_key = config_key
+
+    def clear(self):
+        self.entries = {}
+
+    def get(self, pair, fingerprint, now):
+        """
+        @return the cached entry of a pair if its readings haven't changed and
+            its result still holds at now, else None
+        """
+        entry = self.entries.get(pair)
+        if not entry or entry["fingerprint"] != fingerprint:
+            return None
+        if entry["valid_until"] is not None and entry["valid_until"] <= now:
+            return None
+        return entry
+
+    def put(self, pair, fingerprint, result, valid_until=None):
+        """
+        @param result  None if the pair got filtered out, else its
+            {"data": ..., "identifier": ...} result item
+        @param valid_until  datetime (optional) when the result stops holding
+        """
+        self.entries[pair] = {
+            "fingerprint": fingerprint,
+            "result": result,
+            "valid_until": valid_until,
+        }
+
+    def prune(self, pairs):
+        """
+        Forget pairs no longer in the catalog.
+        """
+        pairs = set(pairs)
+        self.entries = {k: v for k, v in self.entries.items() if k in pairs}
+
+    def save_cache(self):
+        tmp_file_path = self.dst_file_path + ".tmp"
+        with open(tmp_file_path, "wb") as outfile:
+            pickle.dump(
+                {"config_key": self.config_key, "entries": self.entries}, outfile
+            )
+        os.replace(tmp_file_path, self.dst_file_path)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+import sys
+
+# hack for import
+sys.path.append("../feed/")
+
+import contextlib
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from evaluation_cache import EvaluationCache
+from fx_rate import FxRate
+from strategy import Strategy, get_deltas, get_values, parse_strategy_options
+from strategy_bench import check_parity
+from synthetic_catalog import make_synthetic_size_prices, write_catalog
+
+
+def make_strategy(merged_file):
+    fx_rate = FxRate(cache_file=None, history_file=None)
+    # seeded so no request goes out
+    fx_rate.fx_rates = {("CNY", "USD"): 0.142, ("USD", "CNY"): 7.04}
+    strategy = Strategy("fees.json", fx_rate)
+    strategy.load_static_info(merged_file)
+    return strategy
+
+
+class TestIncrementalRun(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            self.data_folder, self.merged_file = write_catalog(
+                make_synthetic_size_prices(200, 5, transactions=20), self.folder
+            )
+        self.options = parse_strategy_options("options.json")
+        self.cache_file = os.path.join(self.folder, "cache.pkl")
+        return
+
+    def run_incremental(self):
+        strategy = make_strategy(self.merged_file)
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            return strategy.run_incremental(
+                self.options, EvaluationCache(self.cache_file), self.data_folder
+            )
+
+    def test_same_result_as_full_run(self):
+        strategy = make_strategy(self.merged_file)
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            strategy.load_all_size_prices(self.data_folder)
+            expected = strategy.run(self.options)
+        self.assertGreater(len(expected), 0)
+        check_parity(expected, self.run_incremental())
+
+        # as if the cached results were computed days ago
+        cache = EvaluationCache(self.cache_file)
+        for entry in cache.entries.values():
+            if entry["result"]:
+                rolling = entry["result"]["data"]["annotation"]["du_rolling"]
+                rolling["days_since_last_sale"] -= 3
+        cache.save_cache()
+        check_parity(expected, self.run_incremental())
+
+    def test_watch_deltas(self):
+        key = self.options["sort"]
+        previous_values = get_values(self.run_incremental(), key)
+        # an idle poll
+        result = self.run_incremental()
+        self.assertEqual(get_deltas(previous_values, result, key), ([], [], []))
+
+        # the pair is rewritten without its stockx readings, so it is filtered out
+        style_id, size = result[0]["identifier"]
+        path = os.path.join(self.data_folder, style_id, size + ".json")
+        with open(path, "r") as infile:
+            data = json.loads(infile.read())
+        del data["stockx"]
+        with open(path, "w") as outfile:
+            outfile.write(json.dumps(data))
+        new, dropped, changed = get_deltas(
+            get_values(result, key), self.run_incremental(), key
+        )
+        self.assertEqual((new, changed), ([], []))
+        self.assertEqual(
+            dropped, [((style_id, size), get_values(result, key)[(style_id, size)])]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
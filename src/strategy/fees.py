@@ -1,16 +1,88 @@
 #!/usr/bin/env python3
 
 import json
+
+import numpy as np
+
 from fx_rate import FxRate
 
+"""
+Trading fees between venues.
+
+Besides the scalar methods, each (buy_venue, sell_venue) route compiles into
+a FeeRoute of precomputed coefficients (see get_route), which the *_array
+methods evaluate on NumPy arrays. Those follow the scalar methods' operations
+in the same order, so they give bit-for-bit the same results.
+"""
+
+
+class FeeRoute:
+    def __init__(self, fees, buy_venue, sell_venue):
+        self.buy_venue = buy_venue
+        self.sell_venue = sell_venue
+        # all in USD
+        self.buy_fees = fees.get_total_buy_side_fees(buy_venue)
+        self.shipping = fees.get_shipping_cost(buy_venue, sell_venue)
+        self.sell_percent = fees.get_sell_side_percent(sell_venue)
+        self.sell_flat = fees.get_sell_side_flat_fees(sell_venue)
+        self.sell_keep_ratio = 1 - (self.sell_percent / 100)
+        self.cny_usd = fees.fx_rate.get_spot_fx(1, "CNY", "USD")
+        return
+
+    def get_total_expenditure(self, buy_price_usd):
+        return buy_price_usd + self.buy_fees + self.shipping
+
+    def get_total_income(self, sell_price_usd):
+        return sell_price_usd - (
+            sell_price_usd * self.sell_percent / 100 + self.sell_flat
+        )
+
 
 class Fees:
     def __init__(self, conf_file, fx_rate):
         with open(conf_file, "r") as infile:
             self.conf = json.loads(infile.read())
         self.fx_rate = fx_rate
+        self.routes = {}
         return
 
+    def get_route(self, buy_venue, sell_venue):
+        """
+        @return the FeeRoute of buying on buy_venue and selling on sell_venue,
+            compiled again whenever the CNY / USD rate it used changed
+        """
+        route = self.routes.get((buy_venue, sell_venue))
+        if not route or route.cny_usd != self.fx_rate.get_spot_fx(1, "CNY", "USD"):
+            route = FeeRoute(self, buy_venue, sell_venue)
+            self.routes[(buy_venue, sell_venue)] = route
+        return route
+
+    def get_sell_side_percent(self, venue):
+        """
+        Sell side fees proportional to the sell price, in percent.
+        """
+        if venue == "du":
+            return (
+                self.conf[venue]["commission_percent"]
+                + self.conf[venue]["tech_service_percent"]
+                + self.conf[venue]["transfer_percent"]
+            )
+        raise RuntimeError("fees: unsupported venue / unimplemented {}".format(venue))
+
+    def get_sell_side_flat_fees(self, venue):
+        """
+        Sell side fees per item. All fees are denominated in USD.
+        """
+        if venue == "du":
+            return self.fx_rate.get_spot_fx(
+                self.conf[venue]["packaging_cny"]
+                + self.conf[venue]["verification_cny"]
+                + self.conf[venue]["service_cny"],
+                "CNY",
+                "USD",
+            )
+        raise RuntimeError("fees: unsupported venue / unimplemented {}".format(venue))
+
     def get_total_buy_side_fees(self, venue, buy_price_usd=None):
         """
         Buy side fees. All fees are denominated in USD.
@@ -24,21 +96,13 @@ class Fees:
         Sell side fees. All fees are denominated in USD.
         """
         if venue == "du":
-            if not sell_price_usd:
+            if sell_price_usd is None:
                 raise RuntimeError(
                     "sell_price_usd is required to get fees on {}".format(venue)
                 )
-            return sell_price_usd * (
-                self.conf[venue]["commission_percent"]
-                + self.conf[venue]["tech_service_percent"]
-                + self.conf[venue]["transfer_percent"]
-            ) / 100 + self.fx_rate.get_spot_fx(
-                self.conf[venue]["packaging_cny"]
-                + self.conf[venue]["verification_cny"]
-                + self.conf[venue]["service_cny"],
-                "CNY",
-                "USD",
-            )
+            return sell_price_usd * self.get_sell_side_percent(
+                venue
+            ) / 100 + self.get_sell_side_flat_fees(venue)
         raise RuntimeError("fees: unsupported venue / unimplemented {}".format(venue))
 
     def get_shipping_cost(self, buy_venue, sell_venue):
@@ -61,25 +125,8 @@ class Fees:
         """
         if venue == "du":
             list_price_usd = (
-                target_value_usd
-                + self.fx_rate.get_spot_fx(
-                    self.conf[venue]["packaging_cny"]
-                    + self.conf[venue]["verification_cny"]
-                    + self.conf[venue]["service_cny"],
-                    "CNY",
-                    "USD",
-                )
-            ) / (
-                1
-                - (
-                    (
-                        self.conf[venue]["commission_percent"]
-                        + self.conf[venue]["tech_service_percent"]
-                        + self.conf[venue]["transfer_percent"]
-                    )
-                    / 100
-                )
-            )
+                target_value_usd + self.get_sell_side_flat_fees(venue)
+            ) / (1 - (self.get_sell_side_percent(venue) / 100))
             if not out_ccy or out_ccy == "USD":
                 return list_price_usd
             else:
@@ -113,7 +160,7 @@ class Fees:
             total_expenditure = buy_price + buy_fees + shipping_buy_to_sell
             total_income = sell_price - sell_fees
             ratio = (total_income - total_expenditure) / total_expenditure
-        
+
         All fees are denominated in USD unless specified otherwise.
         """
         total_income, total_expenditure = self._get_income_expenditure(
@@ -151,6 +198,58 @@ class Fees:
         )
         return list_price
 
+    def get_profit_percent_array(
+        self, buy_venue, sell_venue, buy_price_usd, sell_price, sell_price_ccy=None
+    ):
+        """
+        `get_profit_percent` over arrays of prices (or scalars), through the
+        compiled route.
+        """
+        route = self.get_route(buy_venue, sell_venue)
+        sell_price = np.asarray(sell_price, dtype=np.float64)
+        if sell_price_ccy:
+            sell_price = self.fx_rate.get_spot_fx(sell_price, sell_price_ccy, "USD")
+        total_expenditure = route.get_total_expenditure(
+            np.asarray(buy_price_usd, dtype=np.float64)
+        )
+        total_income = route.get_total_income(sell_price)
+        return (total_income - total_expenditure) / total_expenditure
+
+    def get_profit_value_array(
+        self, buy_venue, sell_venue, buy_price_usd, sell_price, sell_price_ccy=None
+    ):
+        """
+        `get_profit_value` over arrays of prices (or scalars), through the
+        compiled route.
+        """
+        route = self.get_route(buy_venue, sell_venue)
+        sell_price = np.asarray(sell_price, dtype=np.float64)
+        if sell_price_ccy:
+            sell_price = self.fx_rate.get_spot_fx(sell_price, sell_price_ccy, "USD")
+        total_expenditure = route.get_total_expenditure(
+            np.asarray(buy_price_usd, dtype=np.float64)
+        )
+        return route.get_total_income(sell_price) - total_expenditure
+
+    def get_target_list_price_for_target_ratio_array(
+        self, buy_venue, sell_venue, target_ratio, buy_price_usd, out_ccy=None
+    ):
+        """
+        `get_target_list_price_for_target_ratio` over arrays of ratios and / or
+        prices, through the compiled route.
+        """
+        route = self.get_route(buy_venue, sell_venue)
+        total_expenditure = route.get_total_expenditure(
+            np.asarray(buy_price_usd, dtype=np.float64)
+        )
+        total_income = total_expenditure * (
+            1 + np.asarray(target_ratio, dtype=np.float64)
+        )
+        list_price_usd = (total_income + route.sell_flat) / route.sell_keep_ratio
+        if not out_ccy or out_ccy == "USD":
+            return list_price_usd
+        return self.fx_rate.get_spot_fx(list_price_usd, "USD", out_ccy)
+
 
 if __name__ == "__main__":
     fx_rate = FxRate()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+import random
+import unittest
+
+import numpy as np
+
+from fees import Fees
+from fx_rate import FxRate
+
+
+def make_fx_rate(cny_usd, usd_cny):
+    fx_rate = FxRate(cache_file=None, history_file=None)
+    # seeded so no request goes out
+    fx_rate.fx_rates = {("CNY", "USD"): cny_usd, ("USD", "CNY"): usd_cny}
+    return fx_rate
+
+
+class TestFeesArrays(unittest.TestCase):
+    def setUp(self):
+        self.fx_rate = make_fx_rate(0.14219, 7.0327)
+        self.fees = Fees("fees.json", self.fx_rate)
+        rng = random.Random(0)
+        self.buy_prices = [rng.uniform(30, 900) for _ in range(2000)]
+        self.sell_prices = [rng.uniform(200, 9000) for _ in range(2000)]
+        self.ratios = [rng.uniform(-0.5, 1.5) for _ in range(2000)]
+        return
+
+    def test_profit_percent(self):
+        actual = self.fees.get_profit_percent_array(
+            "stockx", "du", self.buy_prices, self.sell_prices, "CNY"
+        )
+        for i, (buy, sell) in enumerate(zip(self.buy_prices, self.sell_prices)):
+            expected = self.fees.get_profit_percent("stockx", "du", buy, sell, "CNY")
+            self.assertEqual(actual[i], expected)
+
+    def test_profit_value(self):
+        actual = self.fees.get_profit_value_array(
+            "stockx", "du", self.buy_prices, self.sell_prices, "CNY"
+        )
+        for i, (buy, sell) in enumerate(zip(self.buy_prices, self.sell_prices)):
+            expected = self.fees.get_profit_value("stockx", "du", buy, sell, "CNY")
+            self.assertEqual(actual[i], expected)
+
+    def test_target_list_price(self):
+        for out_ccy in [None, "CNY"]:
+            actual = self.fees.get_target_list_price_for_target_ratio_array(
+                "stockx", "du", self.ratios, self.buy_prices, out_ccy=out_ccy
+            )
+            for i, (ratio, buy) in enumerate(zip(self.ratios, self.buy_prices)):
+                expected = self.fees.get_target_list_price_for_target_ratio(
+                    "stockx", "du", ratio, buy, out_ccy=out_ccy
+                )
+                self.assertEqual(actual[i], expected)
+
+    def test_route_follows_fx_rate(self):
+        before = self.fees.get_profit_value_array("stockx", "du", 100.0, 1000.0, "CNY")
+        self.fx_rate.fx_rates[("CNY", "USD")] = 0.15
+        after = self.fees.get_profit_value_array("stockx", "du", 100.0, 1000.0, "CNY")
+        self.assertNotEqual(before, after)
+        self.assertEqual(
+            after, self.fees.get_profit_value("stockx", "du", 100.0, 1000.0, "CNY")
+        )
+
+    def test_unsupported_route(self):
+        with self.assertRaises(RuntimeError):
+            self.fees.get_profit_percent_array("du", "stockx", np.ones(3), np.ones(3))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,16 +1,294 @@
+#!/usr/bin/env python3
+
+import argparse
+import bisect
+import csv
+import datetime
+import json
+import os
+import pathlib
+import time
+
 import requests
 
+"""
+FX rates for strategy and analytics.
+
+Spot rates come from a pluggable source (HttpFxSource by default, FileFxSource
+reads a local JSON file instead) and are cached on disk with their fetch time,
+so processes started within ttl_seconds of each other don't ask the source
+again. When the source can't be reached a cached rate is used however old it
+is. Every rate fetched is also recorded in a dated rates table (a csv of
+date,in_ccy,out_ccy,rate), which get_historical_fx looks up to convert an amount
+at the rate of its own date. Spot fetches only record rates from the day they
+start running, rates of earlier dates are backfilled by importing a csv of the
+same format (./fx_rate.py --import_history). Dates before the first rate of a
+pair are converted at that first rate, with a warning.
+"""
+
+DEFAULT_CACHE_FILE = "../data/fx_rates.json"
+DEFAULT_HISTORY_FILE = "../data/fx_history.csv"
+
+
+class HttpFxSource:
+    url = "http://rate-exchange-1.appspot.com/currency?from={}&to={}"
+
+    def __init__(self, timeout=10):
+        self.timeout = timeout
+        return
+
+    def get_rate(self, in_ccy, out_ccy):
+        r = requests.get(self.url.format(in_ccy, out_ccy), timeout=self.timeout)
+        return float(r.json()["rate"])
+
+
+class FileFxSource:
+    """
+    Rates from a local JSON file, e.g. {"CNY": {"USD": 0.142}, "USD": {"CNY": 7.04}}
+    """
+
+    def __init__(self, rates_file):
+        with open(rates_file, "r") as infile:
+            self.rates = json.loads(infile.read())
+        return
+
+    def get_rate(self, in_ccy, out_ccy):
+        try:
+            return float(self.rates[in_ccy][out_ccy])
+        except KeyError:
+            raise RuntimeError(
+                "no {} / {} rate in fx rates file".format(in_ccy, out_ccy)
+            )
+
+
+def get_fx_source(source):
+    """
+    @param source  str "http" or "file:{path}"
+    """
+    if not source or source == "http":
+        return HttpFxSource()
+    if source.startswith("file:"):
+        return FileFxSource(source[len("file:") :])
+    raise RuntimeError("unsupported fx source {}".format(source))
+
+
+class FxRateTable:
+    def __init__(self, history_file=None):
+        self.history_file = history_file
+        # {(in_ccy, out_ccy): ([date, ...] sorted, [rate, ...])}
+        self.rates = {}
+        # pairs already warned about dates before their first rate
+        self.warned = set()
+        if history_file and os.path.isfile(history_file):
+            with open(history_file, "r") as infile:
+                for row in csv.reader(infile):
+                    if len(row) != 4:
+                        continue
+                    date = datetime.datetime.strptime(row[0], "%Y-%m-%d").date()
+                    self._insert(date, row[1], row[2], float(row[3]))
+        return
+
+    def _insert(self, date, in_ccy, out_ccy, rate):
+        dates, rates = self.rates.setdefault((in_ccy, out_ccy), ([], []))
+        idx = bisect.bisect_left(dates, date)
+        if idx < len(dates) and dates[idx] == date:
+            rates[idx] = rate
+        else:
+            dates.insert(idx, date)
+            rates.insert(idx, rate)
+
+    def add(self, date, in_ccy, out_ccy, rate):
+        self._insert(date, in_ccy, out_ccy, rate)
+        if self.history_file:
+            pathlib.Path(os.path.dirname(self.history_file) or ".").mkdir(
+                parents=True, exist_ok=True
+            )
+            with open(self.history_file, "a") as outfile:
+                csv.writer(outfile, lineterminator="\n").writerow(
+                    [date.isoformat(), in_ccy, out_ccy, rate]
+                )
+        return
+
+    def import_rates(self, rates_file):
+        """
+        Backfill the table from a csv of date,in_ccy,out_ccy,rate rows, e.g.
+        exported from a central bank's daily series. A header and malformed
+        rows are skipped.
+
+        @return number of rates imported
+        """
+        imported = 0
+        with open(rates_file, "r") as infile:
+            for row in csv.reader(infile):
+                try:
+                    date = datetime.datetime.strptime(row[0], "%Y-%m-%d").date()
+                    in_ccy, out_ccy, rate = row[1], row[2], float(row[3])
+                except (IndexError, ValueError):
+                    print("skipping fx rate row {}".format(row))
+                    continue
+                self.add(date, in_ccy, out_ccy, rate)
+                imported += 1
+        return imported
+
+    def _lookup(self, key, date):
+        dates, rates = self.rates[key]
+        idx = bisect.bisect_right(dates, date) - 1
+        if idx < 0:
+            if key not in self.warned:
+                print(
+                    "no {} / {} rate before {}, converting {} and earlier at it, "
+                    "backfill with ./fx_rate.py --import_history".format(
+                        *key, dates[0], date
+                    )
+                )
+                self.warned.add(key)
+            idx = 0
+        return rates[idx]
+
+    def get_rate(self, in_ccy, out_ccy, date):
+        """
+        @return the rate of the latest date not after date (the earliest one if
+            date is before all of them, with a warning), None if the pair has
+            no rates
+        """
+        if (in_ccy, out_ccy) in self.rates:
+            return self._lookup((in_ccy, out_ccy), date)
+        if (out_ccy, in_ccy) in self.rates:
+            return 1 / self._lookup((out_ccy, in_ccy), date)
+        return None
+
+    def to_list(self):
+        """
+        @return every rate as sorted [[date, in_ccy, out_ccy, rate]], e.g. to
+            key caches of results converted at them
+        """
+        return sorted(
+            [date.isoformat(), in_ccy, out_ccy, rate]
+            for (in_ccy, out_ccy), (dates, rates) in self.rates.items()
+            for date, rate in zip(dates, rates)
+        )
+
 
 class FxRate:
-    def __init__(self):
+    def __init__(
+        self,
+        source=None,
+        cache_file=DEFAULT_CACHE_FILE,
+        ttl_seconds=21600,
+        history_file=DEFAULT_HISTORY_FILE,
+    ):
+        """
+        @param source  HttpFxSource (default) or anything with get_rate(in_ccy, out_ccy)
+        @param cache_file  str (optional) where spot rates are cached across runs
+        @param ttl_seconds  how long a cached spot rate is used before asking the source
+        @param history_file  str (optional) the dated rates table
+        """
+        self.source = source if source else HttpFxSource()
+        self.cache_file = cache_file
+        self.ttl_seconds = ttl_seconds
+        # rates set here without a fetch time never expire
         self.fx_rates = {}
+        self.fetched_at = {}
+        self.history = FxRateTable(history_file)
+        if cache_file and os.path.isfile(cache_file):
+            self.load_cache()
 
-    def get_spot_fx(self, in_amount, in_ccy, out_ccy):
-        if not (in_ccy, out_ccy) in self.fx_rates:
-            r = requests.get(
-                "http://rate-exchange-1.appspot.com/currency?from={}&to={}".format(
-                    in_ccy, out_ccy
+    def load_cache(self):
+        with open(self.cache_file, "r") as infile:
+            for key, entry in json.loads(infile.read()).items():
+                in_ccy, out_ccy = key.split("/")
+                self.fx_rates[(in_ccy, out_ccy)] = entry["rate"]
+                self.fetched_at[(in_ccy, out_ccy)] = entry["time"]
+
+    def save_cache(self):
+        if not self.cache_file:
+            return
+        pathlib.Path(os.path.dirname(self.cache_file) or ".").mkdir(
+            parents=True, exist_ok=True
+        )
+        tmp_file_path = self.cache_file + ".tmp"
+        with open(tmp_file_path, "w") as outfile:
+            outfile.write(
+                json.dumps(
+                    {
+                        "{}/{}".format(*k): {"rate": v, "time": self.fetched_at[k]}
+                        for k, v in self.fx_rates.items()
+                        if k in self.fetched_at
+                    }
                 )
             )
-            self.fx_rates[(in_ccy, out_ccy)] = r.json()["rate"]
-        return in_amount * self.fx_rates[(in_ccy, out_ccy)]
+        os.replace(tmp_file_path, self.cache_file)
+
+    def _is_fresh(self, key):
+        if key not in self.fx_rates:
+            return False
+        if key not in self.fetched_at:
+            return True
+        return time.time() - self.fetched_at[key] < self.ttl_seconds
+
+    def get_spot_fx(self, in_amount, in_ccy, out_ccy):
+        key = (in_ccy, out_ccy)
+        if not self._is_fresh(key):
+            try:
+                rate = self.source.get_rate(in_ccy, out_ccy)
+            except Exception as e:
+                if key not in self.fx_rates:
+                    raise RuntimeError(
+                        "failed to get {} / {} rate: {}".format(in_ccy, out_ccy, e)
+                    )
+                print(
+                    "failed to get {} / {} rate ({}), using the cached one from {}".format(
+                        in_ccy,
+                        out_ccy,
+                        e,
+                        datetime.datetime.utcfromtimestamp(
+                            self.fetched_at[key]
+                        ).isoformat(),
+                    )
+                )
+            else:
+                self.fx_rates[key] = rate
+                self.fetched_at[key] = time.time()
+                self.history.add(
+                    datetime.datetime.utcnow().date(), in_ccy, out_ccy, rate
+                )
+                self.save_cache()
+        return in_amount * self.fx_rates[key]
+
+    def get_historical_fx(self, in_amount, in_ccy, out_ccy, date):
+        """
+        Convert at the rate of date from the dated rates table, the spot rate if
+        the table has none for the currencies.
+
+        @param date  datetime.date or datetime.datetime
+        """
+        if isinstance(date, datetime.datetime):
+            date = date.date()
+        rate = self.history.get_rate(in_ccy, out_ccy, date)
+        if rate is None:
+            return self.get_spot_fx(in_amount, in_ccy, out_ccy)
+        return in_amount * rate
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        """
+        backfill the dated fx rates table du transactions are converted at.
+
+        example usage:
+          ./fx_rate.py --import_history cny_usd_2019.csv
+    """
+    )
+    parser.add_argument(
+        "--import_history",
+        required=True,
+        help="csv of date,in_ccy,out_ccy,rate rows, dates as YYYY-MM-DD",
+    )
+    parser.add_argument(
+        "--history", default=DEFAULT_HISTORY_FILE, help="the dated fx rates table"
+    )
+    args = parser.parse_args()
+
+    table = FxRateTable(args.history)
+    imported = table.import_rates(args.import_history)
+    print("imported {} rates into {}".format(imported, args.history))
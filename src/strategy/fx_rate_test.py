@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from fx_rate import FxRate, FxRateTable, FileFxSource, get_fx_source
+
+
+class CountingFxSource:
+    def __init__(self, rate):
+        self.rate = rate
+        self.calls = 0
+        self.offline = False
+
+    def get_rate(self, in_ccy, out_ccy):
+        self.calls += 1
+        if self.offline:
+            raise RuntimeError("offline")
+        return self.rate
+
+
+class TestFxRate(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.cache_file = os.path.join(self.folder, "fx_rates.json")
+        self.history_file = os.path.join(self.folder, "fx_history.csv")
+        return
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+        return
+
+    def make_fx_rate(self, source, ttl_seconds=3600):
+        return FxRate(source, self.cache_file, ttl_seconds, self.history_file)
+
+    def test_cache_shared_across_instances(self):
+        source = CountingFxSource(0.142)
+        self.assertEqual(self.make_fx_rate(source).get_spot_fx(100, "CNY", "USD"), 14.2)
+        self.assertEqual(self.make_fx_rate(source).get_spot_fx(100, "CNY", "USD"), 14.2)
+        self.assertEqual(source.calls, 1)
+
+    def test_expired_rate_is_fetched_again(self):
+        source = CountingFxSource(0.142)
+        self.make_fx_rate(source, ttl_seconds=0).get_spot_fx(1, "CNY", "USD")
+        source.rate = 0.15
+        fx_rate = self.make_fx_rate(source, ttl_seconds=0)
+        self.assertEqual(fx_rate.get_spot_fx(1, "CNY", "USD"), 0.15)
+        self.assertEqual(source.calls, 2)
+
+    def test_offline_fallback(self):
+        source = CountingFxSource(0.142)
+        self.make_fx_rate(source, ttl_seconds=0).get_spot_fx(1, "CNY", "USD")
+        source.offline = True
+        fx_rate = self.make_fx_rate(source, ttl_seconds=0)
+        self.assertEqual(fx_rate.get_spot_fx(1, "CNY", "USD"), 0.142)
+        with self.assertRaises(RuntimeError):
+            fx_rate.get_spot_fx(1, "USD", "CNY")
+
+    def test_file_source(self):
+        rates_file = os.path.join(self.folder, "rates.json")
+        with open(rates_file, "w") as outfile:
+            outfile.write(json.dumps({"CNY": {"USD": 0.142}}))
+        source = get_fx_source("file:" + rates_file)
+        self.assertIsInstance(source, FileFxSource)
+        self.assertEqual(source.get_rate("CNY", "USD"), 0.142)
+        with self.assertRaises(RuntimeError):
+            source.get_rate("USD", "CNY")
+
+    def test_historical_rates(self):
+        table = FxRateTable(self.history_file)
+        table.add(datetime.date(2019, 6, 1), "CNY", "USD", 0.145)
+        table.add(datetime.date(2019, 1, 1), "CNY", "USD", 0.148)
+        table.add(datetime.date(2019, 12, 1), "CNY", "USD", 0.142)
+
+        fx_rate = self.make_fx_rate(CountingFxSource(0.14))
+        for date, rate in [
+            (datetime.datetime(2018, 12, 1), 0.148),
+            (datetime.datetime(2019, 1, 1, 12), 0.148),
+            (datetime.datetime(2019, 7, 4), 0.145),
+            (datetime.datetime(2020, 1, 1), 0.142),
+        ]:
+            self.assertEqual(fx_rate.get_historical_fx(1, "CNY", "USD", date), rate)
+        self.assertEqual(
+            fx_rate.get_historical_fx(1, "USD", "CNY", datetime.date(2019, 7, 4)),
+            1 / 0.145,
+        )
+        # no table for the currencies, spot it is
+        self.assertEqual(
+            fx_rate.get_historical_fx(1, "EUR", "USD", datetime.date(2019, 7, 4)), 0.14
+        )
+
+    def test_import_history(self):
+        rates_file = os.path.join(self.folder, "cny_usd.csv")
+        with open(rates_file, "w") as outfile:
+            outfile.write(
+                "date,in_ccy,out_ccy,rate\n"
+                "2019-01-02,CNY,USD,0.1456\n"
+                "2019-01-03,CNY,USD,0.1457\n"
+                "not a rate\n"
+            )
+        fx_rate = self.make_fx_rate(CountingFxSource(0.14))
+        # today's spot rate is all the table knows before the backfill
+        fx_rate.get_spot_fx(1, "CNY", "USD")
+        table = FxRateTable(self.history_file)
+        self.assertEqual(table.get_rate("CNY", "USD", datetime.date(2019, 1, 2)), 0.14)
+        self.assertEqual(table.warned, {("CNY", "USD")})
+
+        self.assertEqual(table.import_rates(rates_file), 2)
+        fx_rate = self.make_fx_rate(CountingFxSource(0.14))
+        self.assertEqual(
+            fx_rate.get_historical_fx(1, "CNY", "USD", datetime.date(2019, 1, 2)),
+            0.1456,
+        )
+        self.assertEqual(
+            fx_rate.get_historical_fx(1, "CNY", "USD", datetime.date(2019, 6, 1)),
+            0.1457,
+        )
+        self.assertEqual(fx_rate.history.warned, set())
+
+
+if __name__ == "__main__":
+    unittest.main()
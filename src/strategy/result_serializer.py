@@ -6,6 +6,7 @@ import sys
 sys.path.append("../feed/")
 
 from sizer import Sizer, SizerError
+from time_series_serializer import parse_time
 
 
 class ResultSerializer:
@@ -15,6 +16,12 @@ class ResultSerializer:
         self.sizer = Sizer()
         return
 
+    def get_usd(self, stats, name):
+        # at the transactions' own dates when the stats have them
+        if name + "_usd" in stats:
+            return stats[name + "_usd"]
+        return self.fx_rate.get_spot_fx(stats[name], "CNY", "USD")
+
     def get_annotation_str(self, annotation, style_id, size):
         return_str = ""
         for source in ["bid", "mid", "ask"]:
@@ -45,13 +52,18 @@ class ResultSerializer:
                             stats["first_date"].isoformat(),
                             stats["num_sales"],
                             stats["sales_per_day"],
-                            stats["high"], self.fx_rate.get_spot_fx(stats["high"], "CNY", "USD"),
-                            stats["low"], self.fx_rate.get_spot_fx(stats["low"], "CNY", "USD"),
-                            stats["first"], self.fx_rate.get_spot_fx(stats["first"], "CNY", "USD"),
-                            stats["last"], self.fx_rate.get_spot_fx(stats["last"], "CNY", "USD"),
-                            stats["avg"], self.fx_rate.get_spot_fx(stats["avg"], "CNY", "USD"),
+                            stats["high"], self.get_usd(stats, "high"),
+                            stats["low"], self.get_usd(stats, "low"),
+                            stats["first"], self.get_usd(stats, "first"),
+                            stats["last"], self.get_usd(stats, "last"),
+                            stats["avg"], self.get_usd(stats, "avg"),
                             stats["stdev"], self.fx_rate.get_spot_fx(stats["stdev"], "CNY", "USD"),
                             "./du_analyzer.py --style_id {} --size {} --mode plot".format(style_id, size))
+        if "du_rolling" in annotation:
+            stats = annotation["du_rolling"]
+            return_str += "  Du Rolling:\n"
+            for name, value in stats.items():
+                return_str += "    {:<26}{:.4f}\n".format(name + ":", value)
         return return_str
 
     def to_str(self, sorted_size_prices, static_info, static_info_extras):
@@ -63,8 +75,11 @@ class ResultSerializer:
             data["annotation"]["du_price_usd"] = self.fx_rate.get_spot_fx(
                 data["du"]["prices"][0]["list_price"] / 100, "CNY", "USD"
             )
-            data["annotation"]["du_last_transaction_usd"] = self.fx_rate.get_spot_fx(
-                data["du"]["transactions"][0]["price"] / 100, "CNY", "USD"
+            data["annotation"]["du_last_transaction_usd"] = self.fx_rate.get_historical_fx(
+                data["du"]["transactions"][0]["price"] / 100,
+                "CNY",
+                "USD",
+                parse_time(data["du"]["transactions"][0]["time"]),
             )
 
             # TODO: until merged has the right sizing, this reverse translation may
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+
+import sys
+
+# hack for import
+sys.path.append("../feed/")
+
+import argparse
+import concurrent.futures
+import contextlib
+import datetime
+import json
+import os
+import pathlib
+import platform
+import shutil
+import tempfile
+import time
+
+from catalog_loader import get_peak_rss_mb
+from csv_merge import merge_csvs
+from du_analyzer import ItemAnalyzer
+from fx_rate import FxRate
+from strategy import Strategy, parse_strategy_options
+from synthetic_catalog import make_synthetic_size_prices, write_catalog
+from vectorized_strategy import VectorizedStrategy
+
+"""
+Scaling benchmark of the catalog pipeline on synthetic catalogs.
+
+For each number of styles a synthetic catalog is written (synthetic_catalog),
+then the stages below are timed in a fresh process so peak memory is the
+catalog's own:
+  - generate: fabricate and write the data/ tree and mapping csvs
+  - csv_merge: merge the du and stockx mapping csvs
+  - load: static info and all time series through the storage
+  - filter_rank: Strategy.run (filters, profit annotations, ranking)
+  - report: ResultSerializer output of the result (to /dev/null)
+  - analytics: ItemAnalyzer historical and rolling stats of every pair with
+    du transactions
+Peak RSS after a stage is the peak of the process so far, so it never drops
+from one stage to the next.
+
+One JSON line per catalog size is appended to the results file.
+"""
+
+
+class StageTimer:
+    def __init__(self):
+        self.stages = []
+        return
+
+    @contextlib.contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        yield
+        self.stages.append(
+            {
+                "stage": stage,
+                "seconds": time.perf_counter() - start,
+                "peak_rss_mb": get_peak_rss_mb()[0],
+            }
+        )
+        print(
+            "{:<12} {:8.3f}s peak RSS {:.0f} MB".format(
+                stage, self.stages[-1]["seconds"], self.stages[-1]["peak_rss_mb"]
+            )
+        )
+
+
+def bench_catalog(styles, args):
+    """
+    @return benchmark result of one catalog size
+    """
+    timer = StageTimer()
+    work_folder = tempfile.mkdtemp(dir=args.work_folder)
+    try:
+        with timer.time("generate"):
+            all_size_prices = make_synthetic_size_prices(
+                styles, args.sizes, args.seed, args.readings, args.transactions
+            )
+            pairs = sum(len(size_prices) for size_prices in all_size_prices.values())
+            # the merge is timed on its own below
+            data_folder, merged_file = write_catalog(
+                all_size_prices, work_folder, args.storage, args.seed, merge=False
+            )
+            del all_size_prices
+
+        with timer.time("csv_merge"):
+            merge_csvs(
+                [
+                    os.path.join(work_folder, "du.mapping.synthetic.csv"),
+                    os.path.join(work_folder, "stockx.mapping.synthetic.csv"),
+                ],
+                merged_file,
+                False,
+            )
+
+        # fixed rates, the benchmark should not depend on the network
+        fx_rate = FxRate(cache_file=None, history_file=None)
+        fx_rate.fx_rates = {("CNY", "USD"): 0.142, ("USD", "CNY"): 7.04}
+        if args.engine == "numpy":
+            strategy = VectorizedStrategy("fees.json", fx_rate)
+        else:
+            strategy = Strategy("fees.json", fx_rate)
+        options = parse_strategy_options("options.json")
+
+        with timer.time("load"):
+            strategy.load_static_info(merged_file)
+            strategy.load_all_size_prices(
+                data_folder, args.storage, args.load_workers, args.lazy
+            )
+
+        with timer.time("filter_rank"):
+            result = strategy.run(options)
+
+        with timer.time("report"):
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                strategy.report(result)
+
+        with timer.time("analytics"):
+            analyzer = ItemAnalyzer()
+            transactions_list = [
+                data["du"]["transactions"]
+                for size_prices in strategy.all_size_prices.values()
+                for data in size_prices.values()
+                if len(data["du"]["transactions"]) > 0
+            ]
+            for transactions in transactions_list:
+                analyzer.get_historical_transactions_stats(
+                    ItemAnalyzer.to_ordered_sale_record(transactions)
+                )
+            analyzer.get_rolling_transactions_stats(transactions_list)
+    finally:
+        shutil.rmtree(work_folder)
+
+    return {
+        "time": datetime.datetime.utcnow().isoformat() + "Z",
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "styles": styles,
+        "sizes": args.sizes,
+        "pairs": pairs,
+        "readings": args.readings,
+        "transactions": args.transactions,
+        "storage": args.storage,
+        "engine": args.engine,
+        "load_workers": args.load_workers,
+        "lazy": args.lazy,
+        "results": len(result),
+        "stages": timer.stages,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        """
+        time the catalog pipeline stages on synthetic catalogs of growing size.
+
+        example usage:
+          ./scale_bench.py --styles 5000,50000 --readings 10 --engine numpy --out scale_bench.jsonl
+    """
+    )
+    parser.add_argument(
+        "--styles",
+        default="1000,5000",
+        help="comma separated numbers of styles, one catalog each",
+    )
+    parser.add_argument(
+        "--sizes", default=15, type=int, help="number of sizes per style"
+    )
+    parser.add_argument(
+        "--readings",
+        default=1,
+        type=int,
+        help="number of price readings per venue of a pair",
+    )
+    parser.add_argument(
+        "--transactions", default=5, type=int, help="most du transactions of a pair"
+    )
+    parser.add_argument("--seed", default=0, type=int, help="random seed")
+    parser.add_argument(
+        "--storage",
+        default="json",
+        help="[json|log|sqlite] how time series readings are stored",
+    )
+    parser.add_argument(
+        "--engine",
+        default="python",
+        help="[python|numpy] which Strategy.run implementation to time",
+    )
+    parser.add_argument(
+        "--load_workers",
+        default=1,
+        type=int,
+        help="number of processes loading stored time series",
+    )
+    parser.add_argument(
+        "--lazy",
+        action="store_true",
+        help="load only the readings run filters look at",
+    )
+    parser.add_argument(
+        "--work_folder",
+        default=None,
+        help="where the synthetic catalogs are written (and removed), defaults to the system temp folder",
+    )
+    parser.add_argument(
+        "--out",
+        default="scale_bench.jsonl",
+        help="file one JSON line of results per catalog size is appended to",
+    )
+    args = parser.parse_args()
+    if args.work_folder:
+        pathlib.Path(args.work_folder).mkdir(parents=True, exist_ok=True)
+
+    for styles in [int(s) for s in args.styles.split(",")]:
+        print("benchmarking {} styles of {} sizes".format(styles, args.sizes))
+        # a process per catalog so peak RSS isn't carried over from a smaller one
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1) as executor:
+            bench_result = executor.submit(bench_catalog, styles, args).result()
+        with open(args.out, "a") as outfile:
+            outfile.write(json.dumps(bench_result) + "\n")
+        print("appended results to {}".format(args.out))
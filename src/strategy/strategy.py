@@ -8,13 +8,22 @@ sys.path.append("../feed/")
 import argparse
 import json
 import datetime
+import time
 
 from static_info_serializer import StaticInfoSerializer
-from time_series_serializer import TimeSeriesSerializer
 from fees import Fees
-from fx_rate import FxRate
+from fx_rate import FxRate, get_fx_source
 from result_serializer import ResultSerializer
 from du_analyzer import ItemAnalyzer
+from catalog_loader import CatalogLoader
+from evaluation_cache import EvaluationCache, get_config_key
+from time_series_serializer import parse_time
+
+# how recent the latest readings / du transactions have to be for a pair to be
+# considered
+DATA_LIFETIME_SECONDS = 259200
+TRANSACTION_LIFETIME_SECONDS = 1.21e6
+
 
 class Strategy:
     def __init__(self, fees_file, fx_rate):
@@ -23,6 +32,7 @@ class Strategy:
         self.fx_rate = fx_rate
         self.serializer = ResultSerializer(self.fees, self.fx_rate)
         self.analyzer = ItemAnalyzer()
+        self.loader = None
         return
 
     def load_static_info(self, static_info_file):
@@ -35,12 +45,28 @@ class Strategy:
         )
         return
 
-    def load_all_size_prices(self, data_folder):
-        serializer = TimeSeriesSerializer(data_folder)
-        self.all_size_prices = {}
-        for style_id in self.static_info:
-            size_prices = serializer.get(style_id)
-            self.all_size_prices[style_id] = size_prices
+    def attach_rolling_stats(self, items):
+        """
+        Annotate du_rolling (see rolling_analytics) of all given items in one batch.
+
+        @param items  list of { mkt_data, annotation }
+        """
+        items = list(items)
+        rolling_stats = self.analyzer.get_rolling_transactions_stats(
+            [v["du"]["transactions"] for v in items]
+        )
+        for v, stats in zip(items, rolling_stats):
+            v["annotation"]["du_rolling"] = stats
+        return
+
+    def load_all_size_prices(self, data_folder, storage=None, workers=1, lazy=False):
+        """
+        @param workers  number of processes parsing stored readings
+        @param lazy  only load what run filters on, full histories of the
+            resulting pairs are read before their stats are attached
+        """
+        self.loader = CatalogLoader(data_folder, storage, workers, lazy)
+        self.all_size_prices = self.loader.load(self.static_info.keys())
         return
 
     def run(self, options):
@@ -50,7 +76,7 @@ class Strategy:
           - load data (done at this point),
           - filter (configurable options),
           - rank (configurable method)
-        
+
         @return sorted list of
           {(style_id, size_str): { mkt_data, annotation }}
         """
@@ -89,7 +115,7 @@ class Strategy:
         )
 
         # filter items by last data being valid and recent enough
-        def has_fresh_data(v, data_lifetime_seconds=259200):
+        def has_fresh_data(v, data_lifetime_seconds=DATA_LIFETIME_SECONDS):
             # 3 days
             if len(v["du"]["prices"]) == 0 or len(v["stockx"]["prices"]) == 0:
                 return False
@@ -124,7 +150,9 @@ class Strategy:
         )
 
         # filter items with at least one recent enough du historical transactions
-        def has_fresh_recent_transactions(v, data_lifetime_seconds=1.21e6):
+        def has_fresh_recent_transactions(
+            v, data_lifetime_seconds=TRANSACTION_LIFETIME_SECONDS
+        ):
             # 2 weeks
             if len(v["du"]["transactions"]) == 0:
                 return False
@@ -224,9 +252,18 @@ class Strategy:
 
         # attach analytics
         if options["generate_du_historical_stats"]:
+            if self.loader:
+                self.loader.materialize(size_prices_profit_cutoff)
             for k in size_prices_profit_cutoff:
-                transactions = ItemAnalyzer.to_ordered_sale_record(size_prices_profit_cutoff[k]["du"]["transactions"])
-                size_prices_profit_cutoff[k]["annotation"]["du_analyzer"] = self.analyzer.get_historical_transactions_stats(transactions)
+                transactions = ItemAnalyzer.to_ordered_sale_record(
+                    size_prices_profit_cutoff[k]["du"]["transactions"]
+                )
+                size_prices_profit_cutoff[k]["annotation"][
+                    "du_analyzer"
+                ] = self.analyzer.get_historical_transactions_stats(
+                    transactions, fx_rate=self.fx_rate
+                )
+            self.attach_rolling_stats(size_prices_profit_cutoff.values())
 
         # sort
         result_array = [
@@ -240,12 +277,200 @@ class Strategy:
         print("total results {}".format(len(result_array)))
         return result_array
 
+    @staticmethod
+    def get_valid_until(data):
+        """
+        @return when a selected pair stops passing the freshness filters
+        """
+        return min(
+            parse_time(data["du"]["prices"][0]["time"])
+            + datetime.timedelta(seconds=DATA_LIFETIME_SECONDS),
+            parse_time(data["stockx"]["prices"][0]["time"])
+            + datetime.timedelta(seconds=DATA_LIFETIME_SECONDS),
+            parse_time(data["du"]["transactions"][0]["time"])
+            + datetime.timedelta(seconds=TRANSACTION_LIFETIME_SECONDS),
+        )
+
+    @staticmethod
+    def trim_result(item):
+        """
+        @return a result item with only the latest readings report looks at
+        """
+        data = {}
+        for name, v in item["data"].items():
+            if name == "annotation":
+                data[name] = v
+            else:
+                data[name] = {
+                    "prices": v.get("prices", [])[:1],
+                    "transactions": v.get("transactions", [])[:1],
+                }
+        return {"data": data, "identifier": item["identifier"]}
+
+    def refresh_rolling_stats(self, results):
+        """
+        Recompute du_rolling of cached results, from the full du transactions of
+        their pairs. Unlike the rest of a result, which only changes with the
+        stored readings, it depends on the time of the run (days since the last
+        sale, sales per day over the trailing windows).
+
+        @param results  list of result items
+        """
+        results = [r for r in results if "du_rolling" in r["data"]["annotation"]]
+        if not results:
+            return
+        full = self.loader.load_pairs([r["identifier"] for r in results])
+        self.attach_rolling_stats(
+            {"du": full[r["identifier"]]["du"], "annotation": r["data"]["annotation"]}
+            for r in results
+        )
+        return
+
+    def run_incremental(
+        self, options, cache, data_folder, storage=None, workers=1, lazy=False
+    ):
+        """
+        Same result as load_all_size_prices followed by run, only loading and
+        evaluating the pairs whose stored readings changed (or whose result
+        expired) since cache was saved, plus the time dependent stats of cached
+        results (see refresh_rolling_stats). Updates and saves cache.
+
+        @param cache  EvaluationCache
+        """
+        now = datetime.datetime.utcnow()
+        self.loader = CatalogLoader(data_folder, storage, workers, lazy)
+        fingerprints = self.loader.get_fingerprints(self.static_info.keys())
+        # fx rates are part of the config, have them fetched before keying on them
+        self.fx_rate.get_spot_fx(1, "CNY", "USD")
+        cache.reset(
+            get_config_key(
+                options,
+                self.fees.conf,
+                self.fx_rate.fx_rates,
+                self.fx_rate.history.to_list(),
+            )
+        )
+
+        dirty = {k for k in fingerprints if not cache.get(k, fingerprints[k], now)}
+        evaluated = {}
+        if dirty:
+            print(
+                "re-evaluating {} of {} (style_id, size) pairs, {} cached".format(
+                    len(dirty), len(fingerprints), len(fingerprints) - len(dirty)
+                )
+            )
+            dirty_styles = list(dict.fromkeys(style_id for style_id, _ in dirty))
+            loaded = self.loader.load(dirty_styles)
+            self.all_size_prices = {
+                style_id: {
+                    size: loaded[style_id][size]
+                    for size in loaded[style_id]
+                    if (style_id, size) in dirty
+                }
+                for style_id in loaded
+            }
+            evaluated = {item["identifier"]: item for item in self.run(options)}
+
+        for k in dirty:
+            if k in evaluated:
+                cache.put(
+                    k,
+                    fingerprints[k],
+                    self.trim_result(evaluated[k]),
+                    self.get_valid_until(evaluated[k]["data"]),
+                )
+            else:
+                cache.put(k, fingerprints[k], None)
+
+        result_array = []
+        cached = []
+        for k in fingerprints:
+            if k in evaluated:
+                result_array.append(evaluated[k])
+            elif k not in dirty and cache.entries[k]["result"]:
+                cached.append(cache.entries[k]["result"])
+        self.refresh_rolling_stats(cached)
+        result_array += cached
+        result_array.sort(
+            key=lambda x: x["data"]["annotation"][options["sort"]], reverse=True
+        )
+        cached_count = len(cache.entries)
+        cache.prune(fingerprints.keys())
+        if dirty or cached_count != len(cache.entries):
+            cache.save_cache()
+            print(
+                "total results {} after merging cached ones".format(len(result_array))
+            )
+        return result_array
+
+    def dump_profit_ratios(self, sorted_size_prices, key, outfile_name):
+        """
+        Write the best annotation[key] of each style in the result, for the
+        feeds' update scheduler to favor styles that look profitable.
+        """
+        profit_ratios = {}
+        for item in sorted_size_prices:
+            style_id = item["identifier"][0]
+            value = item["data"]["annotation"][key]
+            if style_id not in profit_ratios or profit_ratios[style_id] < value:
+                profit_ratios[style_id] = value
+        with open(outfile_name, "w") as outfile:
+            outfile.write(json.dumps(profit_ratios))
+        print("dumped {} profit ratios to {}".format(len(profit_ratios), outfile_name))
+        return
+
     def report(self, sorted_size_prices):
         self.serializer.to_str(
             sorted_size_prices, self.static_info, self.static_info_extras
         )
         return
 
+    def report_deltas(self, new, dropped, changed, key, delta_out=None):
+        """
+        Print what changed between two results, see get_deltas. Optionally
+        append the same as JSON lines to delta_out.
+        """
+        now = datetime.datetime.utcnow().isoformat() + "Z"
+        records = []
+        if new:
+            print("{} new candidates:".format(len(new)))
+            self.report(new)
+        for item in new:
+            records.append(
+                {
+                    "event": "new",
+                    "identifier": item["identifier"],
+                    key: item["data"]["annotation"][key],
+                }
+            )
+        for identifier, previous_value in dropped:
+            print(
+                "dropped {} {} ({} was {:.4f})".format(*identifier, key, previous_value)
+            )
+            records.append(
+                {"event": "dropped", "identifier": identifier, key: previous_value}
+            )
+        for item, previous_value in changed:
+            value = item["data"]["annotation"][key]
+            print(
+                "changed {} {} {} {:.4f} -> {:.4f}".format(
+                    *item["identifier"], key, previous_value, value
+                )
+            )
+            records.append(
+                {
+                    "event": "changed",
+                    "identifier": item["identifier"],
+                    key: value,
+                    "previous": previous_value,
+                }
+            )
+        if delta_out and records:
+            with open(delta_out, "a") as outfile:
+                for record in records:
+                    outfile.write(json.dumps(dict(record, time=now)) + "\n")
+        return
+
 
 def parse_args():
     parser = argparse.ArgumentParser(
@@ -263,12 +488,136 @@ def parse_args():
         "--data_folder",
         help="the data folder from where to look for price and transaction readings",
     )
+    parser.add_argument(
+        "--storage",
+        default="json",
+        help="[json|log|sqlite] how time series readings are stored",
+    )
+    parser.add_argument(
+        "--load_workers",
+        default=1,
+        type=int,
+        help="number of processes loading stored readings",
+    )
+    parser.add_argument(
+        "--lazy",
+        action="store_true",
+        help="only load latest readings from the summary manifests, full history of results is loaded after filtering",
+    )
+    parser.add_argument(
+        "--cache",
+        default="evaluation_cache.pickle",
+        help="the file keeping evaluations of pairs whose readings didn't change since the last run",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="evaluate every pair again instead of only the ones with new readings",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="keep running, re-evaluate pairs as feeds write new readings and print new, dropped and changed candidates",
+    )
+    parser.add_argument(
+        "--watch_interval",
+        default=10,
+        type=float,
+        help="in watch mode, seconds between polls of stored readings",
+    )
+    parser.add_argument(
+        "--delta_out",
+        help="in watch mode, also append changes as JSON lines to this file",
+    )
+    parser.add_argument(
+        "--fx_source",
+        default="http",
+        help="[http|file:{path}] where spot fx rates come from when the cached ones expired",
+    )
+    parser.add_argument(
+        "--fx_ttl_seconds",
+        default=21600,
+        type=float,
+        help="how long a spot fx rate cached in ../data/fx_rates.json is used",
+    )
+    parser.add_argument(
+        "--engine",
+        default="python",
+        help="[python|numpy] numpy evaluates filters and profits over arrays, same results",
+    )
+    parser.add_argument(
+        "--profit_out",
+        help="write the best profit ratio of each style in the result to this file (read by the feeds' --schedule)",
+    )
     args = parser.parse_args()
     if not args.start_from:
         raise RuntimeError("args.start_from is required in strategy")
     return args
 
 
+def get_values(sorted_size_prices, key):
+    return {
+        item["identifier"]: item["data"]["annotation"][key]
+        for item in sorted_size_prices
+    }
+
+
+def get_deltas(previous_values, sorted_size_prices, key):
+    """
+    @param previous_values  {identifier: annotation[key]} of the previous result
+    @return (new items, dropped [(identifier, previous value)],
+        changed [(item, previous value)])
+    """
+    new = []
+    changed = []
+    for item in sorted_size_prices:
+        identifier = item["identifier"]
+        if identifier not in previous_values:
+            new.append(item)
+        elif item["data"]["annotation"][key] != previous_values[identifier]:
+            changed.append((item, previous_values[identifier]))
+    current = {item["identifier"] for item in sorted_size_prices}
+    dropped = [(k, v) for k, v in previous_values.items() if k not in current]
+    return new, dropped, changed
+
+
+def watch_mode(args, strategy, cache):
+    """
+    Keep evaluations in memory and poll stored readings, re-evaluating the
+    pairs feeds wrote to and printing only what changed in the result.
+    """
+    previous_values = None
+    try:
+        while True:
+            options = parse_strategy_options("options.json")
+            result = strategy.run_incremental(
+                options,
+                cache,
+                args.data_folder,
+                args.storage,
+                args.load_workers,
+                args.lazy,
+            )
+            if previous_values is None:
+                strategy.report(result)
+                print(
+                    "watching {} results, polling every {}s".format(
+                        len(result), args.watch_interval
+                    )
+                )
+            else:
+                strategy.report_deltas(
+                    *get_deltas(previous_values, result, options["sort"]),
+                    options["sort"],
+                    args.delta_out
+                )
+            previous_values = get_values(result, options["sort"])
+            time.sleep(args.watch_interval)
+    except KeyboardInterrupt:
+        print("Caught KeyboardInterrupt. Exiting watch")
+    return
+
+
 def parse_strategy_options(options_file):
     options = {}
     with open(options_file, "r") as infile:
@@ -278,9 +627,24 @@ def parse_strategy_options(options_file):
 
 if __name__ == "__main__":
     args = parse_args()
-    fx_rate = FxRate()
-    strategy = Strategy("fees.json", fx_rate)
+    fx_rate = FxRate(get_fx_source(args.fx_source), ttl_seconds=args.fx_ttl_seconds)
+    if args.engine == "numpy":
+        from vectorized_strategy import VectorizedStrategy
+
+        strategy = VectorizedStrategy("fees.json", fx_rate)
+    else:
+        strategy = Strategy("fees.json", fx_rate)
     strategy.load_static_info(args.start_from)
-    strategy.load_all_size_prices(args.data_folder)
-    result = strategy.run(parse_strategy_options("options.json"))
+    options = parse_strategy_options("options.json")
+    cache = EvaluationCache(args.cache)
+    if args.full:
+        cache.clear()
+    if args.watch:
+        watch_mode(args, strategy, cache)
+        exit(0)
+    result = strategy.run_incremental(
+        options, cache, args.data_folder, args.storage, args.load_workers, args.lazy
+    )
     strategy.report(result)
+    if args.profit_out:
+        strategy.dump_profit_ratios(result, options["sort"], args.profit_out)
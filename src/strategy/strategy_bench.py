@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+import sys
+
+# hack for import
+sys.path.append("../feed/")
+
+import argparse
+import copy
+import time
+
+import numpy as np
+
+from fx_rate import FxRate
+from strategy import Strategy, parse_strategy_options
+from vectorized_strategy import VectorizedStrategy
+from synthetic_catalog import make_synthetic_size_prices
+
+"""
+Benchmark of Strategy.run against VectorizedStrategy.run on a synthetic catalog,
+checking both return the same ranked result and annotations.
+"""
+
+
+def time_run(strategy, options):
+    start = time.perf_counter()
+    result = strategy.run(options)
+    return result, time.perf_counter() - start
+
+
+def check_parity(expected, actual):
+    if [r["identifier"] for r in expected] != [r["identifier"] for r in actual]:
+        raise RuntimeError("ranked identifiers differ")
+    for e, a in zip(expected, actual):
+        e_annotation = dict(e["data"]["annotation"])
+        a_annotation = dict(a["data"]["annotation"])
+        # as of each run's own now, a moment apart
+        e_rolling = e_annotation.pop("du_rolling", {})
+        a_rolling = a_annotation.pop("du_rolling", {})
+        if e_rolling.keys() != a_rolling.keys() or not np.allclose(
+            list(e_rolling.values()),
+            list(a_rolling.values()),
+            rtol=1e-4,
+            equal_nan=True,
+        ):
+            raise RuntimeError(
+                "rolling stats differ for {}: {} {}".format(
+                    e["identifier"], e_rolling, a_rolling
+                )
+            )
+        if e_annotation != a_annotation:
+            raise RuntimeError(
+                "annotations differ for {}: {} {}".format(
+                    e["identifier"], e["data"]["annotation"], a["data"]["annotation"]
+                )
+            )
+    return
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        """
+        time Strategy.run and VectorizedStrategy.run on the same synthetic catalog.
+
+        example usage:
+          ./strategy_bench.py --styles 20000 --sizes 15
+    """
+    )
+    parser.add_argument("--styles", default=5000, type=int, help="number of styles")
+    parser.add_argument(
+        "--sizes", default=15, type=int, help="number of sizes per style"
+    )
+    parser.add_argument("--seed", default=0, type=int, help="random seed")
+    args = parser.parse_args()
+
+    # fixed rates, the benchmark should not depend on the network
+    fx_rate = FxRate(cache_file=None, history_file=None)
+    fx_rate.fx_rates = {("CNY", "USD"): 0.142, ("USD", "CNY"): 7.04}
+    options = parse_strategy_options("options.json")
+    all_size_prices = make_synthetic_size_prices(args.styles, args.sizes, args.seed)
+
+    strategy = Strategy("fees.json", fx_rate)
+    strategy.all_size_prices = copy.deepcopy(all_size_prices)
+    expected, python_seconds = time_run(strategy, options)
+
+    vectorized = VectorizedStrategy("fees.json", fx_rate)
+    vectorized.all_size_prices = all_size_prices
+    actual, numpy_seconds = time_run(vectorized, options)
+
+    check_parity(expected, actual)
+    print(
+        "{} pairs, {} results: python {:.3f}s numpy {:.3f}s, speedup {:.1f}x".format(
+            args.styles * args.sizes,
+            len(actual),
+            python_seconds,
+            numpy_seconds,
+            python_seconds / numpy_seconds,
+        )
+    )
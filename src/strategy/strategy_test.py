@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+import sys
+
+# hack for import
+sys.path.append("../feed/")
+
+import contextlib
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from fx_rate import FxRate
+from strategy import Strategy, get_deltas, get_values
+
+
+def make_item(style_id, size, profit):
+    return {
+        "identifier": (style_id, size),
+        "data": {"annotation": {"profit": profit}},
+    }
+
+
+class TestWatchDeltas(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+        return
+
+    def test_get_deltas(self):
+        previous = [make_item("S1", "9", 10.0), make_item("S2", "9", 5.0)]
+        previous_values = get_values(previous, "profit")
+        self.assertEqual(previous_values, {("S1", "9"): 10.0, ("S2", "9"): 5.0})
+        self.assertEqual(get_deltas(previous_values, previous, "profit"), ([], [], []))
+
+        current = [make_item("S3", "10", 20.0), make_item("S1", "9", 12.0)]
+        new, dropped, changed = get_deltas(previous_values, current, "profit")
+        self.assertEqual(new, [current[0]])
+        self.assertEqual(dropped, [(("S2", "9"), 5.0)])
+        self.assertEqual(changed, [(current[1], 10.0)])
+
+    def test_report_deltas_out(self):
+        fx_rate = FxRate(cache_file=None, history_file=None)
+        strategy = Strategy("fees.json", fx_rate)
+        delta_out = os.path.join(self.folder, "deltas.jsonl")
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            strategy.report_deltas(
+                [],
+                [(("S2", "9"), 5.0)],
+                [(make_item("S1", "9", 12.0), 10.0)],
+                "profit",
+                delta_out,
+            )
+            # nothing changed, nothing appended
+            strategy.report_deltas([], [], [], "profit", delta_out)
+        with open(delta_out, "r") as infile:
+            records = [json.loads(line) for line in infile]
+        for record in records:
+            record.pop("time")
+        self.assertEqual(
+            records,
+            [
+                {"event": "dropped", "identifier": ["S2", "9"], "profit": 5.0},
+                {
+                    "event": "changed",
+                    "identifier": ["S1", "9"],
+                    "profit": 12.0,
+                    "previous": 10.0,
+                },
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+
+import sys
+
+# hack for import
+sys.path.append("../feed/")
+
+import datetime
+
+import numpy as np
+
+from strategy import Strategy, DATA_LIFETIME_SECONDS, TRANSACTION_LIFETIME_SECONDS
+from rolling_analytics import parse_times
+from du_analyzer import ItemAnalyzer
+
+"""
+Strategy.run evaluated on NumPy arrays.
+
+The latest du / stockx readings of every (style_id, size) are loaded into flat
+arrays once (LatestReadings), then every filter of Strategy.run is a boolean
+mask and every profit ratio / value is one array expression over the compiled
+fee route (Fees.get_profit_*_array), so per option the work no longer grows
+with a Python call per pair. Results and annotations are the same as
+Strategy.run, including the order of ties.
+
+@note as everywhere else, transactions are expected to be stored latest first:
+only the first one is looked at for the recent transaction filter.
+"""
+
+
+def get_ages(timestrs, now):
+    """
+    @param timestrs  list of stored time strings, None where missing
+    @return float64 array of seconds elapsed until now, nan where missing
+    """
+    return (np.datetime64(now, "us") - parse_times(timestrs)) / np.timedelta64(1, "s")
+
+
+class LatestReadings:
+    def __init__(self, size_prices, now=None):
+        """
+        @param size_prices  {(style_id, size): {venue: {"prices": [...], "transactions": [...]}}}
+        """
+        now = now if now else datetime.datetime.utcnow()
+        self.keys = list(size_prices.keys())
+        count = len(self.keys)
+        self.has_venues = np.zeros(count, dtype=bool)
+        self.du_list_price = np.full(count, np.nan)
+        self.du_last_price = np.full(count, np.nan)
+        self.stockx_bid_price = np.full(count, np.nan)
+        self.stockx_ask_price = np.full(count, np.nan)
+        du_times = [None] * count
+        du_transaction_times = [None] * count
+        stockx_times = [None] * count
+
+        def get_price(price):
+            return np.nan if price is None else float(price)
+
+        for i, k in enumerate(self.keys):
+            v = size_prices[k]
+            if not ("du" in v and "stockx" in v):
+                continue
+            if not v["du"].get("prices") or not v["stockx"].get("prices"):
+                continue
+            self.has_venues[i] = True
+            du_latest = v["du"]["prices"][0]
+            stockx_latest = v["stockx"]["prices"][0]
+            self.du_list_price[i] = get_price(du_latest.get("list_price"))
+            du_times[i] = du_latest["time"]
+            self.stockx_bid_price[i] = get_price(stockx_latest.get("bid_price"))
+            self.stockx_ask_price[i] = get_price(stockx_latest.get("ask_price"))
+            stockx_times[i] = stockx_latest["time"]
+            transactions = v["du"].get("transactions")
+            if transactions:
+                self.du_last_price[i] = float(transactions[0]["price"])
+                du_transaction_times[i] = transactions[0]["time"]
+
+        # nan where missing, which fails every freshness comparison
+        self.du_age = get_ages(du_times, now)
+        self.du_transaction_age = get_ages(du_transaction_times, now)
+        self.stockx_age = get_ages(stockx_times, now)
+        return
+
+    def has_data(self):
+        # missing (nan) or 0 prices don't count
+        return (
+            self.has_venues
+            & (np.nan_to_num(self.du_list_price) != 0)
+            & (np.nan_to_num(self.stockx_ask_price) != 0)
+        )
+
+    def has_fresh_data(self):
+        return (self.du_age <= DATA_LIFETIME_SECONDS) & (
+            self.stockx_age <= DATA_LIFETIME_SECONDS
+        )
+
+    def has_fresh_recent_transactions(self):
+        return self.du_transaction_age < TRANSACTION_LIFETIME_SECONDS
+
+    def get_source_price(self, source):
+        if source == "mid":
+            return 0.5 * (self.stockx_bid_price + self.stockx_ask_price)
+        elif source == "ask":
+            return self.stockx_ask_price
+        elif source == "bid":
+            return self.stockx_bid_price
+        raise RuntimeError("unrecognized ratio filter option {}".format(source))
+
+    def get_dest_price(self, dest):
+        if dest == "listing":
+            return self.du_list_price / 100
+        elif dest == "last":
+            return self.du_last_price / 100
+        raise RuntimeError("unrecognized ratio filter option {}".format(dest))
+
+
+class VectorizedStrategy(Strategy):
+    def run(self, options):
+        """
+        Same as Strategy.run, evaluating filters as masks over LatestReadings.
+        """
+        size_prices = {}
+        for style_id in self.all_size_prices:
+            for size in self.all_size_prices[style_id]:
+                size_prices[(style_id, size)] = self.all_size_prices[style_id][size]
+        print("total (style_id, size) pairs {}".format(len(size_prices)))
+
+        readings = LatestReadings(size_prices)
+        mask = readings.has_data()
+        print(
+            "total (style_id, size) pairs {} with data".format(np.count_nonzero(mask))
+        )
+        mask &= readings.has_fresh_data()
+        print(
+            "total (style_id, size) pairs {} with fresh data".format(
+                np.count_nonzero(mask)
+            )
+        )
+        mask &= readings.has_fresh_recent_transactions()
+        print(
+            "total (style_id, size) pairs {} with fresh transactions".format(
+                np.count_nonzero(mask)
+            )
+        )
+
+        annotations = {}
+        with np.errstate(invalid="ignore"):
+            for source in ["bid", "mid", "ask"]:
+                for dest in ["listing", "last"]:
+                    for ratio_or_value in ["ratio", "value"]:
+                        option_name = "cutoff_net_profit_{}_{}_to_{}".format(
+                            ratio_or_value, source, dest
+                        )
+                        if option_name not in options:
+                            continue
+                        stockx_px = readings.get_source_price(source)
+                        du_bid = readings.get_dest_price(dest)
+                        if ratio_or_value == "ratio":
+                            profit_value = self.fees.get_profit_percent_array(
+                                "stockx", "du", stockx_px, du_bid, "CNY"
+                            )
+                        else:
+                            profit_value = self.fees.get_profit_value_array(
+                                "stockx", "du", stockx_px, du_bid, "CNY"
+                            )
+                        mask &= profit_value > options[option_name]
+                        annotations[
+                            "profit_{}_{}_to_{}".format(ratio_or_value, source, dest)
+                        ] = profit_value
+                        print(
+                            "total (style_id, size) pairs {} satisfying profit cutoff {} ({} to {}) of {}".format(
+                                np.count_nonzero(mask),
+                                ratio_or_value,
+                                source,
+                                dest,
+                                options[option_name],
+                            )
+                        )
+
+        selected = np.flatnonzero(mask)
+        if len(selected) and options["sort"] not in annotations:
+            raise KeyError(options["sort"])
+        if len(selected):
+            # stable descending order, ties keep their input order as in list.sort
+            sort_key = annotations[options["sort"]][selected]
+            selected = selected[np.argsort(-sort_key, kind="stable")]
+
+        if options["generate_du_historical_stats"] and self.loader:
+            self.loader.materialize(
+                {readings.keys[i]: size_prices[readings.keys[i]] for i in selected}
+            )
+
+        result_array = []
+        for i in selected:
+            k = readings.keys[i]
+            v = size_prices[k]
+            v["annotation"] = {
+                name: float(values[i]) for name, values in annotations.items()
+            }
+            if options["generate_du_historical_stats"]:
+                transactions = ItemAnalyzer.to_ordered_sale_record(
+                    v["du"]["transactions"]
+                )
+                v["annotation"][
+                    "du_analyzer"
+                ] = self.analyzer.get_historical_transactions_stats(
+                    transactions, fx_rate=self.fx_rate
+                )
+            result_array.append({"data": v, "identifier": k})
+        if options["generate_du_historical_stats"]:
+            self.attach_rolling_stats([r["data"] for r in result_array])
+        print("total results {}".format(len(result_array)))
+        return result_array